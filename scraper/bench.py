@@ -0,0 +1,275 @@
+from __future__ import annotations
+
+from typing import Dict, Any, Callable, List, Optional, Tuple
+from pathlib import Path
+import argparse
+import json
+import random
+import re
+import time
+import tracemalloc
+
+from scraper.fetch import FetchResult, FetchStats
+from scraper import parsing
+from scraper.parsing import FIXTURES_DIR, available_backends, make_soup, page_extractors
+
+EXPECTED_DIR = Path(__file__).parent / "fixtures" / "expected"
+
+
+class FixtureFetcher:
+    """Stands in for fetch.Fetcher: every URL returns the same saved page."""
+
+    workers = 1
+
+    def __init__(self, path: Path):
+        self.content = path.read_bytes()
+
+    def get(self, url: str, stats: Optional[FetchStats] = None, **kwargs: Any) -> FetchResult:
+        result = FetchResult(url=url, status_code=200, content=self.content, encoding="utf-8")
+        if stats is not None:
+            stats.record(result)
+        return result
+
+
+def page_functions() -> Dict[str, Dict[str, Callable[[str, FixtureFetcher], Any]]]:
+    """Each stage's per-page function (fetch + parse + extract), by page kind."""
+    from scraper.stages import crew_details, crew_pages, crews, external, pirate_pages, pirate_urls, pirates, shoppes
+    from scraper.targets import DEFAULT_FLAG_ID, DEFAULT_OCEAN, FlagTarget
+
+    # the saved flag page is the default flag; its crews are tagged with it
+    flag = FlagTarget(DEFAULT_OCEAN, DEFAULT_FLAG_ID)
+
+    def shop_rows(url: str, fetcher: FixtureFetcher) -> Any:
+        soup = make_soup(fetcher.get(url).text, regions=shoppes.REGIONS)
+        name_el = soup.find("font", attrs={"size": "+1"})
+        return shoppes.extract_shop_rows(soup, name_el.get_text(strip=True) if name_el else "", "", url)
+
+    def combined_pirate(url: str, fetcher: FixtureFetcher) -> Any:
+        row, shops, error = pirate_pages._scrape_one(url, fetcher)
+        return row, shops, repr(error)
+
+    def combined_crew(url: str, fetcher: FixtureFetcher) -> Any:
+        details, details_error, roster, roster_error = crew_pages._scrape_one(url, fetcher)
+        return details, repr(details_error), roster, repr(roster_error)
+
+    return {
+        "pirate": {
+            "pirates._scrape_one": lambda url, f: pirates._scrape_one(url, f),
+            "shoppes.extract_shop_rows": shop_rows,
+            "external._scrape_one_pirate": lambda url, f: external._scrape_one_pirate(url, f),
+            "pirate_pages._scrape_one": combined_pirate,
+        },
+        "crew": {
+            "crew_details._scrape_one": lambda url, f: crew_details._scrape_one(url, f),
+            "pirate_urls._scrape_one_crew": lambda url, f: pirate_urls._scrape_one_crew(url, f),
+            "crew_pages._scrape_one": combined_crew,
+        },
+        "flag": {
+            "crews._scrape_flag": lambda url, f: crews._scrape_flag(flag, f),
+        },
+    }
+
+
+def _plain(value: Any) -> Any:
+    """JSON round-trip, so tuples and lists compare equal to the stored rows."""
+    return json.loads(json.dumps(value, sort_keys=True))
+
+
+def _time_us(fn: Callable[[], Any], iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def _peak_kib(fn: Callable[[], Any]) -> float:
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 1024
+
+
+def run_benchmarks(
+    pages_dir: Path = FIXTURES_DIR,
+    iterations: int = 50,
+    partial: bool = False,
+) -> Tuple[List[Dict[str, Any]], Dict[str, Dict[str, Any]]]:
+    """
+    Time every extractor and per-page function over every fixture page.
+    Returns (timing rows, outputs keyed by fixture then function name).
+    """
+    extractors = page_extractors()
+    functions = page_functions()
+    timings: List[Dict[str, Any]] = []
+    outputs: Dict[str, Dict[str, Any]] = {}
+
+    for path in sorted(Path(pages_dir).glob("*.html")):
+        kind = path.name.split("_", 1)[0]
+        if kind not in extractors:
+            continue
+        html = path.read_text(encoding="utf-8")
+        url = f"file://{path.name}"
+        fetcher = FixtureFetcher(path)
+        page_out: Dict[str, Any] = {}
+
+        parse_us = _time_us(lambda: make_soup(html, partial=False), iterations)
+        timings.append({"page": path.name, "target": "parse (full)", "us": parse_us,
+                        "pages_per_sec": 1e6 / parse_us, "peak_kib": _peak_kib(lambda: make_soup(html, partial=False))})
+
+        for name, (fn, regions) in extractors[kind].items():
+            soup = make_soup(html, regions=regions, partial=partial)
+            page_out[name] = _plain(fn(soup, url))
+            us = _time_us(lambda: fn(soup, url), iterations)
+            timings.append({"page": path.name, "target": name, "us": us,
+                            "pages_per_sec": 1e6 / us, "peak_kib": _peak_kib(lambda: fn(soup, url))})
+
+        for name, fn in functions[kind].items():
+            page_out[name] = _plain(fn(url, fetcher))
+            us = _time_us(lambda: fn(url, fetcher), iterations)
+            timings.append({"page": path.name, "target": name, "us": us,
+                            "pages_per_sec": 1e6 / us, "peak_kib": _peak_kib(lambda: fn(url, fetcher))})
+
+        outputs[path.name] = page_out
+
+    return timings, outputs
+
+
+SHOP_STRESS_COUNTS = (10, 50, 200, 1000)
+
+
+def _regex_split_shop_chunks(text: str) -> List[str]:
+    """The previous (quadratic) shoppes._split_shop_chunks, kept as the reference output."""
+    from scraper.stages.shoppes import NAME_LOC_RE, _clean
+
+    txt = re.sub(r"^(Owns:|Manages:)\s*", "", _clean(text), flags=re.I)
+    if not txt:
+        return []
+    chunks: List[str] = []
+    start = 0
+    for m in re.finditer(r",\s*(?=.+?\s+on\s+)", txt, flags=re.I):
+        candidate = txt[start:m.start()].strip()
+        remainder = txt[m.end():].strip()
+        if NAME_LOC_RE.search(candidate) and NAME_LOC_RE.search(remainder):
+            chunks.append(candidate)
+            start = m.end()
+    if txt[start:].strip():
+        chunks.append(txt[start:].strip())
+    return chunks
+
+
+def synthetic_shop_text(shops: int, seed: int = 0) -> str:
+    """An "Owns:" line for a merchant with `shops` shops, including names with commas and "on"."""
+    rnd = random.Random(seed)
+    names = ["Bits, Bobs and Baubles", "Hang On Tailoring", "The Salty Dog", "Rum, Rope, Etc.",
+             "Carry On Distillery", "Iron and Ore", "Fort Fancy", "Stitch in Time"]
+    islands = ["Jade Island", "Admiral Island", "Turtle Island", "Isle of Kraken", "Lima Island", "On-Ice Isle"]
+    return "Owns: " + ", ".join(f"{rnd.choice(names)} {i} on {rnd.choice(islands)}" for i in range(shops))
+
+
+def run_shop_split_stress(
+    counts: Tuple[int, ...] = SHOP_STRESS_COUNTS,
+    iterations: int = 5,
+) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    Time shoppes._split_shop_chunks against the regex splitter it
+    replaced on synthetic merchants owning `counts` shops each.
+    Returns (timing rows, mismatches).
+    """
+    from scraper.stages.shoppes import _split_shop_chunks
+
+    timings: List[Dict[str, Any]] = []
+    problems: List[str] = []
+    for shops in counts:
+        text = synthetic_shop_text(shops, seed=shops)
+        got, expected = _split_shop_chunks(text), _regex_split_shop_chunks(text)
+        if got != expected:
+            problems.append(f"{shops} shops: split differs from the regex splitter")
+        if len(got) != shops:
+            problems.append(f"{shops} shops: split into {len(got)} chunks")
+        timings.append({
+            "shops": shops,
+            "chars": len(text),
+            "regex_us": _time_us(lambda: _regex_split_shop_chunks(text), iterations),
+            "linear_us": _time_us(lambda: _split_shop_chunks(text), iterations),
+        })
+    return timings, problems
+
+
+def compare_expected(outputs: Dict[str, Dict[str, Any]], expected_dir: Path = EXPECTED_DIR) -> List[str]:
+    problems: List[str] = []
+    for page, page_out in outputs.items():
+        path = expected_dir / (Path(page).stem + ".json")
+        if not path.exists():
+            problems.append(f"{page}: no expected output at {path} (run with --update-expected)")
+            continue
+        expected = json.loads(path.read_text(encoding="utf-8"))
+        for name, got in page_out.items():
+            if name not in expected:
+                problems.append(f"{page} {name}: missing from {path.name}")
+            elif got != expected[name]:
+                problems.append(f"{page} {name}: output changed")
+    return problems
+
+
+def write_expected(outputs: Dict[str, Dict[str, Any]], expected_dir: Path = EXPECTED_DIR) -> None:
+    expected_dir.mkdir(parents=True, exist_ok=True)
+    for page, page_out in outputs.items():
+        path = expected_dir / (Path(page).stem + ".json")
+        path.write_text(json.dumps(page_out, indent=2, sort_keys=True, ensure_ascii=False) + "\n", encoding="utf-8")
+        print(f"Wrote {path}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline extractor benchmarks over recorded yoweb pages.")
+    parser.add_argument("pages_dir", nargs="?", default=str(FIXTURES_DIR))
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--parser", choices=available_backends(), default="html.parser")
+    parser.add_argument("--partial-parse", action="store_true",
+                        help="parse only the regions each extractor declares")
+    parser.add_argument("--update-expected", action="store_true",
+                        help="record current outputs as the expected rows")
+    parser.add_argument("--shop-stress", action="store_true",
+                        help="only benchmark the shop-chunk splitter on synthetic merchants")
+    args = parser.parse_args(argv)
+
+    if args.shop_stress:
+        timings, problems = run_shop_split_stress(iterations=args.iterations)
+        print(f"{'shops':>8} {'chars':>10} {'regex µs':>12} {'linear µs':>12} {'speedup':>9}")
+        for t in timings:
+            print(f"{t['shops']:>8} {t['chars']:>10} {t['regex_us']:>12.1f} {t['linear_us']:>12.1f} "
+                  f"{t['regex_us'] / t['linear_us']:>8.1f}x")
+        for line in problems:
+            print(f"❌ {line}")
+        if problems:
+            return 1
+        print("✅ Splits match the regex splitter.")
+        return 0
+
+    parsing.set_backend(args.parser)
+    parsing.set_partial_parse(args.partial_parse)
+
+    timings, outputs = run_benchmarks(Path(args.pages_dir), args.iterations, args.partial_parse)
+
+    mode = f"{args.parser}{', partial' if args.partial_parse else ''}"
+    print(f"{'page':<32} {'target':<36} {'µs/page':>10} {'pages/s':>10} {'peak KiB':>10}   [{mode}]")
+    for t in timings:
+        print(f"{t['page']:<32} {t['target']:<36} {t['us']:>10.1f} {t['pages_per_sec']:>10.1f} {t['peak_kib']:>10.1f}")
+
+    if args.update_expected:
+        write_expected(outputs)
+        return 0
+
+    problems = compare_expected(outputs)
+    for line in problems:
+        print(f"❌ {line}")
+    if problems:
+        return 1
+    print("✅ All outputs match the expected rows.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,188 @@
+from __future__ import annotations
+
+from typing import Dict, Any, Optional
+from dataclasses import dataclass
+from pathlib import Path
+import os
+import sqlite3
+import threading
+import time
+import urllib.parse
+import zlib
+
+from scraper import entities
+
+
+CACHE_DIRNAME = ".http_cache"
+MAX_CACHE_BYTES = int(float(os.getenv("HTTP_CACHE_MAX_MB", "200")) * 1024 * 1024)
+
+# Seconds a stored page is served without asking the server again.
+# Past the TTL we still send a conditional request, so a stale entry
+# costs a 304 instead of a full download when the server supports it.
+TTL_SECONDS = {
+    "flag": int(os.getenv("HTTP_CACHE_TTL_FLAG", "0")),
+    "crew": int(os.getenv("HTTP_CACHE_TTL_CREW", "3600")),
+    "pirate": int(os.getenv("HTTP_CACHE_TTL_PIRATE", "3600")),
+    "other": int(os.getenv("HTTP_CACHE_TTL_OTHER", "3600")),
+}
+
+
+def canonical_url(url: str) -> str:
+    """
+    Cache key: lowercased scheme/host, sorted query params, no fragment;
+    crew / pirate / flag pages by their entities.canonical_url first.
+    """
+    parsed = urllib.parse.urlsplit(entities.canonical_url(url))
+    query = urllib.parse.urlencode(sorted(urllib.parse.parse_qsl(parsed.query, keep_blank_values=True)))
+    return urllib.parse.urlunsplit(
+        (parsed.scheme.lower(), parsed.netloc.lower(), parsed.path, query, "")
+    )
+
+
+def url_class(url: str) -> str:
+    path = urllib.parse.urlsplit(url).path
+    if "/yoweb/flag/" in path:
+        return "flag"
+    if "/yoweb/crew/" in path:
+        return "crew"
+    if "/yoweb/pirate.wm" in path:
+        return "pirate"
+    return "other"
+
+
+@dataclass
+class CacheEntry:
+    url: str
+    content: bytes
+    encoding: str
+    etag: str
+    last_modified: str
+    stored_at: float
+
+    def is_fresh(self, now: Optional[float] = None) -> bool:
+        ttl = TTL_SECONDS.get(url_class(self.url), TTL_SECONDS["other"])
+        return ((now or time.time()) - self.stored_at) < ttl
+
+    def conditional_headers(self) -> Dict[str, str]:
+        headers: Dict[str, str] = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    """
+    Disk-backed response cache: one SQLite file holding zlib-compressed
+    bodies and their validators, evicted least-recently-used once the
+    stored bodies exceed max_bytes.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int = MAX_CACHE_BYTES):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.directory / "responses.sqlite"), check_same_thread=False)
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                encoding TEXT NOT NULL,
+                etag TEXT NOT NULL,
+                last_modified TEXT NOT NULL,
+                stored_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+        self._db.commit()
+
+    def get(self, url: str) -> Optional[CacheEntry]:
+        key = canonical_url(url)
+        with self._lock:
+            rec = self._db.execute(
+                "SELECT body, encoding, etag, last_modified, stored_at FROM responses WHERE url = ?",
+                (key,),
+            ).fetchone()
+            if rec is None:
+                return None
+            self._db.execute("UPDATE responses SET accessed_at = ? WHERE url = ?", (time.time(), key))
+            self._db.commit()
+
+        body, encoding, etag, last_modified, stored_at = rec
+        return CacheEntry(
+            url=key,
+            content=zlib.decompress(body),
+            encoding=encoding,
+            etag=etag,
+            last_modified=last_modified,
+            stored_at=stored_at,
+        )
+
+    def put(self, url: str, content: bytes, encoding: str, headers: Dict[str, str]) -> None:
+        key = canonical_url(url)
+        body = zlib.compress(content, 6)
+        validators = {k.lower(): v for k, v in (headers or {}).items()}
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    body,
+                    len(body),
+                    encoding or "",
+                    validators.get("etag", "") or "",
+                    validators.get("last-modified", "") or "",
+                    now,
+                    now,
+                ),
+            )
+            self._evict()
+            self._db.commit()
+
+    def touch(self, url: str) -> None:
+        """Mark an entry as revalidated (fresh again) after a 304."""
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "UPDATE responses SET stored_at = ?, accessed_at = ? WHERE url = ?",
+                (now, now, canonical_url(url)),
+            )
+            self._db.commit()
+
+    def _evict(self) -> None:
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._db.execute(
+            "SELECT url, size FROM responses ORDER BY accessed_at ASC"
+        ).fetchall():
+            self._db.execute("DELETE FROM responses WHERE url = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            count, size = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        return {"entries": int(count), "bytes": int(size)}
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+def open_cache(output_dir: Path) -> Optional[ResponseCache]:
+    """Cache under the output dir, unless disabled with HTTP_CACHE=0."""
+    if os.getenv("HTTP_CACHE", "1") == "0":
+        return None
+    directory = Path(os.getenv("HTTP_CACHE_DIR", str(Path(output_dir) / CACHE_DIRNAME)))
+    return ResponseCache(directory)
@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Set, Tuple, Union
+from collections import Counter
+
+import pandas as pd
+
+from scraper.sinks import Spool, SpooledFrame, iter_chunks
+
+if TYPE_CHECKING:
+    from scraper.incremental import Previous
+
+
+CHANGE_COLUMN = "Change"
+CHANGED_COLUMNS_COLUMN = "Changed Columns"
+
+# Output file -> (previous-run dataset, key columns identifying a row)
+CHANGE_LOGS: Dict[str, Tuple[str, List[str]]] = {
+    "crews_changes.csv": ("crews", ["Crew URL"]),
+    "pirates_changes.csv": ("pirates", ["Pirate URL"]),
+    "shoppes_changes.csv": ("shoppes", ["Shop Key", "Pirate Name"]),
+}
+
+
+def _keyed(df: pd.DataFrame, keys: List[str], columns: List[str]) -> pd.DataFrame:
+    df = df.reindex(columns=keys + columns).fillna("").astype(str)
+    return df.drop_duplicates(subset=keys).set_index(keys)
+
+
+def diff_frames(
+    old: pd.DataFrame,
+    new: pd.DataFrame,
+    keys: List[str],
+    ignore_removed: Optional[Iterable[str]] = None,
+) -> pd.DataFrame:
+    """
+    Rows added, removed or changed between two snapshots of a dataset,
+    matched on `keys`. Changed rows list the columns that differ. Added
+    and changed rows carry their new values, removed rows their old ones.
+
+    `ignore_removed` holds values of the first key not to report as
+    removed (e.g. pirates whose page failed this run).
+    """
+    columns = [c for c in new.columns if c not in keys]
+    columns += [c for c in old.columns if c not in keys and c not in columns]
+    out_columns = [CHANGE_COLUMN] + keys + [CHANGED_COLUMNS_COLUMN] + columns
+
+    old_k = _keyed(old, keys, columns)
+    new_k = _keyed(new, keys, columns)
+
+    removed_idx = old_k.index.difference(new_k.index)
+    if ignore_removed is not None and len(removed_idx):
+        first = removed_idx.get_level_values(0) if isinstance(removed_idx, pd.MultiIndex) else removed_idx
+        removed_idx = removed_idx[~first.isin(set(ignore_removed))]
+    added = new_k.loc[new_k.index.difference(old_k.index)].assign(**{CHANGE_COLUMN: "added"})
+    removed = old_k.loc[removed_idx].assign(**{CHANGE_COLUMN: "removed"})
+
+    common = new_k.index.intersection(old_k.index)
+    after, before = new_k.loc[common], old_k.loc[common]
+    differs = after.ne(before)
+    mask = differs.any(axis=1)
+    changed = after.loc[mask].assign(**{CHANGE_COLUMN: "changed"})
+    if columns and mask.any():
+        # bool matrix . column names -> "A; B; " per row
+        names = differs.loc[mask].dot(pd.Index(columns) + "; ").str.rstrip("; ")
+        changed[CHANGED_COLUMNS_COLUMN] = names
+
+    frames = [f for f in (added, removed, changed) if not f.empty]
+    if not frames:
+        return pd.DataFrame(columns=out_columns)
+    out = pd.concat(frames).sort_index(kind="mergesort").reset_index().reindex(columns=out_columns)
+    out[CHANGED_COLUMNS_COLUMN] = out[CHANGED_COLUMNS_COLUMN].fillna("")
+    return out
+
+
+def _key_tuples(df: pd.DataFrame, keys: List[str]) -> List[Tuple[str, ...]]:
+    return list(df.reindex(columns=keys).fillna("").astype(str).itertuples(index=False, name=None))
+
+
+def diff_previous(
+    previous: "Previous",
+    dataset: str,
+    new: Union[pd.DataFrame, SpooledFrame],
+    keys: List[str],
+    spool: Spool,
+    ignore_removed: Optional[Iterable[str]] = None,
+) -> SpooledFrame:
+    """
+    diff_frames between a dataset of the last run (in the previous run's
+    snapshot) and this run's, a chunk at a time: each chunk of `new` is
+    compared with the old rows looked up by its keys, then the old rows
+    are read through once for the ones that are gone. The rows go to
+    the spool as <dataset>_changes, in no particular order (the change
+    logs are written in key order, see outputs.SORT_KEYS).
+    """
+    old = previous.frame(dataset)
+    columns = [c for c in new.columns if c not in keys]
+    columns += [c for c in old.columns if c not in keys and c not in columns]
+    sink = spool.sink(f"{dataset}_changes", [CHANGE_COLUMN] + keys + [CHANGED_COLUMNS_COLUMN] + columns)
+
+    # keys seen in this run, first row of each kept (like diff_frames)
+    seen: Set[Tuple[str, ...]] = set()
+    for chunk in iter_chunks(new):
+        first = []
+        for key in _key_tuples(chunk, keys):
+            first.append(key not in seen)
+            seen.add(key)
+        chunk = chunk.loc[first]
+        if chunk.empty:
+            continue
+        ours = set(_key_tuples(chunk, keys))
+        before = previous.lookup(dataset, keys[0], chunk[keys[0]].fillna("").astype(str).unique())
+        before = before.loc[[key in ours for key in _key_tuples(before, keys)]] if len(before) else before
+        sink.write_frame(diff_frames(before, chunk, keys))
+
+    ignored = set(ignore_removed or ())
+    removed: Set[Tuple[str, ...]] = set()
+    for chunk in old.chunks():
+        gone = []
+        for key in _key_tuples(chunk, keys):
+            gone.append(key not in seen and key not in removed and key[0] not in ignored)
+            if gone[-1]:
+                removed.add(key)
+        rows = chunk.loc[gone].reindex(columns=keys + columns).fillna("").astype(str)
+        sink.write_frame(rows.assign(**{CHANGE_COLUMN: "removed", CHANGED_COLUMNS_COLUMN: ""}))
+    return sink.frame()
+
+
+def summary(changes: Dict[str, Union[pd.DataFrame, SpooledFrame]]) -> str:
+    parts = []
+    for filename, df in changes.items():
+        counts: Counter = Counter()
+        for chunk in iter_chunks(df):
+            counts.update(chunk[CHANGE_COLUMN])
+        parts.append(
+            f"{filename.replace('_changes.csv', '')} "
+            f"+{counts.get('added', 0)} -{counts.get('removed', 0)} ~{counts.get('changed', 0)}"
+        )
+    return "Changes since last run: " + ", ".join(parts)
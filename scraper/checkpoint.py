@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+from typing import Dict, Any, Callable, Optional
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+
+CHECKPOINT_DIRNAME = ".checkpoint"
+
+# An unfinished run is resumed by the next one however long ago it
+# stopped; only its entries older than this (a run that has kept failing
+# for days) are fetched again. Longer than the daily schedule, so a run
+# that hits the job timeout resumes at the next scheduled run.
+MAX_AGE_HOURS = float(os.getenv("CHECKPOINT_MAX_AGE_HOURS", "48"))
+
+
+class Journal:
+    """
+    Per-URL results of the current crawl, appended as each page succeeds,
+    so a run that dies partway can be restarted without re-fetching them.
+    Entries are keyed by page kind ("crew", "pirate", "external") rather
+    than stage, so the batch and --stream stages share them.
+
+    Opening the journal marks a run as unfinished; clear() removes the
+    mark once the run completes. The next run resumes an unfinished
+    run's entries, or starts from an empty journal if there is none.
+    """
+
+    def __init__(self, directory: Path, max_age_hours: float = MAX_AGE_HOURS):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_age_seconds = max_age_hours * 3600
+        self._lock = threading.Lock()
+        self._resumed: Counter = Counter()
+        self._recorded: Counter = Counter()
+        self._db = sqlite3.connect(str(self.directory / "journal.sqlite"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS results (
+                kind TEXT NOT NULL,
+                url TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                done_at REAL NOT NULL,
+                PRIMARY KEY (kind, url)
+            )
+            """
+        )
+        self._db.execute("CREATE TABLE IF NOT EXISTS runs (run_id TEXT PRIMARY KEY, started_at TEXT NOT NULL)")
+        rec = self._db.execute("SELECT run_id, started_at FROM runs").fetchone()
+        self.resuming = rec is not None
+        if rec is None:
+            # the last run finished (or there wasn't one): nothing to resume
+            rec = (uuid.uuid4().hex[:12], datetime.now(timezone.utc).replace(microsecond=0).isoformat())
+            self._db.execute("DELETE FROM results")
+            self._db.execute("INSERT INTO runs VALUES (?, ?)", rec)
+        self.run_id, self.started_at = rec
+        self._db.execute("DELETE FROM results WHERE done_at < ?", (time.time() - self.max_age_seconds,))
+        self._db.commit()
+
+    def get(self, kind: str, url: str) -> Optional[Any]:
+        with self._lock:
+            rec = self._db.execute(
+                "SELECT payload FROM results WHERE kind = ? AND url = ? AND done_at >= ?",
+                (kind, url, time.time() - self.max_age_seconds),
+            ).fetchone()
+            if rec is None:
+                return None
+            self._resumed[kind] += 1
+        value = json.loads(rec[0])
+        return tuple(value) if isinstance(value, list) else value
+
+    def record(self, kind: str, url: str, result: Any) -> None:
+        payload = json.dumps(result, default=str)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                (kind, url, payload, time.time()),
+            )
+            self._db.commit()
+            self._recorded[kind] += 1
+
+    def pending(self) -> Dict[str, int]:
+        """Entries currently in the journal, by kind."""
+        with self._lock:
+            return dict(self._db.execute("SELECT kind, COUNT(*) FROM results GROUP BY kind").fetchall())
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "run_id": self.run_id,
+                "started_at": self.started_at,
+                "resumed": dict(self._resumed),
+                "recorded": dict(self._recorded),
+            }
+
+    def clear(self) -> None:
+        """The run finished: drop its entries and its unfinished mark."""
+        with self._lock:
+            self._db.execute("DELETE FROM results")
+            self._db.execute("DELETE FROM runs")
+            self._db.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+def resumable(
+    journal: Optional[Journal],
+    kind: str,
+    fn: Callable[[str], Any],
+    succeeded: Callable[[Any], bool] = lambda result: True,
+) -> Callable[[str], Any]:
+    """
+    Wrap a per-URL scrape function: URLs already in the journal return
+    their recorded result; fresh results that `succeeded` are recorded.
+    Results must be JSON-serializable (tuples come back as tuples).
+    """
+    if journal is None:
+        return fn
+
+    def call(url: str) -> Any:
+        done = journal.get(kind, url)
+        if done is not None:
+            return done
+        result = fn(url)
+        if succeeded(result):
+            journal.record(kind, url, result)
+        return result
+
+    return call
+
+
+def open_journal(output_dir: Path) -> Optional[Journal]:
+    """Journal under the output dir, unless disabled with CHECKPOINT=0."""
+    if os.getenv("CHECKPOINT", "1") == "0":
+        return None
+    directory = Path(os.getenv("CHECKPOINT_DIR", str(Path(output_dir) / CHECKPOINT_DIRNAME)))
+    return Journal(directory)
@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+from typing import Callable, Dict, Any, Iterable, List, Optional, Set, Tuple
+from concurrent.futures import Future
+from dataclasses import dataclass
+import functools
+import os
+import threading
+import urllib.parse
+
+import pandas as pd
+
+from scraper.targets import ocean_base
+
+
+# Columns holding crew / pirate URLs in the datasets
+URL_COLUMNS = ["Crew URL", "Pirate URL", "Source URL"]
+
+SITE_DOMAIN = ".puzzlepirates.com"
+BASE_ENV_PREFIX = "YOWEB_BASE_"
+
+
+@dataclass(frozen=True)
+class EntityKey:
+    """
+    A crew, pirate or flag, however its URL was spelled: ocean plus
+    crewid / flagid / pirate name (lowercased, names are unique
+    case-insensitively).
+    """
+
+    kind: str
+    ocean: str
+    id: str
+
+    def __str__(self) -> str:
+        return f"{self.kind}:{self.ocean}:{self.id}"
+
+
+def _root(scheme: str, netloc: str, prefix: str) -> str:
+    return f"{scheme}://{netloc.lower()}{prefix.rstrip('/')}"
+
+
+@functools.lru_cache(maxsize=256)
+def _ocean(root: str) -> Optional[str]:
+    """
+    The ocean a site root serves, by the targets.ocean_base mapping:
+    <ocean>.puzzlepirates.com, or the one ocean whose YOWEB_BASE_<OCEAN>
+    is this root. None if the root can't say (YOWEB_BASE serving every
+    ocean from one stub, an unknown host). Read once per root.
+    """
+    host = urllib.parse.urlsplit(root).netloc
+    if host.endswith(SITE_DOMAIN):
+        return host[: -len(SITE_DOMAIN)]
+    oceans = set()
+    for name in os.environ:
+        if name.startswith(BASE_ENV_PREFIX):
+            ocean = name[len(BASE_ENV_PREFIX):].lower()
+            base = urllib.parse.urlsplit(ocean_base(ocean))
+            if _root(base.scheme, base.netloc, base.path) == root:
+                oceans.add(ocean)
+    return oceans.pop() if len(oceans) == 1 else None
+
+
+def _parse(url: str, ocean: Optional[str] = None) -> Optional[Tuple[Optional[EntityKey], str]]:
+    """
+    (key, canonical URL) of a crew / pirate / flag page URL, else None.
+    `ocean` is used when the URL's root doesn't name one; with neither,
+    the key is None (two oceans' crew 1 mustn't become one entity).
+    """
+    parsed = urllib.parse.urlsplit((url or "").strip())
+    if parsed.scheme not in ("http", "https") or not parsed.netloc:
+        return None
+    query = urllib.parse.parse_qs(parsed.query)
+    path = parsed.path
+    # keep a base's path prefix (YOWEB_BASE_<OCEAN>=http://proxy/meridian)
+    root = _root(parsed.scheme, parsed.netloc, path[: path.rfind("/yoweb/")] if "/yoweb/" in path else "")
+    ocean = _ocean(root) or (ocean or "").strip().lower() or None
+
+    def key(kind: str, id: str) -> Optional[EntityKey]:
+        return EntityKey(kind, ocean, id) if ocean else None
+
+    if path.endswith("/yoweb/pirate.wm"):
+        name = query.get("target", [""])[0].strip()
+        if name:
+            url = f"{root}/yoweb/pirate.wm?classic=false&target={urllib.parse.quote(name)}"
+            return key("pirate", name.lower()), url
+    elif path.endswith("/yoweb/crew/info.wm"):
+        crewid = query.get("crewid", [""])[0].strip()
+        if crewid.isdigit():
+            return key("crew", crewid), f"{root}/yoweb/crew/info.wm?crewid={crewid}&classic=false"
+    elif path.endswith("/yoweb/flag/info.wm"):
+        flagid = query.get("flagid", [""])[0].strip()
+        if flagid.isdigit():
+            return key("flag", flagid), f"{root}/yoweb/flag/info.wm?flagid={flagid}"
+    return None
+
+
+def entity_key(url: str, ocean: Optional[str] = None) -> Optional[EntityKey]:
+    """The entity a URL names; `ocean` is assumed if the URL's root doesn't tell (see _ocean)."""
+    parsed = _parse(url, ocean)
+    return parsed[0] if parsed else None
+
+
+def canonical_url(url: str) -> str:
+    """
+    The one spelling of a crew / pirate / flag URL: lowercased host,
+    fixed query (crewid=N&classic=false, classic=false&target=Name,
+    flagid=N), no fragment. Any other URL is returned stripped.
+    """
+    parsed = _parse(url)
+    return parsed[1] if parsed else (url or "").strip()
+
+
+def dedupe_urls(urls: Iterable[str], ocean: Optional[str] = None) -> List[str]:
+    """Canonical URLs, blanks dropped, one per entity (first spelling wins)."""
+    out: List[str] = []
+    seen: Set[Any] = set()
+    for url in urls:
+        parsed = _parse(str(url), ocean)
+        url = parsed[1] if parsed else str(url).strip()
+        if not url:
+            continue
+        key = (parsed[0] if parsed else None) or url
+        if key not in seen:
+            seen.add(key)
+            out.append(url)
+    return out
+
+
+def canonicalize_columns(df: pd.DataFrame, columns: Iterable[str] = URL_COLUMNS) -> pd.DataFrame:
+    """A copy of `df` with its URL columns canonical (e.g. outputs written before canonical URLs)."""
+    present = [c for c in columns if c in df.columns]
+    if not present:
+        return df
+    df = df.copy()
+    for c in present:
+        values = df[c].fillna("").astype(str)
+        mapping = {u: canonical_url(u) for u in values.unique()}
+        df[c] = values.map(mapping)
+    return df
+
+
+class EntityIndex:
+    """
+    The run's known crews, pirates and flags, and the pages fetched for
+    them (see Fetcher.get). Concurrent fetches of one entity share a
+    single request. Pages of retained entities (referenced by more than
+    one stage, e.g. watched pirates who are also in the flag) are kept
+    for the rest of the run, so each is fetched at most once.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._known: Dict[EntityKey, str] = {}
+        self._retained: Set[EntityKey] = set()
+        self._pages: Dict[EntityKey, Future] = {}
+        self.shared = 0
+
+    def add(self, url: str, ocean: Optional[str] = None) -> Optional[EntityKey]:
+        parsed = _parse(url, ocean)
+        if parsed is None or parsed[0] is None:
+            return None
+        key, canonical = parsed
+        with self._lock:
+            self._known.setdefault(key, canonical)
+        return key
+
+    def retain(self, urls: Iterable[str], ocean: Optional[str] = None) -> None:
+        keys = [k for k in (self.add(u, ocean) for u in urls) if k is not None]
+        with self._lock:
+            self._retained.update(keys)
+
+    def fetch(self, key: EntityKey, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        fn() for the first caller of `key`; later / concurrent callers get
+        its result. Returns (result, shared). A failed fetch isn't kept.
+        """
+        with self._lock:
+            future = self._pages.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._pages[key] = future
+        if not owner:
+            result = future.result()
+            with self._lock:
+                self.shared += 1
+            return result, True
+
+        try:
+            result = fn()
+        except BaseException as e:
+            with self._lock:
+                self._pages.pop(key, None)
+            future.set_exception(e)
+            raise
+        future.set_result(result)
+        with self._lock:
+            if key not in self._retained:
+                # only waiters already holding the future see this page
+                self._pages.pop(key, None)
+        return result, False
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            counts = {"crews": 0, "pirates": 0, "flags": 0}
+            for key in self._known:
+                counts[f"{key.kind}s"] += 1
+            return {**counts, "retained": len(self._retained), "shared_fetches": self.shared}
@@ -0,0 +1,405 @@
+from __future__ import annotations
+
+from typing import Dict, Any, List, Optional, Tuple
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import argparse
+import hashlib
+import html
+import random
+import threading
+import time
+import urllib.parse
+
+from scraper.parsing import FIXTURES_DIR
+
+
+FLAG_ID = 10007105
+FIRST_CREW_ID = 6000001
+
+FAME = ["Scurvy", "Notorious", "Noted", "Renowned", "Illustrious", "Legendary"]
+# the levels yoweb shows, lowest first (see scraper.skills)
+STANDINGS = ["Able", "Proficient", "Distinguished", "Respected", "Master",
+             "Renowned", "Grand-Master", "Legendary", "Ultimate"]
+EXPERIENCE = ["Neophyte", "Novice", "Apprentice", "Narrow", "Solid", "Broad", "Weighty",
+              "Expert", "Paragon", "Illustrious", "Sublime", "Revered", "Exalted", "Transcendent"]
+CREW_RANKS = ["Captain", "Senior Officers", "Officers", "Pirates", "Cabin Persons"]
+CREW_RANK_IMAGES = {
+    "Captain": "crew-captain",
+    "Senior Officers": "crew-seniorofficer",
+    "Officers": "crew-officer",
+    "Pirates": "crew-pirate",
+    "Cabin Persons": "crew-cabinperson",
+}
+PIRATE_RANKS = {"Captain": "Captain", "Senior Officers": "Senior Officer",
+                "Officers": "Officer", "Pirates": "Pirate", "Cabin Persons": "Cabin Person"}
+SKILLS = {
+    "Piracy Skills": ["Sailing", "Rigging", "Carpentry", "Patching", "Bilging", "Gunning",
+                      "Treasure Haul", "Navigating", "Battle Navigation", "Swordfighting", "Rumble"],
+    "Carousing Skills": ["Drinking", "Spades", "Hearts", "Treasure Drop", "Poker"],
+    "Crafting Skills": ["Distilling", "Alchemistry", "Shipwrightery", "Blacksmithing",
+                        "Foraging", "Weaving"],
+}
+SHOP_TYPES = ["ironmonger", "tailor", "weavery", "distillery", "apothecary", "shipyard"]
+ISLANDS = ["Sayers Rock", "Cleanse Island", "Admiral Island", "Ursa Island", "Turtle Island"]
+
+
+def _slug(name: str) -> str:
+    return "".join(ch for ch in name.lower() if ch.isalnum())
+
+
+class World:
+    """The synthetic ocean: one flag, `crews` crews of `pirates_per_crew` pirates."""
+
+    def __init__(self, crews: int = 10, pirates_per_crew: int = 28, seed: int = 0,
+                 pages_dir: Optional[Path] = None):
+        self.crews = crews
+        self.pirates_per_crew = pirates_per_crew
+        self.seed = seed
+        self.recorded: Dict[Tuple[str, str], bytes] = {}
+        if pages_dir is not None:
+            for path in Path(pages_dir).glob("*.html"):
+                kind, _, name = path.stem.partition("_")
+                self.recorded[(kind, _slug(name))] = path.read_bytes()
+
+    def _rng(self, *key: Any) -> random.Random:
+        return random.Random(f"{self.seed}:" + ":".join(str(k) for k in key))
+
+    @staticmethod
+    def crew_name(crew_id: int) -> str:
+        return f"Crew {crew_id - FIRST_CREW_ID + 1:04d}"
+
+    @staticmethod
+    def pirate_name(crew_id: int, n: int) -> str:
+        return f"Cr{crew_id - FIRST_CREW_ID + 1:04d}p{n:04d}"
+
+    def crew_of(self, pirate: str) -> Optional[int]:
+        if len(pirate) == 11 and pirate[:2] == "Cr" and pirate[6] == "p":
+            try:
+                crew_id = FIRST_CREW_ID + int(pirate[2:6]) - 1
+                n = int(pirate[7:])
+            except ValueError:
+                return None
+            if FIRST_CREW_ID <= crew_id < FIRST_CREW_ID + self.crews and n < self.pirates_per_crew:
+                return crew_id
+        return None
+
+    def roster(self, crew_id: int) -> Dict[str, List[str]]:
+        """Pirate names by crew rank: one captain, the rest spread over the ranks."""
+        out: Dict[str, List[str]] = {rank: [] for rank in CREW_RANKS}
+        for n in range(self.pirates_per_crew):
+            rank = "Captain" if n == 0 else CREW_RANKS[1 + min(3, n * 4 // max(1, self.pirates_per_crew))]
+            out[rank].append(self.pirate_name(crew_id, n))
+        return out
+
+    def flag_page(self, flag_id: str) -> bytes:
+        if ("flag", _slug(flag_id)) in self.recorded:
+            return self.recorded[("flag", _slug(flag_id))]
+        rows = []
+        for i in range(self.crews):
+            crew_id = FIRST_CREW_ID + i
+            fame = FAME[self._rng("fame", crew_id).randrange(len(FAME))]
+            rows.append(
+                f'<tr><td><a href="/yoweb/crew/info.wm?crewid={crew_id}&amp;classic=$classic">'
+                f"{self.crew_name(crew_id)}</a></td><td></td><td>{self.pirates_per_crew}</td>"
+                f"<td>{fame}</td></tr>"
+            )
+        return (
+            "<html><head><title>Puzzle Pirates - Flag Info: Synthetic Flag</title></head>"
+            '<body bgcolor="#ffffff"><center>'
+            '<table width="600" border="0"><tr><td align="center"><font size="+2"><b>Synthetic Flag</b>'
+            "</font></td></tr></table>"
+            '<table width="600" border="0" cellpadding="2" cellspacing="0">'
+            '<tr><th align="left">Crew</th><th>Rank</th><th>Members</th><th>Fame</th></tr>\n'
+            + "\n".join(rows)
+            + f'\n<tr><td colspan="4"><font size="-1">{self.crews} crews</font></td></tr>'
+            "</table></center></body></html>"
+        ).encode("utf-8")
+
+    def crew_page(self, crew_id: str) -> Optional[bytes]:
+        if ("crew", _slug(crew_id)) in self.recorded:
+            return self.recorded[("crew", _slug(crew_id))]
+        try:
+            cid = int(crew_id)
+        except ValueError:
+            return None
+        if not FIRST_CREW_ID <= cid < FIRST_CREW_ID + self.crews:
+            return None
+
+        name = self.crew_name(cid)
+        sections = []
+        for rank, pirates in self.roster(cid).items():
+            if not pirates:
+                continue
+            links = ", ".join(
+                f'<a href="/yoweb/pirate.wm?classic=false&amp;target={p}">{p}</a>' for p in pirates
+            )
+            sections.append(
+                '<tr><td><table border="0" cellpadding="0" cellspacing="0"><tr><td>'
+                f'<img src="/yoweb/images/{CREW_RANK_IMAGES[rank]}.png"> <b>{rank}</b>'
+                "</td></tr></table></td></tr>\n"
+                f'<tr><td><font size="-1">{links}</font></td></tr>'
+            )
+        return (
+            f"<html><head><title>Puzzle Pirates - Crew Info: {name}</title></head>"
+            '<body bgcolor="#ffffff"><center>'
+            '<table width="600" border="0" cellpadding="0" cellspacing="0"><tr><td><a href="/yoweb/">'
+            '<img src="/yoweb/images/yoweb-header.png" border="0"></a></td></tr></table>'
+            '<table width="600" border="0" cellpadding="4" cellspacing="0"><tr>'
+            '<td width="150" valign="top"><img src="/yoweb/images/crew-flag.png"></td>'
+            f'<td align="center" valign="top"><font size="+2"><b>{name}</b></font><br>'
+            f'<font size="-1">Member of the flag <a href="/yoweb/flag/info.wm?flagid={FLAG_ID}'
+            '&amp;classic=$classic">Synthetic Flag</a></font>'
+            f'<p align="left"><b>Public Statement:</b><br>{name} is a synthetic crew.</p>'
+            "</td></tr></table>"
+            '<table width="600" border="0" cellpadding="2" cellspacing="0">\n'
+            + "\n".join(sections)
+            + '\n<tr><td><table border="0" cellpadding="0" cellspacing="0"><tr><td>'
+            '<img src="/yoweb/images/crew-jobbing.png"> <b>Jobbing Pirates</b>'
+            "</td></tr></table></td></tr>"
+            "</table></center></body></html>"
+        ).encode("utf-8")
+
+    def pirate_page(self, pirate: str) -> bytes:
+        if ("pirate", _slug(pirate)) in self.recorded:
+            return self.recorded[("pirate", _slug(pirate))]
+
+        rng = self._rng("pirate", pirate)
+        name = html.escape(pirate)
+        crew_id = self.crew_of(pirate)
+        affiliation = ""
+        if crew_id is not None:
+            rank = next(r for r, ps in self.roster(crew_id).items() if pirate in ps)
+            affiliation = (
+                '<table border="0" cellpadding="0" cellspacing="0">'
+                '<tr><td><img src="/yoweb/images/crew-officer.png" width="16" height="16"></td>'
+                f'<td><font size="-1">{PIRATE_RANKS[rank]} of the crew '
+                f'<a href="/yoweb/crew/info.wm?crewid={crew_id}&amp;classic=$classic">'
+                f"<b>{self.crew_name(crew_id)}</b></a></font></td></tr>"
+                '<tr><td><img src="/yoweb/images/flag-royalty.png" width="16" height="16"></td>'
+                '<td><font size="-1">Member of the flag '
+                f'<a href="/yoweb/flag/info.wm?flagid={FLAG_ID}&amp;classic=$classic">'
+                "<b>Synthetic Flag</b></a></font></td></tr></table>"
+            )
+
+        shops = ""
+        if rng.random() < 0.2:
+            kind = rng.choice(SHOP_TYPES)
+            shops = (
+                '<table border="0" cellpadding="1" cellspacing="0"><tr valign="middle">'
+                f'<td><img src="/yoweb/images/shop-{kind}.png" width="16" height="16"></td>'
+                f'<td><font size="-1">Owns: {name}\'s {kind.title()} on {rng.choice(ISLANDS)}</font></td>'
+                "</tr></table>"
+            )
+
+        skill_tables = []
+        for section, skills in SKILLS.items():
+            rows = []
+            for skill in skills:
+                image = skill.lower().replace(" ", "-")
+                rows.append(
+                    f'<tr><td><img src="/yoweb/images/stat-{image}.png" alt="{skill}"></td>'
+                    f'<td><font size="-1">{rng.choice(EXPERIENCE)} / {rng.choice(STANDINGS)}</font></td></tr>'
+                )
+            skill_tables.append(
+                f'<tr><td valign="top"><b>{section}</b>'
+                '<table border="0" cellpadding="1" cellspacing="0">' + "".join(rows) + "</table></td></tr>"
+            )
+
+        return (
+            f"<html><head><title>Puzzle Pirates - Pirate Info: {name}</title></head>"
+            '<body bgcolor="#ffffff"><center>'
+            '<table width="600" border="0" cellpadding="0" cellspacing="0"><tr>'
+            f'<td align="center" height="32"><font size="+1"><b>{name}</b></font></td></tr></table>'
+            '<table width="600" border="0" cellpadding="2" cellspacing="0"><tr>'
+            f'<td width="190" valign="top">{affiliation}{shops}</td>'
+            '<td valign="top"><table border="0" cellpadding="0" cellspacing="0" width="100%">'
+            + "".join(skill_tables)
+            + "</table></td></tr></table></center></body></html>"
+        ).encode("utf-8")
+
+    def page(self, path: str, query: Dict[str, List[str]]) -> Optional[bytes]:
+        if path.startswith("/yoweb/flag/info.wm"):
+            return self.flag_page(query.get("flagid", [""])[0])
+        if path.startswith("/yoweb/crew/info.wm"):
+            return self.crew_page(query.get("crewid", [""])[0])
+        if path.startswith("/yoweb/pirate.wm"):
+            target = query.get("target", [""])[0].strip()
+            return self.pirate_page(target) if target else None
+        return None
+
+
+class Faults:
+    """Injected latency, server errors and 429s, drawn per request."""
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0,
+                 throttle_rate: float = 0.0, retry_after: int = 1, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def draw(self) -> Tuple[float, Optional[int]]:
+        """(delay in seconds, forced status or None)."""
+        with self._lock:
+            delay = max(0.0, self.latency_ms + self._rng.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+            roll = self._rng.random()
+        if roll < self.throttle_rate:
+            return delay, 429
+        if roll < self.throttle_rate + self.error_rate:
+            return delay, 500
+        return delay, None
+
+
+class FakeYoweb(ThreadingHTTPServer):
+    """
+    Local stand-in for the yoweb pages the stages read, for end-to-end
+    load tests without touching the production site. Any flagid gets the
+    world's one flag, any crewid in it a crew page, and any pirate name a
+    pirate page; recorded pages are served instead where the name matches.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], world: World, faults: Faults):
+        super().__init__(address, _Handler)
+        self.world = world
+        self.faults = faults
+        self.counts: Counter = Counter()
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, kind: str, status: int, size: int) -> None:
+        with self._lock:
+            self.counts[(kind, status)] += 1
+            self.bytes_sent += size
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = {f"{kind} {status}": n for (kind, status), n in sorted(self.counts.items())}
+            out["bytes"] = self.bytes_sent
+        return out
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: FakeYoweb
+    protocol_version = "HTTP/1.1"
+    # headers and body go out in separate writes; without this each
+    # keep-alive response stalls on delayed ACKs
+    disable_nagle_algorithm = True
+
+    def do_GET(self) -> None:
+        parsed = urllib.parse.urlsplit(self.path)
+        kind = parsed.path.rsplit("/", 2)[-2] if parsed.path.count("/") > 1 else "other"
+        if parsed.path.startswith("/yoweb/pirate.wm"):
+            kind = "pirate"
+
+        delay, forced = self.server.faults.draw()
+        if delay:
+            time.sleep(delay)
+
+        if forced == 429:
+            self._send(kind, 429, b"Too Many Requests", {"Retry-After": str(self.server.faults.retry_after)})
+            return
+        if forced == 500:
+            self._send(kind, 500, b"Internal Server Error")
+            return
+
+        body = self.server.world.page(parsed.path, urllib.parse.parse_qs(parsed.query))
+        if body is None:
+            self._send(kind, 404, b"Not Found")
+            return
+
+        etag = '"' + hashlib.sha1(body).hexdigest()[:16] + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self._send(kind, 304, b"", {"ETag": etag})
+            return
+        self._send(kind, 200, body, {"ETag": etag})
+
+    def _send(self, kind: str, status: int, body: bytes, headers: Optional[Dict[str, str]] = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+        self.server.count(kind, status, len(body))
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+def write_targets(path: Path, count: int) -> None:
+    """An xoutflag.csv of `count` pirate names for the external stage."""
+    names = [f"Ext{n:05d}" for n in range(count)]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text("Pirate Name\n" + "\n".join(names) + "\n", encoding="utf-8")
+
+
+def serve(host: str = "127.0.0.1", port: int = 8765, world: Optional[World] = None,
+          faults: Optional[Faults] = None) -> FakeYoweb:
+    """Start the server on a background thread and return it (call .shutdown() to stop)."""
+    server = FakeYoweb((host, port), world or World(), faults or Faults())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Serve synthetic or recorded yoweb pages for load tests.",
+        epilog="e.g. python -m scraper.fake_yoweb --crews 100 --pirates-per-crew 100 --latency-ms 50, "
+               "then YOWEB_BASE=http://127.0.0.1:8765 python -m scraper.pipeline --rps 0 --workers 32",
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--crews", type=int, default=10, help="crews in the synthetic flag")
+    parser.add_argument("--pirates-per-crew", type=int, default=28, help="pirates listed on each crew page")
+    parser.add_argument("--pages", default=None,
+                        help=f"directory of recorded <kind>_<name>.html pages served in place of synthetic "
+                             f"ones where the name matches (e.g. {FIXTURES_DIR})")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of requests answered 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--write-targets", default=None, metavar="CSV",
+                        help="also write an xoutflag.csv of generated names for the external stage")
+    parser.add_argument("--targets", type=int, default=50, help="names written by --write-targets")
+    args = parser.parse_args(argv)
+
+    world = World(args.crews, args.pirates_per_crew, args.seed, Path(args.pages) if args.pages else None)
+    faults = Faults(args.latency_ms, args.jitter_ms, args.error_rate, args.throttle_rate,
+                    args.retry_after, args.seed)
+    if args.write_targets:
+        write_targets(Path(args.write_targets), args.targets)
+        print(f"Wrote {args.targets} targets to {args.write_targets}")
+
+    server = serve(args.host, args.port, world, faults)
+    print(f"Serving {args.crews} crews / {args.crews * args.pirates_per_crew} pirates at {server.base_url}")
+    print(f"  YOWEB_BASE={server.base_url} python -m scraper.pipeline --rps 0")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        for key, value in server.summary().items():
+            print(f"  {key}: {value}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
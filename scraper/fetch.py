@@ -0,0 +1,622 @@
+from __future__ import annotations
+
+from typing import Dict, Any, Callable, Iterable, Iterator, List, Optional, Tuple, TypeVar
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+import dataclasses
+import itertools
+import math
+import os
+import random
+import threading
+import time
+import urllib.parse
+
+import requests
+
+from scraper.cache import ResponseCache
+from scraper.entities import EntityIndex
+
+
+USER_AGENT = "Mozilla/5.0 (compatible; GitHubActionsScraper/1.0)"
+REQUEST_TIMEOUT = 30
+
+# Politeness knobs (shared by every stage in the process)
+FETCH_WORKERS = int(os.getenv("FETCH_WORKERS", "4"))
+REQUESTS_PER_SECOND = float(os.getenv("FETCH_RPS", "2.0"))
+MAX_IN_FLIGHT_PER_HOST = int(os.getenv("FETCH_MAX_PER_HOST", "2"))
+
+# In-line retries of 429 / 5xx / timeouts, with jittered exponential backoff
+FETCH_RETRIES = int(os.getenv("FETCH_RETRIES", "2"))
+BACKOFF_BASE = float(os.getenv("FETCH_BACKOFF_BASE", "1.0"))
+BACKOFF_MAX = float(os.getenv("FETCH_BACKOFF_MAX", "30"))
+RETRY_AFTER_MAX = float(os.getenv("FETCH_RETRY_AFTER_MAX", "120"))
+# Pause before the end-of-stage pass over URLs that still failed
+RETRY_PASS_DELAY = float(os.getenv("FETCH_RETRY_PASS_DELAY", "5"))
+
+# Per-host circuit breaker: open when this share of the last BREAKER_WINDOW
+# requests failed, reject for BREAKER_COOLDOWN seconds, then probe
+BREAKER_WINDOW = int(os.getenv("BREAKER_WINDOW", "20"))
+BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", "0.5"))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "60"))
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+@dataclass
+class FetchResult:
+    url: str
+    status_code: int
+    content: bytes
+    encoding: str
+    headers: Dict[str, str] = field(default_factory=dict)
+    elapsed: float = 0.0
+
+    @property
+    def text(self) -> str:
+        return self.content.decode(self.encoding or "utf-8", errors="replace")
+
+
+class TransientHTTPError(RuntimeError):
+    """A 429 / 5xx response that was still failing after the in-line retries."""
+
+    def __init__(self, url: str, status_code: int):
+        super().__init__(f"HTTP Error: {status_code}")
+        self.url = url
+        self.status_code = status_code
+
+
+class CircuitOpenError(RuntimeError):
+    """Request refused without touching the network: the host's circuit is open."""
+
+    def __init__(self, host: str, rejected: int = 0):
+        detail = f" ({rejected} requests still rejected after the retry pass)" if rejected else ""
+        super().__init__(f"Circuit open for {host}: too many recent failures{detail}")
+        self.host = host
+
+
+def is_transient(e: BaseException) -> bool:
+    """Worth another try later: throttling, server errors, timeouts, an open circuit."""
+    return isinstance(e, (TransientHTTPError, CircuitOpenError, requests.Timeout, requests.ConnectionError))
+
+
+def backoff_delay(attempt: int, base: float = BACKOFF_BASE, cap: float = BACKOFF_MAX) -> float:
+    """Full-jitter exponential backoff for the given retry (0-based)."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def retry_after_seconds(headers: Dict[str, str]) -> float:
+    """Retry-After as seconds (delta-seconds or HTTP-date); 0.0 if absent or unparseable."""
+    value = next((v for k, v in headers.items() if k.lower() == "retry-after"), "")
+    value = str(value).strip()
+    if not value:
+        return 0.0
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return 0.0
+    return min(RETRY_AFTER_MAX, max(0.0, seconds))
+
+
+@dataclass(frozen=True)
+class BreakerTicket:
+    """A request let through by CircuitBreaker.allow(); pass it back to record()."""
+
+    epoch: int
+    probe: bool = False
+
+
+class CircuitBreaker:
+    """
+    Tracks the outcome of the last `window` requests to one host. Once
+    `error_rate` of them failed it opens: requests are refused for
+    `cooldown` seconds, then one probe is let through, whose outcome
+    closes the circuit or opens it again.
+
+    Each open / close starts a new epoch. Outcomes of requests let
+    through in an earlier epoch (in flight when the circuit opened, or
+    before it last closed) are ignored, and only the probe's outcome
+    decides while it is open.
+    """
+
+    def __init__(
+        self,
+        window: int = BREAKER_WINDOW,
+        error_rate: float = BREAKER_ERROR_RATE,
+        cooldown: float = BREAKER_COOLDOWN,
+    ):
+        self.error_rate = error_rate
+        self.cooldown = cooldown
+        self.trips = 0
+        self._outcomes: deque = deque(maxlen=max(1, window))
+        self._opened_at: Optional[float] = None
+        self._epoch = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        with self._lock:
+            return self._opened_at is not None
+
+    def retry_in(self) -> float:
+        """Seconds until a probe will be allowed (0.0 when closed)."""
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0
+            return max(0.0, self._opened_at + self.cooldown - time.monotonic())
+
+    def allow(self) -> Optional[BreakerTicket]:
+        """A ticket for one request, or None if the circuit refuses it."""
+        with self._lock:
+            if self._opened_at is None:
+                return BreakerTicket(self._epoch)
+            if self._probing or time.monotonic() - self._opened_at < self.cooldown:
+                return None
+            self._probing = True
+            return BreakerTicket(self._epoch, probe=True)
+
+    def _next_epoch(self, opened_at: Optional[float]) -> None:
+        self._opened_at = opened_at
+        self._epoch += 1
+        self._probing = False
+        self._outcomes.clear()
+
+    def record(self, ok: bool, ticket: BreakerTicket) -> None:
+        with self._lock:
+            if ticket.epoch != self._epoch:
+                # let through before the circuit last opened or closed
+                return
+            if ticket.probe:
+                self._next_epoch(None if ok else time.monotonic())
+                return
+            self._outcomes.append(ok)
+            failed = self._outcomes.count(False)
+            if len(self._outcomes) == self._outcomes.maxlen and failed >= self.error_rate * len(self._outcomes):
+                self._next_epoch(time.monotonic())
+                self.trips += 1
+
+
+@dataclass
+class _Host:
+    slot: threading.BoundedSemaphore
+    bucket: "TokenBucket"
+    breaker: CircuitBreaker
+    # monotonic time before which no request goes out (Retry-After)
+    resume_at: float = 0.0
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens per second, up to `capacity`
+    banked. acquire() blocks until a token is available.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(capacity))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                wait = (1.0 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class FetchStats:
+    """Per-stage request, latency and parse counters; safe to share across worker threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.bytes = 0
+        self.errors = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_revalidated = 0
+        self.latencies: List[float] = []
+        self.pages_parsed = 0
+        self.parse_seconds = 0.0
+        self.worker_cpu_seconds = 0.0
+        self.parse_pool_cpu_seconds = 0.0
+        self.retries = 0
+        self.deferred = 0
+        self.circuit_rejected = 0
+        self.shared = 0
+
+    def record(
+        self,
+        result: Optional[FetchResult] = None,
+        error: bool = False,
+        latency: Optional[float] = None,
+    ) -> None:
+        with self._lock:
+            self.requests += 1
+            if result is not None:
+                self.bytes += len(result.content)
+            if error:
+                self.errors += 1
+            if latency is not None:
+                self.latencies.append(latency)
+
+    def record_cache(self, outcome: str) -> None:
+        """outcome: 'hit', 'miss' or 'revalidated'."""
+        with self._lock:
+            if outcome == "hit":
+                self.cache_hits += 1
+            elif outcome == "revalidated":
+                self.cache_revalidated += 1
+            else:
+                self.cache_misses += 1
+
+    def record_retry(self, kind: str = "retry") -> None:
+        """kind: 'retry' (in-line), 'deferred' (end-of-stage pass) or 'rejected' (circuit open)."""
+        with self._lock:
+            if kind == "deferred":
+                self.deferred += 1
+            elif kind == "rejected":
+                self.circuit_rejected += 1
+            else:
+                self.retries += 1
+
+    def record_shared(self) -> None:
+        """A page another stage had already fetched this run (see entities.EntityIndex)."""
+        with self._lock:
+            self.shared += 1
+
+    def record_parse(self, seconds: float, pages: int = 1) -> None:
+        with self._lock:
+            self.pages_parsed += pages
+            self.parse_seconds += seconds
+
+    def record_cpu(self, seconds: float, pool: bool = False) -> None:
+        """CPU time spent for the stage off its own thread: on fetch workers, or in the parse pool."""
+        with self._lock:
+            if pool:
+                self.parse_pool_cpu_seconds += seconds
+            else:
+                self.worker_cpu_seconds += seconds
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            latencies = sorted(self.latencies)
+            return {
+                "requests": self.requests,
+                "bytes": self.bytes,
+                "request_errors": self.errors,
+                "cache_hits": self.cache_hits,
+                "cache_misses": self.cache_misses,
+                "cache_revalidated": self.cache_revalidated,
+                "fetch_latency_avg_s": round(sum(latencies) / len(latencies), 4) if latencies else 0.0,
+                "fetch_latency_p95_s": round(_percentile(latencies, 0.95), 4),
+                "pages_parsed": self.pages_parsed,
+                "parse_seconds": round(self.parse_seconds, 4),
+                "worker_cpu_s": round(self.worker_cpu_seconds, 4),
+                "parse_pool_cpu_s": round(self.parse_pool_cpu_seconds, 4),
+                "retries": self.retries,
+                "deferred": self.deferred,
+                "circuit_rejected": self.circuit_rejected,
+                "shared": self.shared,
+            }
+
+
+def _percentile(ordered: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list (0.0 when empty)."""
+    if not ordered:
+        return 0.0
+    rank = max(1, math.ceil(q * len(ordered)))
+    return ordered[rank - 1]
+
+
+class Fetcher:
+    """
+    Shared fetch engine: a thread pool for overlapping network latency,
+    and per host (each ocean is its own server) a token bucket for the
+    request rate and a semaphore for max in-flight requests. With a cache, fresh entries are
+    served without touching the network and stale ones are revalidated
+    with a conditional request.
+
+    429 / 5xx responses and timeouts are retried in-line with jittered
+    exponential backoff (a Retry-After pauses the whole host). Each host
+    has a circuit breaker, so a dead site fails the remaining requests
+    at once instead of timing out on every one of them.
+    """
+
+    def __init__(
+        self,
+        workers: int = FETCH_WORKERS,
+        requests_per_second: float = REQUESTS_PER_SECOND,
+        max_in_flight_per_host: int = MAX_IN_FLIGHT_PER_HOST,
+        cache: Optional[ResponseCache] = None,
+        retries: int = FETCH_RETRIES,
+    ):
+        self.cache = cache
+        self.workers = max(1, int(workers))
+        self.requests_per_second = requests_per_second
+        self.max_in_flight_per_host = max(1, int(max_in_flight_per_host))
+        self.retries = max(0, int(retries))
+        self._hosts: Dict[str, _Host] = {}
+        self._hosts_lock = threading.Lock()
+        self._local = threading.local()
+        # crews / pirates / flags seen this run; one fetch per entity
+        self.entities = EntityIndex()
+
+    def _session(self) -> requests.Session:
+        # requests.Session isn't guaranteed thread-safe: one per worker thread
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            self._local.session = session
+        return session
+
+    def _host(self, url: str) -> _Host:
+        name = urllib.parse.urlsplit(url).netloc.lower()
+        with self._hosts_lock:
+            host = self._hosts.get(name)
+            if host is None:
+                host = _Host(
+                    slot=threading.BoundedSemaphore(self.max_in_flight_per_host),
+                    bucket=TokenBucket(self.requests_per_second),
+                    breaker=CircuitBreaker(),
+                )
+                self._hosts[name] = host
+            return host
+
+    def breaker_stats(self) -> Dict[str, Any]:
+        with self._hosts_lock:
+            hosts = dict(self._hosts)
+        return {
+            name: {"open": host.breaker.is_open, "trips": host.breaker.trips}
+            for name, host in hosts.items()
+        }
+
+    def get(
+        self,
+        url: str,
+        stats: Optional[FetchStats] = None,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: float = REQUEST_TIMEOUT,
+        ocean: Optional[str] = None,
+    ) -> FetchResult:
+        """
+        Fetch a page. Concurrent and repeated fetches of one crew / pirate
+        / flag are shared (see entities.EntityIndex); `ocean` names the
+        entity's ocean when the URL's host can't (a stub serving them all).
+        """
+        key = self.entities.add(url, ocean)
+        if key is None:
+            return self._get(url, stats, headers, timeout)
+        result, shared = self.entities.fetch(key, lambda: self._get(url, stats, headers, timeout))
+        if not shared:
+            return result
+        if stats is not None:
+            stats.record_shared()
+        # same page, as this caller spelled it
+        return dataclasses.replace(result, url=url)
+
+    def _get(
+        self,
+        url: str,
+        stats: Optional[FetchStats],
+        headers: Optional[Dict[str, str]],
+        timeout: float,
+    ) -> FetchResult:
+        request_headers = {"User-Agent": USER_AGENT}
+        request_headers.update(headers or {})
+
+        entry = self.cache.get(url) if self.cache is not None else None
+        if entry is not None:
+            if entry.is_fresh():
+                if stats is not None:
+                    stats.record_cache("hit")
+                return FetchResult(url=url, status_code=200, content=entry.content, encoding=entry.encoding)
+            request_headers.update(entry.conditional_headers())
+
+        host = self._host(url)
+        attempt = 0
+        while True:
+            ticket = host.breaker.allow()
+            if ticket is None:
+                if stats is not None:
+                    stats.record_retry("rejected")
+                raise CircuitOpenError(urllib.parse.urlsplit(url).netloc.lower())
+            try:
+                result = self._get_once(url, host, entry, request_headers, timeout, stats)
+            except (requests.Timeout, requests.ConnectionError):
+                host.breaker.record(False, ticket)
+                if attempt >= self.retries:
+                    raise
+                delay = backoff_delay(attempt)
+            except Exception:
+                # not the host's fault (bad URL, too many redirects, ...)
+                host.breaker.record(True, ticket)
+                raise
+            else:
+                status = result.status_code
+                if status != 429 and status < 500:
+                    host.breaker.record(True, ticket)
+                    return result
+                # throttling means the host is up; it only counts as a failure for 5xx
+                host.breaker.record(status == 429, ticket)
+                if attempt >= self.retries:
+                    raise TransientHTTPError(url, status)
+                delay = backoff_delay(attempt)
+                wait = retry_after_seconds(result.headers)
+                if wait:
+                    host.resume_at = max(host.resume_at, time.monotonic() + wait)
+            if stats is not None:
+                stats.record_retry()
+            time.sleep(delay)
+            attempt += 1
+
+    def _get_once(
+        self,
+        url: str,
+        host: _Host,
+        entry: Any,
+        request_headers: Dict[str, str],
+        timeout: float,
+        stats: Optional[FetchStats],
+    ) -> FetchResult:
+        with host.slot:
+            pause = host.resume_at - time.monotonic()
+            if pause > 0:
+                time.sleep(pause)
+            host.bucket.acquire()
+            started = time.monotonic()
+            try:
+                r = self._session().get(url, timeout=timeout, headers=request_headers)
+            except Exception:
+                if stats is not None:
+                    stats.record(error=True, latency=time.monotonic() - started)
+                raise
+
+        elapsed = time.monotonic() - started
+        if r.status_code == 304 and entry is not None:
+            self.cache.touch(url)
+            if stats is not None:
+                stats.record(latency=elapsed)
+                stats.record_cache("revalidated")
+            return FetchResult(
+                url=url,
+                status_code=200,
+                content=entry.content,
+                encoding=entry.encoding,
+                headers=dict(r.headers),
+                elapsed=elapsed,
+            )
+
+        result = FetchResult(
+            url=url,
+            status_code=r.status_code,
+            content=r.content,
+            encoding=r.encoding or r.apparent_encoding or "utf-8",
+            headers=dict(r.headers),
+            elapsed=elapsed,
+        )
+        if self.cache is not None and r.status_code == 200:
+            self.cache.put(url, result.content, result.encoding, result.headers)
+        if stats is not None:
+            stats.record(result, error=r.status_code >= 400, latency=elapsed)
+            if self.cache is not None:
+                stats.record_cache("miss")
+        return result
+
+    def map(
+        self,
+        fn: Callable[[T], R],
+        items: Iterable[T],
+        stats: Optional[FetchStats] = None,
+    ) -> Iterator[Tuple[T, Optional[R], Optional[Exception]]]:
+        """
+        Run fn over items on the worker pool, yielding (item, result, error)
+        in input order. At most a few batches are queued ahead so huge
+        inputs don't turn into huge future lists.
+
+        Items that fail with a transient error (see is_transient) are held
+        back and tried once more after the rest, then yielded last. If a
+        circuit is still open after that pass, CircuitOpenError is raised
+        so the stage aborts instead of publishing a gutted dataset.
+        """
+        def call(item: T) -> Tuple[Optional[R], Optional[Exception]]:
+            cpu = time.thread_time()
+            try:
+                return fn(item), None
+            except Exception as e:
+                return None, e
+            finally:
+                if stats is not None:
+                    stats.record_cpu(time.thread_time() - cpu)
+
+        deferred: List[T] = []
+        window = self.workers * 4
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            pending: deque = deque()
+
+            def drain(head: T, fut) -> Iterator[Tuple[T, Optional[R], Optional[Exception]]]:
+                result, error = fut.result()
+                if error is not None and is_transient(error):
+                    deferred.append(head)
+                    if stats is not None:
+                        stats.record_retry("deferred")
+                    return
+                yield head, result, error
+
+            for item in items:
+                pending.append((item, pool.submit(call, item)))
+                if len(pending) >= window:
+                    yield from drain(*pending.popleft())
+            while pending:
+                yield from drain(*pending.popleft())
+
+            if deferred:
+                yield from self._retry_pass(call, deferred, pool)
+
+    def _retry_pass(
+        self,
+        call: Callable[[T], Tuple[Optional[R], Optional[Exception]]],
+        items: List[T],
+        pool: ThreadPoolExecutor,
+    ) -> Iterator[Tuple[T, Optional[R], Optional[Exception]]]:
+        with self._hosts_lock:
+            hosts = list(self._hosts.values())
+        wait = max([RETRY_PASS_DELAY] + [h.breaker.retry_in() for h in hosts])
+        print(f"Retrying {len(items)} failed requests in {wait:.0f}s...")
+        time.sleep(wait)
+
+        # The first goes alone: with an open circuit it's the probe, and
+        # the rest shouldn't be refused while it's in flight
+        first = pool.submit(call, items[0]).result()
+        futures = [(item, pool.submit(call, item)) for item in items[1:]]
+        outcomes = itertools.chain(
+            [(items[0], *first)],
+            ((item, *fut.result()) for item, fut in futures),
+        )
+
+        rejected: Optional[CircuitOpenError] = None
+        count = 0
+        for item, result, error in outcomes:
+            if isinstance(error, CircuitOpenError):
+                rejected = error
+                count += 1
+            yield item, result, error
+        if rejected is not None:
+            raise CircuitOpenError(rejected.host, rejected=count)
+
+
+_FETCHER: Optional[Fetcher] = None
+_FETCHER_LOCK = threading.Lock()
+
+
+def get_fetcher() -> Fetcher:
+    """Process-wide fetcher, so every stage shares the per-host limits."""
+    global _FETCHER
+    with _FETCHER_LOCK:
+        if _FETCHER is None:
+            _FETCHER = Fetcher()
+        return _FETCHER
+
+
+def configure(**kwargs: Any) -> Fetcher:
+    """Replace the process-wide fetcher (e.g. from CLI flags)."""
+    global _FETCHER
+    with _FETCHER_LOCK:
+        _FETCHER = Fetcher(**kwargs)
+        return _FETCHER
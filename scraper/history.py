@@ -0,0 +1,324 @@
+from __future__ import annotations
+
+from typing import Dict, Any, Iterable, Iterator, List, Optional
+from datetime import datetime, timezone
+from pathlib import Path
+import argparse
+import json
+
+import pandas as pd
+
+
+MANIFEST_FILENAME = "manifest.json"
+PARTITION_KEY = "Scrape Date"
+SCRAPED_AT = "Scraped At UTC"
+
+# Change-only history (VersionedHistory)
+VALID_FROM = "Valid From"
+VALID_TO = "Valid To"
+CURRENT_FILENAME = "current.csv"
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def _utc_now() -> datetime:
+    return datetime.now(timezone.utc).replace(microsecond=0)
+
+
+class PartitionedHistory:
+    """
+    Append-only history partitioned by Scrape Date: one CSV per day plus
+    a manifest listing the partitions. A run only rewrites its own day's
+    file (a second run on the same day adds to it), so the cost of a run
+    doesn't grow with the total history.
+    """
+
+    partition_key = PARTITION_KEY
+
+    def __init__(self, directory: Path, dataset: str = ""):
+        self.directory = Path(directory)
+        self.dataset = dataset or self.directory.name
+
+    @property
+    def manifest_path(self) -> Path:
+        return self.directory / MANIFEST_FILENAME
+
+    def _empty_manifest(self) -> Dict[str, Any]:
+        return {"dataset": self.dataset, "partition_key": self.partition_key, "partitions": []}
+
+    def manifest(self) -> Dict[str, Any]:
+        if not self.manifest_path.exists():
+            return self._empty_manifest()
+        return json.loads(self.manifest_path.read_text(encoding="utf-8"))
+
+    def _write_manifest(self, manifest: Dict[str, Any]) -> None:
+        manifest["partitions"].sort(key=lambda p: p["date"])
+        tmp = self.manifest_path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(manifest, indent=2) + "\n", encoding="utf-8")
+        tmp.replace(self.manifest_path)
+
+    @staticmethod
+    def partition_filename(date: str) -> str:
+        return f"{date}.csv"
+
+    def write_partition(self, df: pd.DataFrame, date: str) -> Path:
+        """Add `df` (rows of one Scrape Date) to that day's partition."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / self.partition_filename(date)
+
+        if path.exists():
+            try:
+                df = pd.concat([pd.read_csv(path, dtype=str, keep_default_na=False), df],
+                               ignore_index=True, sort=False)
+            except pd.errors.EmptyDataError:
+                pass
+        df.to_csv(path, index=False)
+
+        manifest = self.manifest()
+        manifest["partitions"] = [p for p in manifest["partitions"] if p["date"] != date]
+        manifest["partitions"].append({
+            "date": date,
+            "path": path.name,
+            "rows": int(len(df)),
+            "columns": [str(c) for c in df.columns],
+            "updated_at": _utc_now().isoformat(),
+        })
+        self._write_manifest(manifest)
+        return path
+
+    def append(self, df: pd.DataFrame, now: Optional[datetime] = None) -> Path:
+        """Stamp a snapshot with Scrape Date / Scraped At UTC and append it."""
+        now = now or _utc_now()
+        df = df.copy()
+        df[PARTITION_KEY] = now.strftime("%Y-%m-%d")
+        df[SCRAPED_AT] = now.strftime(TIMESTAMP_FORMAT)
+        return self.write_partition(df, now.strftime("%Y-%m-%d"))
+
+    def partitions(self, start: Optional[str] = None, end: Optional[str] = None) -> List[Dict[str, Any]]:
+        return [
+            p for p in self.manifest()["partitions"]
+            if (start is None or p["date"] >= start) and (end is None or p["date"] <= end)
+        ]
+
+    def iter_frames(
+        self,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        columns: Optional[List[str]] = None,
+    ) -> Iterator[pd.DataFrame]:
+        """One DataFrame per day, oldest first, read only when reached."""
+        for p in self.partitions(start, end):
+            usecols = None
+            if columns is not None:
+                usecols = [c for c in columns if c in p["columns"]]
+            df = pd.read_csv(self.directory / p["path"], dtype=str, keep_default_na=False, usecols=usecols)
+            if columns is not None:
+                df = df.reindex(columns=columns, fill_value="")
+            yield df
+
+    def read(
+        self,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        columns: Optional[List[str]] = None,
+    ) -> pd.DataFrame:
+        """The history between start and end (inclusive) as one table."""
+        frames = list(self.iter_frames(start, end, columns))
+        if not frames:
+            return pd.DataFrame(columns=columns or [])
+        return pd.concat(frames, ignore_index=True, sort=False).fillna("")
+
+    def migrate_csv(self, legacy_csv: Path) -> int:
+        """
+        Split a single-file history (the old layout) into day partitions,
+        then remove it. Returns the number of rows moved.
+        """
+        legacy_csv = Path(legacy_csv)
+        if not legacy_csv.exists():
+            return 0
+        try:
+            df = pd.read_csv(legacy_csv, dtype=str, keep_default_na=False)
+        except pd.errors.EmptyDataError:
+            legacy_csv.unlink()
+            return 0
+        if PARTITION_KEY not in df.columns:
+            raise RuntimeError(f"{legacy_csv} has no {PARTITION_KEY!r} column to partition on")
+
+        for date, part in df.groupby(PARTITION_KEY, sort=True):
+            self.write_partition(part.reset_index(drop=True), str(date))
+        legacy_csv.unlink()
+        return int(len(df))
+
+
+def _end_of(when: str) -> str:
+    """A date means the end of that day; timestamps are used as given."""
+    return f"{when} 23:59:59" if len(when) == 10 else when
+
+
+class VersionedHistory(PartitionedHistory):
+    """
+    Change-only (SCD type 2) history keyed by one column. A snapshot adds
+    a version only for rows whose data columns differ from their current
+    version; each version carries Valid From / Valid To timestamps.
+
+    Open versions (blank Valid To) live in current.csv, rewritten each
+    run. A version that's superseded, or whose key left the watched set,
+    is appended to the partition of the day it closed and never touched
+    again, so an as-of read only opens the partitions closed since then.
+    """
+
+    partition_key = VALID_TO
+
+    def __init__(self, directory: Path, key: str, dataset: str = ""):
+        super().__init__(directory, dataset)
+        self.key = key
+
+    def _empty_manifest(self) -> Dict[str, Any]:
+        return {**super()._empty_manifest(), "layout": "scd2", "key": self.key, "current": {"rows": 0}}
+
+    @property
+    def current_path(self) -> Path:
+        return self.directory / CURRENT_FILENAME
+
+    def current(self) -> pd.DataFrame:
+        """The open version of every key."""
+        if not self.current_path.exists():
+            return pd.DataFrame(columns=[self.key, VALID_FROM, VALID_TO])
+        return pd.read_csv(self.current_path, dtype=str, keep_default_na=False)
+
+    def _write_current(self, df: pd.DataFrame, now: datetime) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp = self.current_path.with_suffix(".csv.tmp")
+        df.to_csv(tmp, index=False)
+        tmp.replace(self.current_path)
+        manifest = self.manifest()
+        manifest["current"] = {"rows": int(len(df)), "updated_at": now.isoformat()}
+        self._write_manifest(manifest)
+
+    def append(
+        self,
+        df: pd.DataFrame,
+        now: Optional[datetime] = None,
+        present: Optional[Iterable[str]] = None,
+    ) -> Dict[str, int]:
+        """
+        Record a snapshot. Keys in `present` (the watched set) but missing
+        from `df` (e.g. a failed page) keep their open version; open keys
+        not in `present` are closed. Returns counts of versions opened
+        for new keys, changed keys, closed keys and unchanged keys.
+        """
+        now = now or _utc_now()
+        stamp = now.strftime(TIMESTAMP_FORMAT)
+        meta = {VALID_FROM, VALID_TO, PARTITION_KEY, SCRAPED_AT}
+
+        old = self.current()
+        if self.key not in df.columns:
+            df = pd.DataFrame(columns=[self.key])
+        new = df.drop(columns=[c for c in df.columns if c in meta]).fillna("").astype(str)
+        new = new.drop_duplicates(subset=[self.key], keep="last")
+        data_cols = [c for c in new.columns if c != self.key]
+        data_cols += [c for c in old.columns if c not in meta and c != self.key and c not in data_cols]
+        columns = [self.key] + data_cols
+
+        old_k = old.reindex(columns=columns + [VALID_FROM], fill_value="").set_index(self.key)
+        new_k = new.reindex(columns=columns, fill_value="").set_index(self.key)
+
+        common = new_k.index.intersection(old_k.index, sort=False)
+        differs = new_k.loc[common, data_cols].ne(old_k.loc[common, data_cols]).any(axis=1)
+        changed = common[differs.to_numpy()]
+        added = new_k.index.difference(old_k.index, sort=False)
+        gone = old_k.index.difference(new_k.index, sort=False)
+        gone = gone[~gone.isin(set(present))] if present is not None else gone[:0]
+
+        closing = changed.append(gone)
+        if len(closing):
+            closed = old_k.loc[closing].reset_index().assign(**{VALID_TO: stamp})
+            self.write_partition(closed[columns + [VALID_FROM, VALID_TO]], now.strftime("%Y-%m-%d"))
+
+        if len(closing) or len(added) or not self.current_path.exists():
+            # changed keys keep their place in current.csv; new keys go last
+            current = old_k.drop(index=gone)
+            current.loc[changed, data_cols] = new_k.loc[changed, data_cols]
+            current.loc[changed, VALID_FROM] = stamp
+            current = pd.concat([current, new_k.loc[added].assign(**{VALID_FROM: stamp})])
+            current = current.reset_index().assign(**{VALID_TO: ""})
+            self._write_current(current[columns + [VALID_FROM, VALID_TO]], now)
+        return {
+            "new": int(len(added)),
+            "changed": int(len(changed)),
+            "closed": int(len(gone)),
+            "unchanged": int(len(common) - len(changed)),
+        }
+
+    def versions(self, start: Optional[str] = None, end: Optional[str] = None) -> pd.DataFrame:
+        """Closed versions from partitions start..end, plus every open version."""
+        frames = [self.read(start, end), self.current()]
+        df = pd.concat([f for f in frames if len(f.columns)], ignore_index=True, sort=False).fillna("")
+        # columns added since a version closed go before the validity columns
+        data_cols = [c for c in df.columns if c not in (VALID_FROM, VALID_TO)]
+        return df[data_cols + [VALID_FROM, VALID_TO]]
+
+    def as_of(self, when: str) -> pd.DataFrame:
+        """
+        The snapshot as it stood at `when` (a date means the end of that
+        day): for every key, the version valid then, with its Valid From.
+        """
+        at = _end_of(when)
+        df = self.versions(start=at[:10])
+        if df.empty:
+            return df.drop(columns=[VALID_TO], errors="ignore")
+        valid = (df[VALID_FROM] <= at) & ((df[VALID_TO] == "") | (df[VALID_TO] > at))
+        out = df.loc[valid].drop(columns=[VALID_TO])
+        return out.sort_values(self.key, kind="mergesort").reset_index(drop=True)
+
+    def replay(self, snapshots: Iterable[pd.DataFrame]) -> int:
+        """
+        Load full snapshots (the old history layout: one row per key per
+        run, stamped Scraped At UTC) oldest first. Returns rows read.
+        """
+        rows = 0
+        for df in snapshots:
+            rows += len(df)
+            if SCRAPED_AT in df.columns:
+                runs = df[SCRAPED_AT]
+            else:
+                runs = df[PARTITION_KEY] + " 00:00:00"
+            for stamp, part in df.groupby(runs, sort=True):
+                now = datetime.strptime(str(stamp), TIMESTAMP_FORMAT).replace(tzinfo=timezone.utc)
+                self.append(part, now=now)
+        return rows
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Read a partitioned history as one table.")
+    parser.add_argument("directory", help="history directory (holds manifest.json)")
+    parser.add_argument("--from", dest="start", default=None, help="first partition date (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="end", default=None, help="last partition date (YYYY-MM-DD)")
+    parser.add_argument("--as-of", default=None,
+                        help="change-only history: the snapshot at this date / 'YYYY-MM-DD HH:MM:SS'")
+    parser.add_argument("--out", default=None, help="write the combined table to this CSV")
+    args = parser.parse_args(argv)
+
+    history = PartitionedHistory(Path(args.directory))
+    manifest = history.manifest()
+    if manifest.get("layout") == "scd2":
+        history = VersionedHistory(Path(args.directory), key=manifest["key"])
+    parts = history.partitions(args.start, args.end)
+    print(f"{len(parts)} partitions, {sum(p['rows'] for p in parts)} rows")
+
+    if args.as_of is not None:
+        if not isinstance(history, VersionedHistory):
+            parser.error("--as-of needs a change-only (scd2) history")
+        df = history.as_of(args.as_of)
+        print(f"{len(df)} rows as of {args.as_of}")
+    elif isinstance(history, VersionedHistory):
+        df = history.versions(args.start, args.end)
+    else:
+        df = history.read(args.start, args.end)
+    if args.out:
+        df.to_csv(args.out, index=False)
+        print(f"Wrote {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,330 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Dict, Any, Iterable, List, Optional, Set, Tuple
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+import hashlib
+import os
+import threading
+
+import pandas as pd
+
+from scraper.entities import canonical_url, canonicalize_columns
+from scraper.sinks import CsvSink, SpooledFrame, csv_frame
+
+if TYPE_CHECKING:
+    from scraper.store import Store
+
+
+INCREMENTAL = os.getenv("INCREMENTAL", "0") == "1"
+MAX_AGE_DAYS = float(os.getenv("INCREMENTAL_MAX_AGE_DAYS", "7"))
+
+STATE_FILENAME = "crawl_state.csv"
+STATE_COLUMNS = ["URL", "Fetched At (UTC)"]
+
+
+def _utc_now() -> datetime:
+    return datetime.now(timezone.utc).replace(microsecond=0)
+
+
+def _read_csv(path: Path) -> pd.DataFrame:
+    if not path.exists():
+        return pd.DataFrame()
+    try:
+        return pd.read_csv(path, dtype=str, keep_default_na=False)
+    except pd.errors.EmptyDataError:
+        return pd.DataFrame()
+
+
+def crew_fingerprint(rank: Any, members: Any, fame: Any) -> str:
+    """Flag-page fingerprint of one crew: rank, member count and fame."""
+    raw = "|".join(str(v if v is not None else "").strip() for v in (rank, members, fame))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def roster_hash(pirate_urls: Iterable[str]) -> str:
+    raw = "\n".join(sorted(str(u).strip() for u in pirate_urls))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class CrawlState:
+    """
+    When each crew / pirate URL was last actually fetched. Carried-forward
+    rows keep their old time, so the max-age check eventually forces a
+    re-fetch even for crews that never change.
+    """
+
+    def __init__(self, fetched_at: Optional[Dict[str, str]] = None):
+        self._fetched_at: Dict[str, str] = dict(fetched_at or {})
+        self._lock = threading.Lock()
+        self._now = _utc_now()
+
+    @classmethod
+    def load(cls, output_dir: Path) -> "CrawlState":
+        df = _read_csv(Path(output_dir) / STATE_FILENAME)
+        if df.empty or not set(STATE_COLUMNS).issubset(df.columns):
+            return cls()
+        return cls(dict(zip(df["URL"].map(canonical_url), df["Fetched At (UTC)"])))
+
+    def mark(self, url: str) -> None:
+        with self._lock:
+            self._fetched_at[url] = self._now.isoformat()
+
+    def is_stale(self, url: str, max_age_days: float = MAX_AGE_DAYS) -> bool:
+        stamp = self._fetched_at.get(url, "")
+        if not stamp:
+            return True
+        try:
+            fetched = datetime.fromisoformat(stamp)
+        except ValueError:
+            return True
+        if fetched.tzinfo is None:
+            fetched = fetched.replace(tzinfo=timezone.utc)
+        return (self._now - fetched) >= timedelta(days=max_age_days)
+
+    def to_df(self, keep: Optional[Set[str]] = None) -> pd.DataFrame:
+        with self._lock:
+            items = sorted(
+                (url, stamp) for url, stamp in self._fetched_at.items()
+                if keep is None or url in keep
+            )
+        return pd.DataFrame(items, columns=STATE_COLUMNS)
+
+
+# Previous datasets compared row by row or carried forward a chunk at a
+# time; they're copied to the run's scratch store, not read into frames
+SNAPSHOT_DATASETS = ["crews", "pirates", "shoppes"]
+
+
+@dataclass
+class Previous:
+    """
+    Outputs of the last run, read back from the output dir. The datasets
+    the page stages plan from are DataFrames; SNAPSHOT_DATASETS are
+    copied into `snapshot` (a scratch store in the spool) and read with
+    frame() / lookup().
+    """
+
+    crews_df: pd.DataFrame
+    crew_details_df: pd.DataFrame
+    pirate_urls_df: pd.DataFrame
+    snapshot: "Store"
+
+    @classmethod
+    def load(cls, output_dir: Path, snapshot: "Store", store: Optional["Store"] = None) -> "Previous":
+        """From the data store where it has the dataset, else the CSV export."""
+        output_dir = Path(output_dir)
+
+        def source(name: str) -> Optional[SpooledFrame]:
+            if store is not None and name in store:
+                return store.frame(name).map(lambda chunk: chunk.fillna(""))
+            return csv_frame(output_dir / f"{name}.csv")
+
+        def read(name: str) -> pd.DataFrame:
+            if store is not None and name in store:
+                df = store.read(name).fillna("")
+            else:
+                df = _read_csv(output_dir / f"{name}.csv")
+            # outputs from before canonical URLs still match this run's rows
+            return canonicalize_columns(df)
+
+        copies = {}
+        for name in SNAPSHOT_DATASETS:
+            frame = source(name)
+            if frame is not None:
+                copies[name] = frame.map(canonicalize_columns)
+        snapshot.write(copies)
+
+        return cls(
+            crews_df=read("crews"),
+            crew_details_df=read("crew_details"),
+            pirate_urls_df=read("pirate_urls"),
+            snapshot=snapshot,
+        )
+
+    def frame(self, name: str) -> SpooledFrame:
+        """A snapshot dataset (no columns or rows if the last run didn't have it)."""
+        if name not in self.snapshot:
+            return SpooledFrame([], lambda: iter(()), 0)
+        return self.snapshot.frame(name)
+
+    def lookup(self, name: str, column: str, values: Iterable[str]) -> pd.DataFrame:
+        """Rows of a snapshot dataset whose `column` is one of `values` (at most CHUNK_ROWS), in written order."""
+        columns = self.frame(name).columns
+        if column not in columns:
+            return pd.DataFrame(columns=columns)
+        return self.snapshot.lookup(name, column, values)
+
+    def keys(self, name: str, column: str) -> Set[str]:
+        """Every value of `column` in a snapshot dataset."""
+        found: Set[str] = set()
+        for chunk in self.frame(name).chunks():
+            found.update(chunk.get(column, []))
+        return found
+
+    def carry(self, name: str, key: str, values: Set[str], sink: CsvSink) -> int:
+        """Copy the rows of a snapshot dataset whose `key` is in `values` into `sink`. Returns the rows copied."""
+        copied = 0
+        if values:
+            for chunk in self.frame(name).chunks():
+                rows = self.rows_for(chunk, key, values, sink.columns)
+                sink.write_frame(rows)
+                copied += len(rows)
+        return copied
+
+    def crew_fingerprints(self) -> Dict[str, str]:
+        df = self.crews_df
+        if df.empty or "Crew URL" not in df.columns:
+            return {}
+        return {
+            rec["Crew URL"]: crew_fingerprint(rec.get("Rank"), rec.get("Members"), rec.get("Fame"))
+            for rec in df.to_dict("records")
+        }
+
+    def roster_hashes(self) -> Dict[str, str]:
+        df = self.pirate_urls_df
+        if df.empty or not {"Crew URL", "Pirate URL"}.issubset(df.columns):
+            return {}
+        return {
+            crew_url: roster_hash(group["Pirate URL"])
+            for crew_url, group in df.groupby("Crew URL", sort=False)
+        }
+
+    @staticmethod
+    def rows_for(df: pd.DataFrame, key: str, values: Set[str], columns: List[str]) -> pd.DataFrame:
+        """Rows of a previous output whose `key` is in `values`, cut to `columns`."""
+        if df.empty or key not in df.columns or not values:
+            return pd.DataFrame(columns=columns)
+        out = df.loc[df[key].isin(values)].copy()
+        for c in columns:
+            if c not in out.columns:
+                out[c] = ""
+        return out[columns].reset_index(drop=True)
+
+
+def order_by(df: pd.DataFrame, key: str, order: List[str]) -> pd.DataFrame:
+    """Rows stably sorted into `order` of `key`; unknown keys go last."""
+    rank = {value: i for i, value in enumerate(order)}
+    pos = df[key].map(rank).fillna(len(rank))
+    return df.iloc[pos.argsort(kind="stable")].reset_index(drop=True)
+
+
+def merge_carried(fresh: pd.DataFrame, carried: pd.DataFrame, key: str, order: List[str]) -> pd.DataFrame:
+    """Fresh + carried rows, stably sorted back into `order` of `key`."""
+    if carried.empty:
+        return fresh
+    return order_by(pd.concat([fresh, carried], ignore_index=True), key, order)
+
+
+def plan_crews(
+    crews_df: pd.DataFrame,
+    previous: Previous,
+    state: CrawlState,
+) -> Tuple[List[str], Set[str], Set[str]]:
+    """
+    Decide which crew pages to fetch.
+
+    Returns (to_fetch, carried, fingerprint_changed). A crew is carried
+    forward when its flag-page fingerprint matches the last run, the
+    last run has rows for it, and its last fetch is within max age.
+    """
+    prev_fingerprints = previous.crew_fingerprints()
+    prev_details = set(previous.crew_details_df.get("Crew URL", pd.Series(dtype=str)))
+
+    to_fetch: List[str] = []
+    carried: Set[str] = set()
+    fingerprint_changed: Set[str] = set()
+
+    seen: Set[str] = set()
+    for rec in crews_df.to_dict("records"):
+        crew_url = str(rec.get("Crew URL") or "").strip()
+        if not crew_url or crew_url in seen:
+            continue
+        seen.add(crew_url)
+
+        fingerprint = crew_fingerprint(rec.get("Rank"), rec.get("Members"), rec.get("Fame"))
+        if prev_fingerprints.get(crew_url) != fingerprint:
+            fingerprint_changed.add(crew_url)
+            to_fetch.append(crew_url)
+        elif crew_url not in prev_details or state.is_stale(crew_url):
+            to_fetch.append(crew_url)
+        else:
+            carried.add(crew_url)
+
+    return to_fetch, carried, fingerprint_changed
+
+
+def changed_rosters(pirate_urls_df: pd.DataFrame, previous: Previous, crew_urls: Iterable[str]) -> Set[str]:
+    """Crews (among crew_urls) whose freshly parsed roster differs from the last run."""
+    prev_hashes = previous.roster_hashes()
+    fresh = pirate_urls_df.loc[pirate_urls_df["Crew URL"].isin(set(crew_urls))]
+    fresh_hashes = {
+        crew_url: roster_hash(group["Pirate URL"])
+        for crew_url, group in fresh.groupby("Crew URL", sort=False)
+    }
+    return {
+        crew_url for crew_url in crew_urls
+        if fresh_hashes.get(crew_url, roster_hash([])) != prev_hashes.get(crew_url)
+    }
+
+
+def pirate_needs_fetch(
+    url: str,
+    crew_url: Optional[str],
+    prev_pirates: Set[str],
+    changed_crews: Set[str],
+    state: CrawlState,
+) -> bool:
+    """New pirates, members of changed crews and anything past max age."""
+    return url not in prev_pirates or crew_url in changed_crews or state.is_stale(url)
+
+
+def plan_pirates(
+    pirate_urls_df: pd.DataFrame,
+    previous: Previous,
+    state: CrawlState,
+    changed_crews: Set[str],
+) -> Tuple[List[str], Set[str]]:
+    """
+    Decide which pirate pages to fetch: new pirates, members of crews that
+    changed (fingerprint or roster) and anything past max age. Everyone
+    else is carried forward. Returns (to_fetch, carried).
+    """
+    prev_pirates = previous.keys("pirates", "Pirate URL")
+
+    to_fetch: List[str] = []
+    carried: Set[str] = set()
+    seen: Set[str] = set()
+    for rec in pirate_urls_df.to_dict("records"):
+        url = str(rec.get("Pirate URL") or "").strip()
+        if not url or url in seen:
+            continue
+        seen.add(url)
+
+        if pirate_needs_fetch(url, rec.get("Crew URL"), prev_pirates, changed_crews, state):
+            to_fetch.append(url)
+        else:
+            carried.add(url)
+
+    return to_fetch, carried
+
+
+def load(
+    output_dir: Path,
+    snapshot: "Store",
+    enabled: bool = INCREMENTAL,
+    store: Optional["Store"] = None,
+) -> Dict[str, Any]:
+    """
+    ctx.data["incremental"]: the crawl state and last run's outputs.
+    "previous" (what the page stages carry rows from) is only set when
+    enabled; "baseline" is always there for the change log.
+    """
+    baseline = Previous.load(output_dir, snapshot, store)
+    return {
+        "enabled": enabled,
+        "state": CrawlState.load(output_dir),
+        "previous": baseline if enabled else None,
+        "baseline": baseline,
+    }
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+from typing import Dict, Any, Iterator, Optional, Set
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+import json
+import os
+import resource
+import sys
+import time
+
+
+HISTORY_FILENAME = "meta_history.jsonl"
+
+
+def _utc_now() -> str:
+    return datetime.now(timezone.utc).replace(microsecond=0).isoformat()
+
+
+def peak_rss_mb() -> float:
+    """High-water resident set size of this process so far."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def meta_path(output_dir: Path) -> Path:
+    """META_PATH, or meta.json in the output dir."""
+    return Path(os.getenv("META_PATH", str(Path(output_dir) / "meta.json")))
+
+
+def stage_meta(result: Any) -> Dict[str, Any]:
+    """
+    A stage's "meta" dict, with the metas of any datasets it returned
+    (crew_pages -> crew_details / pirate_urls, ...) nested under their
+    names. "failures" counts each failed page once: a crew or pirate
+    page that failed to fetch is listed in both datasets' failures.
+    """
+    if not isinstance(result, dict):
+        return {}
+    out: Dict[str, Any] = dict(result.get("meta") or {})
+    failures = int(out.get("failures", 0) or 0)
+    failed_urls: Set[str] = set()
+    for name, value in result.items():
+        if name != "meta" and isinstance(value, dict) and isinstance(value.get("meta"), dict):
+            out[name] = dict(value["meta"])
+            frames = [v for k, v in value.items() if k.endswith("_failures_df")]
+            if not frames:
+                failures += int(value["meta"].get("failures", 0) or 0)
+            for frame in frames:
+                # failure rows are keyed by the page URL, in their first column
+                if len(frame.columns):
+                    failed_urls.update(frame.iloc[:, 0].astype(str))
+    out["failures"] = failures + len(failed_urls)
+    return out
+
+
+class RunReport:
+    """
+    Timings and counters for one pipeline run. Each stage runs inside
+    stage(), which records wall time, CPU time and the peak RSS reached
+    by the time the stage ends. A stage's CPU time is its own thread's
+    plus what its FetchStats counted on fetch workers and in the parse
+    pool, so stages running side by side don't share one clock.
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.started_at = _utc_now()
+        self.config = dict(config or {})
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self.outputs: Dict[str, int] = {}
+        self.extra: Dict[str, Any] = {}
+        self.status = "running"
+        self.error = ""
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[Dict[str, Any]]:
+        record: Dict[str, Any] = {"started_at": _utc_now()}
+        self.stages[name] = record
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield record
+        except Exception as e:
+            record["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            record["wall_s"] = round(time.perf_counter() - wall, 3)
+            record["cpu_s"] = round(
+                time.thread_time() - cpu + record.get("worker_cpu_s", 0) + record.get("parse_pool_cpu_s", 0), 3
+            )
+            record["peak_rss_mb"] = peak_rss_mb()
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        self.status = "failed" if error is not None else "ok"
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+
+    def as_dict(self) -> Dict[str, Any]:
+        totals = {
+            key: sum(int(s.get(key, 0) or 0) for s in self.stages.values())
+            for key in ("requests", "bytes", "request_errors", "failures", "pages_parsed")
+        }
+        return {
+            "started_at": self.started_at,
+            "finished_at": _utc_now(),
+            "status": self.status,
+            "error": self.error,
+            "wall_s": round(time.perf_counter() - self._wall, 3),
+            # this process's threads, plus the parse pool's processes
+            "cpu_s": round(
+                time.process_time() - self._cpu
+                + sum(s.get("parse_pool_cpu_s", 0) for s in self.stages.values()), 3
+            ),
+            "peak_rss_mb": peak_rss_mb(),
+            **totals,
+            "config": self.config,
+            "stages": self.stages,
+            "outputs": self.outputs,
+            **self.extra,
+        }
+
+    def summary_lines(self) -> Iterator[str]:
+        yield f"{'stage':<14} {'wall s':>8} {'cpu s':>8} {'requests':>9} {'p95 s':>7} {'parse s':>8} {'failures':>9}"
+        for name, s in self.stages.items():
+            yield (
+                f"{name:<14} {s.get('wall_s', 0):>8.2f} {s.get('cpu_s', 0):>8.2f} "
+                f"{s.get('requests', 0):>9} {s.get('fetch_latency_p95_s', 0):>7.3f} "
+                f"{s.get('parse_seconds', 0):>8.2f} {s.get('failures', 0):>9}"
+            )
+
+
+def write_report(report: Dict[str, Any], path: Path) -> None:
+    """Write the run report to `path` and append it to the history next to it."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(report, indent=2, default=str) + "\n", encoding="utf-8")
+    with open(path.parent / HISTORY_FILENAME, "a", encoding="utf-8") as f:
+        f.write(json.dumps(report, default=str, separators=(",", ":")) + "\n")
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+from typing import Dict, Any, Callable, IO, List, Optional
+from datetime import datetime, timezone
+from pathlib import Path
+import hashlib
+import json
+import threading
+
+import pandas as pd
+
+
+MANIFEST_FILENAME = "outputs_manifest.json"
+
+# Row order each dataset is written in, so the same data always gives
+# the same file regardless of page or fetch order. Missing columns are
+# skipped; files not listed keep the order they were built in.
+SORT_KEYS: Dict[str, List[str]] = {
+    "crews.csv": ["Crew URL"],
+    "crew_details.csv": ["Crew URL"],
+    "pirate_urls.csv": ["Crew URL", "Pirate URL"],
+    "pirates.csv": ["Pirate URL"],
+    "shoppes.csv": ["Shop Key", "Pirate Name", "Ownership Role"],
+    "skill_levels.csv": ["Pirate URL"],
+    "crew_failures.csv": ["Crew URL"],
+    "pirate_urls_failures.csv": ["Crew URL"],
+    "pirates_failures.csv": ["Pirate URL"],
+    "shoppes_failures.csv": ["Pirate URL"],
+    # the keys of changes.CHANGE_LOGS (the logs are built a chunk at a time)
+    "crews_changes.csv": ["Crew URL"],
+    "pirates_changes.csv": ["Pirate URL"],
+    "shoppes_changes.csv": ["Shop Key", "Pirate Name"],
+}
+
+# Rows formatted / hashed / written at a time, so a dataset is never
+# held a second time as one CSV string (see scraper.store too)
+CHUNK_ROWS = 2_000
+
+# Rewritten on every run (fetch times) and not part of the published
+# data; kept out of the manifest so it doesn't change the manifest too
+BOOKKEEPING = {"crawl_state.csv"}
+
+# external writes its latest snapshot while the flag stages are writing theirs
+_lock = threading.Lock()
+
+
+def _utc_now() -> str:
+    return datetime.now(timezone.utc).replace(microsecond=0).isoformat()
+
+
+def _sort_positions(df: pd.DataFrame, keys: List[str]) -> pd.Index:
+    """Row positions of `df` in stable_order, worked out on the key columns alone."""
+    return df[keys].reset_index(drop=True).sort_values(keys, kind="mergesort", key=lambda s: s.astype(str)).index
+
+
+def stable_order(df: pd.DataFrame, keys: Optional[List[str]]) -> pd.DataFrame:
+    keys = [k for k in (keys or []) if k in df.columns]
+    if not keys or df.empty:
+        return df
+    return df.take(_sort_positions(df, keys)).reset_index(drop=True)
+
+
+def read_manifest(directory: Path) -> Dict[str, Any]:
+    path = Path(directory) / MANIFEST_FILENAME
+    if not path.exists():
+        return {"files": {}}
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def _write_manifest(directory: Path, manifest: Dict[str, Any]) -> None:
+    manifest["files"] = dict(sorted(manifest["files"].items()))
+    path = Path(directory) / MANIFEST_FILENAME
+    tmp = path.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(manifest, indent=2) + "\n", encoding="utf-8")
+    tmp.replace(path)
+
+
+class _HashingFile:
+    """Text file that hashes what is written to it."""
+
+    def __init__(self, f: IO[str]):
+        self._f = f
+        self.sha256 = hashlib.sha256()
+
+    def write(self, text: str) -> int:
+        self.sha256.update(text.encode("utf-8"))
+        return self._f.write(text)
+
+
+def publish(path: Path, write: Callable[[IO[str]], int], columns: List[str]) -> bool:
+    """
+    Write a file with `write` (which returns the rows it wrote) unless
+    `path` already holds the same content.
+
+    The content is written to a temporary file next to `path` and hashed
+    as it goes; the hash, row count and the time the content last
+    changed are kept per file in the manifest. Returns True if the file
+    was (re)written.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8", newline="") as f:
+        out = _HashingFile(f)
+        rows = write(out)
+    digest = out.sha256.hexdigest()
+
+    with _lock:
+        manifest = read_manifest(path.parent)
+        entry = manifest["files"].get(path.name, {})
+        if entry.get("sha256") == digest and path.exists():
+            tmp.unlink()
+            return False
+
+        tmp.replace(path)
+        manifest["files"][path.name] = {
+            "sha256": digest,
+            "rows": int(rows),
+            "columns": [str(c) for c in columns],
+            "updated_at": _utc_now(),
+        }
+        _write_manifest(path.parent, manifest)
+    return True
+
+
+def write_csv(df: pd.DataFrame, path: Path, sort_keys: Optional[List[str]] = None) -> bool:
+    """Write `df` to `path` in a stable row order unless the file already holds the same data (see publish)."""
+    # stable_order's rows, taken a chunk at a time rather than as a sorted copy of `df`
+    keys = [k for k in (sort_keys or []) if k in df.columns]
+    order = _sort_positions(df, keys) if keys else pd.RangeIndex(len(df))
+
+    def write(f: IO[str]) -> int:
+        for start in range(0, max(len(df), 1), CHUNK_ROWS):
+            df.take(order[start:start + CHUNK_ROWS]).to_csv(f, index=False, header=start == 0)
+        return len(df)
+
+    return publish(path, write, [str(c) for c in df.columns])
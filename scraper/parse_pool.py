@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+from typing import Any, Callable, Optional, Tuple, TypeVar
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+import threading
+import time
+
+from scraper import parsing
+from scraper.fetch import FetchResult, FetchStats
+
+
+# Processes that build soups and run the extractors. 0 parses on the
+# fetch worker threads themselves (one core's worth, because of the GIL).
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", "0"))
+
+R = TypeVar("R")
+
+# fn(page text, url, stats) -> plain rows; must be a module-level function
+ParseFn = Callable[[str, str, Optional[FetchStats]], R]
+
+_POOL: Optional[ProcessPoolExecutor] = None
+_POOL_LOCK = threading.Lock()
+
+
+def _init_worker(backend: str, partial: bool) -> None:
+    # spawned workers start from module defaults, not the parent's CLI flags
+    parsing.set_backend(backend)
+    parsing.set_partial_parse(partial)
+
+
+def _parse_in_worker(fn: ParseFn, content: bytes, encoding: str, url: str) -> Tuple[Any, int, float, float]:
+    # one task at a time per worker, so the process's CPU time is this page's
+    cpu = time.process_time()
+    stats = FetchStats()
+    text = FetchResult(url=url, status_code=200, content=content, encoding=encoding).text
+    result = fn(text, url, stats)
+    # FetchStats holds a lock and can't be sent back; its parse counters can
+    return result, stats.pages_parsed, stats.parse_seconds, time.process_time() - cpu
+
+
+def configure(workers: int = PARSE_WORKERS) -> None:
+    """(Re)start the parse pool with `workers` processes (0: parse in-thread)."""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is not None:
+            _POOL.shutdown(wait=True)
+            _POOL = None
+        if workers > 0:
+            _POOL = ProcessPoolExecutor(
+                max_workers=workers,
+                # fork would copy the parent's fetch threads' locks mid-use
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(parsing.get_backend(), parsing.is_partial_parse()),
+            )
+
+
+def shutdown() -> None:
+    configure(0)
+
+
+def parse(fn: ParseFn, page: FetchResult, stats: Optional[FetchStats] = None) -> R:
+    """
+    Run a parse function over a fetched page: in the parse pool when
+    there is one (only the raw bytes go out and plain rows come back),
+    otherwise right here. Blocks the calling fetch thread either way.
+    """
+    with _POOL_LOCK:
+        pool = _POOL
+    if pool is None:
+        return fn(page.text, page.url, stats)
+
+    result, pages, seconds, cpu = pool.submit(_parse_in_worker, fn, page.content, page.encoding, page.url).result()
+    if stats is not None:
+        if pages:
+            stats.record_parse(seconds, pages)
+        stats.record_cpu(cpu, pool=True)
+    return result
@@ -0,0 +1,276 @@
+from __future__ import annotations
+
+from typing import Dict, Any, Callable, List, Optional, Sequence, Tuple
+from dataclasses import dataclass
+from pathlib import Path
+import argparse
+import importlib.util
+import os
+import re
+import time
+
+from bs4 import BeautifulSoup
+
+
+# bs4 tree builders we allow. Every extractor is written against the bs4
+# API, so swapping the builder (not the library) keeps them unchanged.
+BACKENDS = ["html.parser", "lxml", "html5lib"]
+
+DEFAULT_BACKEND = os.getenv("HTML_PARSER", "html.parser")
+
+# Build only the regions an extractor declares instead of the whole page
+PARTIAL_PARSE = os.getenv("PARTIAL_PARSE", "0") == "1"
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures" / "pages"
+
+_backend = DEFAULT_BACKEND
+_partial = PARTIAL_PARSE
+
+
+@dataclass(frozen=True)
+class Region:
+    """
+    A slice of raw HTML an extractor needs.
+
+    `anchor` is a regex locating the region. With `tag`, the region is the
+    first <tag> element starting at or after the anchor, up to its balanced
+    closing tag. With `until`, it runs from the anchor to the start of the
+    `until` match (or to the end of the page when `until` isn't found).
+    """
+
+    anchor: str
+    tag: str = ""
+    until: str = ""
+
+
+# How a cut-out element must be wrapped so every tree builder keeps it
+# (lxml drops a bare <td> that isn't inside a table row).
+_WRAPPERS = {
+    "td": ("<table><tr>", "</tr></table>"),
+    "th": ("<table><tr>", "</tr></table>"),
+    "tr": ("<table>", "</table>"),
+}
+
+
+def _balanced_end(html: str, start: int, tag: str) -> Optional[int]:
+    depth = 0
+    for m in re.finditer(rf"<(/?){tag}\b[^>]*>", html[start:], re.I):
+        depth += -1 if m.group(1) else 1
+        if depth == 0:
+            return start + m.end()
+    return None
+
+
+def _locate(html: str, region: Region) -> Optional[Tuple[int, int, str]]:
+    anchor = re.search(region.anchor, html, re.I)
+    if not anchor:
+        return None
+
+    if region.until:
+        stop = re.compile(region.until, re.I).search(html, anchor.start())
+        return anchor.start(), (stop.start() if stop else len(html)), ""
+
+    opening = re.compile(rf"<{region.tag}\b", re.I).search(html, anchor.start())
+    if not opening:
+        return None
+    end = _balanced_end(html, opening.start(), region.tag)
+    if end is None:
+        return None
+    return opening.start(), end, region.tag.lower()
+
+
+def cut_regions(html: str, regions: Sequence[Region]) -> Optional[str]:
+    """
+    Raw HTML reduced to the declared regions, in document order, or None if
+    any region can't be located (the caller then parses the full page).
+    """
+    spans: List[Tuple[int, int, str]] = []
+    for region in regions:
+        span = _locate(html, region)
+        if span is None:
+            return None
+        spans.append(span)
+
+    spans.sort()
+    if len(spans) == 1 and spans[0][0] == 0 and not spans[0][2]:
+        # a leading prefix of the page is already a document
+        return html[:spans[0][1]]
+
+    parts: List[str] = []
+    last_end = -1
+    for start, end, tag in spans:
+        if start < last_end:
+            # nested in (or overlapping) a region we already kept
+            if end <= last_end:
+                continue
+            return None
+        before, after = _WRAPPERS.get(tag, ("", ""))
+        parts.append(before + html[start:end] + after)
+        last_end = end
+
+    return "<html><body>" + "\n".join(parts) + "</body></html>"
+
+
+def available_backends() -> List[str]:
+    out = ["html.parser"]
+    for name in ("lxml", "html5lib"):
+        if importlib.util.find_spec(name) is not None:
+            out.append(name)
+    return out
+
+
+def set_partial_parse(enabled: bool) -> None:
+    global _partial
+    _partial = bool(enabled)
+
+
+def set_backend(name: str) -> None:
+    global _backend
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown HTML parser backend {name!r}; expected one of {BACKENDS}")
+    if name not in available_backends():
+        raise RuntimeError(f"HTML parser backend {name!r} is not installed")
+    _backend = name
+
+
+def get_backend() -> str:
+    return _backend
+
+
+def is_partial_parse() -> bool:
+    return _partial
+
+
+def make_soup(
+    html: str,
+    backend: Optional[str] = None,
+    regions: Optional[Sequence[Region]] = None,
+    partial: Optional[bool] = None,
+    stats: Optional[Any] = None,
+) -> BeautifulSoup:
+    """
+    Parse a page with the configured backend (HTML_PARSER / --parser).
+
+    With `regions` and partial parsing on (PARTIAL_PARSE / --partial-parse),
+    only those regions are built into the tree; a page where a region
+    can't be found is parsed in full. With `stats` (a fetch.FetchStats),
+    the time spent here is added to its parse counters.
+    """
+    started = time.perf_counter()
+    if regions and (_partial if partial is None else partial):
+        cut = cut_regions(html, regions)
+        if cut is not None:
+            html = cut
+    soup = BeautifulSoup(html, backend or _backend)
+    if stats is not None:
+        stats.record_parse(time.perf_counter() - started)
+    return soup
+
+
+Extractor = Tuple[Callable[[BeautifulSoup, str], Any], Sequence[Region]]
+
+
+def page_extractors() -> Dict[str, Dict[str, Extractor]]:
+    """
+    Every extractor with the regions it declares, grouped by the kind of
+    page it reads. Fixture files are named <kind>_*.html. Imported lazily:
+    the stages import this module.
+    """
+    from scraper.stages import crew_details, crews, external, pirate_urls, pirates, shoppes
+    from scraper.targets import site_root
+
+    return {
+        "pirate": {
+            "pirates._parse_pirate": (lambda soup, url: pirates._parse_pirate(soup, url), pirates.REGIONS),
+            "shoppes._parse_shops": (lambda soup, url: shoppes._parse_shops(soup, url), shoppes.REGIONS),
+            "external._extract_main_name": (lambda soup, url: external._extract_main_name(soup, url), ()),
+            "external._extract_portrait_url": (lambda soup, url: external._extract_portrait_url(soup), ()),
+            "external._extract_identity_block": (lambda soup, url: external._extract_identity_block(soup), ()),
+            "external._extract_reputation": (lambda soup, url: external._extract_reputation(soup), ()),
+            "external._extract_property_rows": (lambda soup, url: external._extract_property_rows(soup), ()),
+            "external._extract_hearties": (lambda soup, url: external._extract_hearties(soup), ()),
+            "external._extract_skills": (lambda soup, url: external._extract_skills(soup), ()),
+        },
+        "crew": {
+            "crew_details._parse_crew_details": (
+                lambda soup, url: crew_details._parse_crew_details(soup, url),
+                crew_details.REGIONS,
+            ),
+            "pirate_urls._parse_roster": (
+                lambda soup, url: pirate_urls._parse_roster(soup, url),
+                pirate_urls.REGIONS,
+            ),
+        },
+        "flag": {
+            "crews._parse_crews": (lambda soup, url: crews._parse_crews(soup, site_root(url)), ()),
+        },
+    }
+
+
+def _run_extractor(fn: Callable[[BeautifulSoup, str], Any], soup: BeautifulSoup, url: str) -> Any:
+    try:
+        return fn(soup, url)
+    except Exception as e:
+        return f"<{type(e).__name__}: {e}>"
+
+
+def check_equivalence(
+    pages_dir: Path = FIXTURES_DIR,
+    backends: Optional[List[str]] = None,
+) -> List[str]:
+    """
+    Run every extractor over every saved page with each backend, full and
+    region-restricted, and return one message per extractor whose output
+    differs from a full html.parser parse.
+    """
+    backends = backends or available_backends()
+    extractors = page_extractors()
+    problems: List[str] = []
+
+    for path in sorted(Path(pages_dir).glob("*.html")):
+        kind = path.name.split("_", 1)[0]
+        if kind not in extractors:
+            continue
+        html = path.read_text(encoding="utf-8")
+        url = f"file://{path.name}"
+
+        for name, (fn, regions) in extractors[kind].items():
+            reference = _run_extractor(fn, make_soup(html, "html.parser", partial=False), url)
+            for backend in backends:
+                modes = [False, True] if regions else [False]
+                for partial in modes:
+                    if backend == "html.parser" and not partial:
+                        continue
+                    if partial and cut_regions(html, regions) is None:
+                        problems.append(f"{path.name} [{backend}, partial] {name}: regions not found")
+                        continue
+                    soup = make_soup(html, backend, regions=regions, partial=partial)
+                    got = _run_extractor(fn, soup, url)
+                    if got != reference:
+                        label = f"{backend}, partial" if partial else backend
+                        problems.append(f"{path.name} [{label}] {name}: {got!r} != {reference!r}")
+
+    return problems
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Check that every extractor gives identical rows on each HTML parser "
+                    "backend, with and without region-restricted parsing."
+    )
+    parser.add_argument("pages_dir", nargs="?", default=str(FIXTURES_DIR))
+    parser.add_argument("--backend", action="append", choices=BACKENDS,
+                        help="backend(s) to compare against html.parser (default: all installed)")
+    args = parser.parse_args(argv)
+
+    problems = check_equivalence(Path(args.pages_dir), args.backend)
+    for line in problems:
+        print(f"❌ {line}")
+    if problems:
+        return 1
+    print(f"✅ Extractors agree across backends (full and partial): {', '.join(args.backend or available_backends())}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,13 +1,20 @@
+from typing import List
 from pathlib import Path
+import argparse
 import os
 
-from scraper.stages.external import run as run_external
-from scraper.stages.crews import run as run_crews
-from scraper.stages.crew_details import run as run_crew_details
-from scraper.stages.pirate_urls import run as run_pirate_urls
-from scraper.stages.pirates import run as run_pirates
-from scraper.stages.shoppes import run as run_shoppes
-from scraper.stages.finalize import run as run_finalize
+from scraper import fetch, incremental, outputs, parse_pool, parsing, targets
+from scraper.cache import open_cache
+from scraper.checkpoint import open_journal
+from scraper.metrics import RunReport, meta_path, write_report
+from scraper.scheduler import Scheduler, Stage
+from scraper.sinks import SPOOL_DIRNAME, Spool
+from scraper.store import Store, open_store, table_name
+
+from scraper.stages import crew_pages, crews, external, finalize, pirate_pages, roster_stream
+
+
+SCRATCH_FILENAME = "scratch.sqlite"
 
 
 class Context:
@@ -15,40 +22,222 @@ class Context:
         self.data = {}
 
 
-def main():
+def _parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run the yoweb scraper pipeline.")
+    parser.add_argument("--workers", type=int, default=fetch.FETCH_WORKERS,
+                        help="concurrent fetch workers (env FETCH_WORKERS)")
+    parser.add_argument("--rps", type=float, default=fetch.REQUESTS_PER_SECOND,
+                        help="requests per second to each host / ocean (env FETCH_RPS)")
+    parser.add_argument("--max-per-host", type=int, default=fetch.MAX_IN_FLIGHT_PER_HOST,
+                        help="max in-flight requests per host (env FETCH_MAX_PER_HOST)")
+    parser.add_argument("--flag", dest="flags", action="append", default=None, metavar="OCEAN:FLAGID",
+                        help="flag to crawl; repeat for several (env FLAG_TARGETS, default emerald:10007105)")
+    parser.add_argument("--retries", type=int, default=fetch.FETCH_RETRIES,
+                        help="in-line retries of 429/5xx/timeouts per request (env FETCH_RETRIES)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="skip the on-disk HTTP cache (env HTTP_CACHE=0)")
+    parser.add_argument("--no-store", action="store_true", default=os.getenv("STORE", "1") == "0",
+                        help="don't keep the SQLite data store; the CSVs are exported through a scratch "
+                             "one in the spool (env STORE=0)")
+    parser.add_argument("--parser", choices=parsing.BACKENDS, default=parsing.DEFAULT_BACKEND,
+                        help="bs4 tree builder used by every extractor (env HTML_PARSER)")
+    parser.add_argument("--parse-workers", type=int, default=parse_pool.PARSE_WORKERS,
+                        help="processes that parse fetched pages; 0 parses on the fetch threads (env PARSE_WORKERS)")
+    parser.add_argument("--partial-parse", action="store_true", default=parsing.PARTIAL_PARSE,
+                        help="build only the page regions each extractor reads (env PARTIAL_PARSE=1)")
+    parser.add_argument("--incremental", action="store_true", default=incremental.INCREMENTAL,
+                        help="only re-fetch crews/pirates that changed or are past max age (env INCREMENTAL=1)")
+    parser.add_argument("--no-checkpoint", action="store_true",
+                        help="don't journal per-URL results for resuming a failed run (env CHECKPOINT=0)")
+    parser.add_argument("--stream", action="store_true", default=os.getenv("STREAM", "0") == "1",
+                        help="start pirate fetches as each crew roster is parsed (env STREAM=1)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    parsing.set_backend(args.parser)
+    parsing.set_partial_parse(args.partial_parse)
+
     output_dir = Path(os.getenv("OUTPUT_DIR", "data"))
     output_dir.mkdir(parents=True, exist_ok=True)
-
-    ctx = Context()
-
-    print("Running crews stage...")
-    ctx.data["crews"] = run_crews(ctx)
-
-    print("Running external stage...")
-    ctx.data["external"] = run_external(ctx)
-
-    print("Running crew_details stage...")
-    ctx.data["crew_details"] = run_crew_details(ctx)
-
-    print("Running pirate_urls stage...")
-    ctx.data["pirate_urls"] = run_pirate_urls(ctx)
-
-    print("Running pirates stage...")
-    ctx.data["pirates"] = run_pirates(ctx)
-
-    print("Running shoppes stage...")
-    ctx.data["shoppes"] = run_shoppes(ctx)
-
-    print("Running finalize stage...")
-    outputs = run_finalize(ctx)
-
-    for filename, df in outputs.items():
-        path = output_dir / filename
-        df.to_csv(path, index=False)
+    flag_targets = targets.load_targets(args.flags)
+
+    cache = None if args.no_cache else open_cache(output_dir)
+    fetch.configure(
+        workers=args.workers,
+        requests_per_second=args.rps,
+        max_in_flight_per_host=args.max_per_host,
+        cache=cache,
+        retries=args.retries,
+    )
+
+    report = RunReport(config={
+        "targets": [t.key for t in flag_targets],
+        "workers": args.workers,
+        "rps": args.rps,
+        "max_per_host": args.max_per_host,
+        "retries": args.retries,
+        "cache": cache is not None,
+        "store": not args.no_store,
+        "parser": args.parser,
+        "partial_parse": args.partial_parse,
+        "parse_workers": args.parse_workers,
+        "incremental": args.incremental,
+        "stream": args.stream,
+    })
+
+    parse_pool.configure(args.parse_workers)
+    try:
+        _run(args, output_dir, flag_targets, cache, report)
+    except BaseException as e:
+        report.finish(e)
+        raise
+    else:
+        report.finish()
+    finally:
+        parse_pool.shutdown()
+        path = meta_path(output_dir)
+        write_report(report.as_dict(), path)
         print(f"Wrote {path}")
 
     print("Pipeline complete.")
 
 
+def _stage(name: str, module) -> Stage:
+    return Stage(
+        name=name,
+        run=module.run,
+        inputs=module.INPUTS,
+        optional_inputs=getattr(module, "OPTIONAL_INPUTS", ()),
+        outputs=module.OUTPUTS,
+    )
+
+
+def _write_outputs(output_dir: Path, report: RunReport, store=None, scratch=None):
+    def run(ctx):
+        # the run's datasets go into the store together and the CSVs below
+        # are exported from it, so spooled datasets are sorted by SQLite
+        # and never read into a frame; without a store, through the
+        # scratch one in the spool
+        target = store if store is not None else scratch
+        tables = {
+            table_name(filename): df
+            for filename, df in ctx.data["outputs"].items()
+            if filename not in outputs.BOOKKEEPING
+        }
+        if store is not None:
+            ext = ctx.data.get("external") or {}
+            for key in ("external_pirates_df", "external_pirates_failures_df"):
+                if key in ext:
+                    tables[key[:-len("_df")]] = ext[key]
+        sort_keys = {table_name(filename): keys for filename, keys in outputs.SORT_KEYS.items()}
+        stored = target.write(tables, sort_keys)
+        if store is not None:
+            print(f"Store: {len(stored)} of {len(tables)} datasets updated in {store.path}")
+
+        unchanged = []
+        for filename, df in ctx.data["outputs"].items():
+            path = output_dir / filename
+            report.outputs[filename] = int(len(df))
+            if filename in outputs.BOOKKEEPING:
+                df.to_csv(path, index=False)
+                print(f"Wrote {path}")
+                continue
+            # streamed out of the store, not read back into a frame
+            name = table_name(filename)
+            changed = outputs.publish(
+                path,
+                lambda f: target.export_csv(name, f, sort_keys.get(name)),
+                target.datasets()[name]["columns"],
+            )
+            if changed:
+                print(f"Wrote {path}")
+            else:
+                unchanged.append(filename)
+        if unchanged:
+            print(f"Unchanged: {', '.join(unchanged)}")
+        meta = {
+            "files": len(ctx.data["outputs"]),
+            "written": len(ctx.data["outputs"]) - len(unchanged),
+            "unchanged": unchanged,
+        }
+        if store is not None:
+            meta["store"] = str(store.path)
+            meta["store_updated"] = stored
+        return {"meta": meta}
+    return run
+
+
+def _run(
+    args: argparse.Namespace,
+    output_dir: Path,
+    flag_targets: List[targets.FlagTarget],
+    cache,
+    report: RunReport,
+) -> None:
+    ctx = Context()
+    ctx.data["targets"] = flag_targets
+    # rows go to disk as pages are parsed, not into lists held until the end
+    spool = Spool(output_dir / SPOOL_DIRNAME)
+    ctx.data["spool"] = spool
+    # the last run's datasets, and this run's without a data store, are
+    # sorted and looked up through this one; it goes with the spool
+    scratch = Store(spool.directory / SCRATCH_FILENAME)
+    store = None if args.no_store else open_store(output_dir)
+    ctx.data["incremental"] = incremental.load(output_dir, scratch, enabled=args.incremental, store=store)
+
+    journal = None if args.no_checkpoint else open_journal(output_dir)
+    if journal is not None:
+        pending = journal.pending()
+        if journal.resuming:
+            print(f"Checkpoint: resuming run {journal.run_id} (started {journal.started_at}) with {pending} results")
+        ctx.data["checkpoint"] = journal
+
+    if args.stream:
+        page_stages = [_stage("roster_stream", roster_stream)]
+    else:
+        page_stages = [_stage("crew_pages", crew_pages), _stage("pirate_pages", pirate_pages)]
+
+    scheduler = Scheduler([
+        _stage("crews", crews),
+        _stage("external", external),
+        *page_stages,
+        _stage("finalize", finalize),
+        Stage(
+            "write",
+            _write_outputs(output_dir, report, store, scratch),
+            inputs=["outputs"],
+            optional_inputs=["external"],
+        ),
+    ], report=report)
+    try:
+        scheduler.run(ctx)
+        if journal is not None:
+            # the run finished: the next one starts from scratch
+            journal.clear()
+    finally:
+        scratch.close()
+        spool.clear()
+        if store is not None:
+            store.close()
+        print(scheduler.critical_path_line())
+        report.extra["circuit_breakers"] = fetch.get_fetcher().breaker_stats()
+        report.extra["entities"] = fetch.get_fetcher().entities.stats()
+        print(f"Entities: {report.extra['entities']}")
+        if journal is not None:
+            report.extra["checkpoint"] = journal.stats()
+            journal.close()
+
+    if cache is not None:
+        report.extra["http_cache"] = cache.stats()
+        print(f"HTTP cache: {report.extra['http_cache']}")
+        cache.close()
+
+    report.extra["critical_path"] = scheduler.critical_path()[0]
+    for line in report.summary_lines():
+        print(line)
+
+
 if __name__ == "__main__":
     main()
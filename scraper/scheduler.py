@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+from typing import Dict, Any, Callable, List, Optional, Sequence, Set, Tuple
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+import time
+
+from scraper.metrics import RunReport, stage_meta
+
+
+@dataclass(frozen=True)
+class Stage:
+    """
+    One pipeline step and the ctx.data keys it touches.
+
+    `inputs` must be in ctx.data before the stage starts (produced by
+    another stage or seeded up front). `optional_inputs` are waited for
+    when some stage produces them, and skipped otherwise. With a single
+    output the stage's whole result is stored under it; with several,
+    result[key] is stored under each key.
+    """
+
+    name: str
+    run: Callable[[Any], Any]
+    inputs: Sequence[str] = ()
+    optional_inputs: Sequence[str] = ()
+    outputs: Sequence[str] = ()
+
+
+@dataclass
+class StageTiming:
+    start: float = 0.0
+    end: float = 0.0
+    deps: List[str] = field(default_factory=list)
+
+    @property
+    def seconds(self) -> float:
+        return self.end - self.start
+
+
+class Scheduler:
+    """
+    Runs stages as a DAG on a thread pool: every stage whose inputs are
+    ready is started at once. A missing required input is reported before
+    anything runs. A failing stage stops new stages from starting; the
+    error is re-raised once the running ones finish.
+    """
+
+    def __init__(self, stages: Sequence[Stage], report: Optional[RunReport] = None):
+        self.stages = {s.name: s for s in stages}
+        if len(self.stages) != len(stages):
+            raise ValueError("Duplicate stage names")
+        self.report = report
+        self.timings: Dict[str, StageTiming] = {}
+        self._origin = 0.0
+        self._producers: Dict[str, str] = {}
+        for stage in stages:
+            for key in stage.outputs:
+                if key in self._producers:
+                    raise ValueError(
+                        f"ctx.data[{key!r}] is written by both {self._producers[key]} and {stage.name}"
+                    )
+                self._producers[key] = stage.name
+
+    def dependencies(self, stage: Stage, seeded: Set[str]) -> List[str]:
+        deps: List[str] = []
+        for key in list(stage.inputs) + list(stage.optional_inputs):
+            producer = self._producers.get(key)
+            if producer is not None and key not in seeded and producer not in deps:
+                deps.append(producer)
+        return deps
+
+    def validate(self, seeded: Set[str]) -> Dict[str, List[str]]:
+        """Stage -> the stages it waits on. Raises on missing inputs or cycles."""
+        missing = [
+            f"{stage.name} needs ctx.data[{key!r}]"
+            for stage in self.stages.values()
+            for key in stage.inputs
+            if key not in seeded and key not in self._producers
+        ]
+        if missing:
+            raise RuntimeError("Missing required stage inputs: " + "; ".join(missing))
+
+        deps = {name: self.dependencies(stage, seeded) for name, stage in self.stages.items()}
+
+        done: Set[str] = set()
+        while len(done) < len(deps):
+            ready = [n for n, d in deps.items() if n not in done and all(x in done for x in d)]
+            if not ready:
+                raise RuntimeError(f"Stage dependency cycle among: {sorted(set(deps) - done)}")
+            done.update(ready)
+        return deps
+
+    def _call(self, stage: Stage, ctx: Any) -> Any:
+        timing = self.timings[stage.name]
+        timing.start = time.perf_counter()
+        try:
+            if self.report is None:
+                return stage.run(ctx)
+            with self.report.stage(stage.name) as record:
+                result = stage.run(ctx)
+                record.update(stage_meta(result))
+                return result
+        finally:
+            timing.end = time.perf_counter()
+
+    def _store(self, stage: Stage, result: Any, ctx: Any) -> None:
+        if len(stage.outputs) == 1:
+            ctx.data[stage.outputs[0]] = result
+            return
+        for key in stage.outputs:
+            if not isinstance(result, dict) or key not in result:
+                raise RuntimeError(f"Stage {stage.name} did not return declared output {key!r}")
+            ctx.data[key] = result[key]
+
+    def run(self, ctx: Any) -> None:
+        deps = self.validate(set(ctx.data))
+        self.timings = {name: StageTiming(deps=d) for name, d in deps.items()}
+        self._origin = time.perf_counter()
+
+        finished: Set[str] = set()
+        running: Dict[Future, Stage] = {}
+        error: Optional[BaseException] = None
+
+        with ThreadPoolExecutor(max_workers=max(1, len(self.stages)), thread_name_prefix="stage") as pool:
+            while True:
+                if error is None:
+                    started = {s.name for s in running.values()}
+                    for name, stage in self.stages.items():
+                        if name in finished or name in started:
+                            continue
+                        if all(d in finished for d in deps[name]):
+                            print(f"Running {name} stage...")
+                            running[pool.submit(self._call, stage, ctx)] = stage
+
+                if not running:
+                    break
+
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for fut in done:
+                    stage = running.pop(fut)
+                    try:
+                        self._store(stage, fut.result(), ctx)
+                    except BaseException as e:
+                        print(f"❌ Stage {stage.name} failed: {type(e).__name__}: {e}")
+                        if error is None:
+                            error = e
+                        continue
+                    finished.add(stage.name)
+
+        if error is not None:
+            raise error
+
+    def critical_path(self) -> Tuple[List[str], float]:
+        """
+        The chain of stages that determined the total run time: starting
+        from the stage that finished last, repeatedly step back to the
+        dependency that finished last.
+        """
+        done = {n: t for n, t in self.timings.items() if t.end}
+        if not done:
+            return [], 0.0
+        name = max(done, key=lambda n: done[n].end)
+        path = [name]
+        while True:
+            deps = [d for d in done[name].deps if d in done]
+            if not deps:
+                break
+            name = max(deps, key=lambda d: done[d].end)
+            path.append(name)
+        path.reverse()
+        return path, done[path[-1]].end - self._origin
+
+    def critical_path_line(self) -> str:
+        path, total = self.critical_path()
+        steps = " -> ".join(f"{n} ({self.timings[n].seconds:.2f}s)" for n in path)
+        return f"Critical path: {steps} = {total:.2f}s"
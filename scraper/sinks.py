@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+from typing import Dict, Any, Callable, Iterable, Iterator, List, Optional, Union
+from pathlib import Path
+import csv
+import shutil
+import tempfile
+import threading
+
+import pandas as pd
+
+from scraper.outputs import CHUNK_ROWS
+
+
+SPOOL_DIRNAME = ".spool"
+
+
+class SpooledFrame:
+    """
+    A dataset kept on disk (a spool file or a store table) rather than
+    in a DataFrame: its columns, its row count and chunks(), which reads
+    it CHUNK_ROWS rows at a time. map() adds a step (tagging, type
+    conversion, ...) that runs on each chunk as it's read.
+    """
+
+    def __init__(self, columns: List[str], read: Callable[[], Iterator[pd.DataFrame]], rows: Optional[int] = None):
+        self.columns = list(columns)
+        self._read = read
+        self._rows = rows
+
+    def __len__(self) -> int:
+        if self._rows is None:
+            self._rows = sum(len(chunk) for chunk in self.chunks())
+        return self._rows
+
+    def chunks(self) -> Iterator[pd.DataFrame]:
+        return self._read()
+
+    def map(self, fn: Callable[[pd.DataFrame], pd.DataFrame]) -> "SpooledFrame":
+        """The same rows with `fn` applied to every chunk (`fn` mustn't add or drop rows)."""
+        # the step's columns, from running it on no rows
+        columns = list(fn(pd.DataFrame(columns=self.columns)).columns)
+        return SpooledFrame(columns, lambda: (fn(chunk) for chunk in self.chunks()), self._rows)
+
+
+def iter_chunks(data: Union[pd.DataFrame, SpooledFrame]) -> Iterator[pd.DataFrame]:
+    """A DataFrame or SpooledFrame, CHUNK_ROWS rows at a time."""
+    if isinstance(data, SpooledFrame):
+        yield from data.chunks()
+        return
+    for start in range(0, len(data), CHUNK_ROWS):
+        yield data.iloc[start:start + CHUNK_ROWS]
+
+
+def _read_chunks(path: Path) -> Iterator[pd.DataFrame]:
+    with pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=CHUNK_ROWS) as reader:
+        yield from reader
+
+
+def csv_frame(path: Path) -> Optional[SpooledFrame]:
+    """A CSV file (all text, blanks as "") as a SpooledFrame; None if it's missing or empty."""
+    path = Path(path)
+    if not path.exists():
+        return None
+    try:
+        columns = list(pd.read_csv(path, dtype=str, nrows=0).columns)
+    except pd.errors.EmptyDataError:
+        return None
+    return SpooledFrame(columns, lambda: _read_chunks(path))
+
+
+class CsvSink:
+    """
+    Rows written to a CSV file as they're produced instead of collected
+    in a list. Columns are fixed up front: missing keys are left blank,
+    extra keys dropped. frame() hands the file on as a SpooledFrame;
+    read() turns it into a DataFrame where a stage needs one.
+    """
+
+    def __init__(self, path: Path, columns: List[str]):
+        self.path = Path(path)
+        self.columns = list(columns)
+        self.count = 0
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "w", newline="", encoding="utf-8")
+        self._writer = csv.DictWriter(self._file, fieldnames=self.columns, restval="", extrasaction="ignore")
+        self._writer.writeheader()
+
+    def write(self, row: Dict[str, Any]) -> None:
+        with self._lock:
+            self._writer.writerow(row)
+            self.count += 1
+
+    def write_many(self, rows: Iterable[Dict[str, Any]]) -> None:
+        with self._lock:
+            for row in rows:
+                self._writer.writerow(row)
+                self.count += 1
+
+    def write_frame(self, df: pd.DataFrame) -> None:
+        """write_many for a DataFrame's rows (<NA> written blank)."""
+        with self._lock:
+            df.reindex(columns=self.columns).to_csv(self._file, header=False, index=False, lineterminator="\r\n")
+            self.count += len(df)
+
+    def close(self) -> None:
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+    def read(self) -> pd.DataFrame:
+        self.close()
+        if self.count == 0:
+            return pd.DataFrame(columns=self.columns)
+        return pd.read_csv(self.path, dtype=str, keep_default_na=False)
+
+    def frame(self) -> SpooledFrame:
+        """The rows written so far, read back a chunk at a time (closes the sink)."""
+        self.close()
+        if not self.count:
+            return SpooledFrame(self.columns, lambda: iter(()), 0)
+        path = self.path
+        return SpooledFrame(self.columns, lambda: _read_chunks(path), self.count)
+
+
+class Spool:
+    """
+    Directory holding one run's sinks (<output dir>/.spool). Emptied when
+    opened and removed once the run's outputs are written; the checkpoint
+    journal, not the spool, is what a failed run resumes from.
+    """
+
+    def __init__(self, directory: Optional[Path] = None):
+        self._temporary = directory is None
+        self.directory = Path(directory or tempfile.mkdtemp(prefix="scraper-spool-"))
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._sinks: List[CsvSink] = []
+        self._lock = threading.Lock()
+
+    def sink(self, name: str, columns: List[str]) -> CsvSink:
+        sink = CsvSink(self.directory / f"{name}.csv", columns)
+        with self._lock:
+            self._sinks.append(sink)
+        return sink
+
+    def clear(self) -> None:
+        with self._lock:
+            for sink in self._sinks:
+                sink.close()
+            self._sinks.clear()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def open_spool(ctx: Any) -> Spool:
+    """The run's spool (seeded by the pipeline), or a temporary one for a stage run on its own."""
+    spool = ctx.data.get("spool") if ctx is not None else None
+    return spool if spool is not None else Spool()
@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+from typing import Dict, List
+import os
+
+import pandas as pd
+
+from scraper.stages.pirates import ALL_SKILLS
+from scraper.targets import FLAG_ID_COLUMN, OCEAN_COLUMN
+
+
+# Lowest first; a level's ordinal is its position + 1 (blank / unknown -> <NA>)
+EXPERIENCE_LEVELS = [
+    "Neophyte", "Novice", "Apprentice", "Narrow", "Solid", "Broad", "Weighty",
+    "Expert", "Paragon", "Illustrious", "Sublime", "Revered", "Exalted", "Transcendent",
+]
+STANDING_LEVELS = [
+    "Able", "Proficient", "Distinguished", "Respected", "Master",
+    "Renowned", "Grand-Master", "Legendary", "Ultimate",
+]
+
+# "Solid / Proficient (archipelago: Distinguished )", as pirates.parse_skills leaves it
+SKILL_RE = r"^\s*(?P<experience>[^/]*?)\s*/\s*(?P<standing>[A-Za-z\-]*)(?:.*?archipelago:\s*(?P<archipelago>[A-Za-z\-]+))?"
+
+# Pirates kept per skill, per flag
+LEADERBOARD_SIZE = int(os.getenv("LEADERBOARD_SIZE", "100"))
+
+_EXPERIENCE = {name: i for i, name in enumerate(EXPERIENCE_LEVELS, start=1)}
+_STANDING = {name: i for i, name in enumerate(STANDING_LEVELS, start=1)}
+
+
+def ordinal_columns(skill: str) -> List[str]:
+    return [f"{skill} Experience", f"{skill} Standing", f"{skill} Archipelago Standing"]
+
+
+# encode_skills' columns
+LEVEL_COLUMNS = ["Pirate URL"] + [c for skill in ALL_SKILLS for c in ordinal_columns(skill)]
+
+_SKILL_ORDER = {skill: i for i, skill in enumerate(ALL_SKILLS)}
+
+
+def encode_skills(pirates_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    One row per pirate: Pirate URL plus, for every skill, its experience,
+    standing and archipelago standing as small ints (Int8, <NA> if blank).
+    """
+    out: Dict[str, pd.Series] = {"Pirate URL": pirates_df.get("Pirate URL", pd.Series(dtype=str))}
+    for skill in ALL_SKILLS:
+        values = pirates_df.get(skill, pd.Series("", index=pirates_df.index)).fillna("").astype(str)
+        parts = values.str.extract(SKILL_RE)
+        exp_col, standing_col, arch_col = ordinal_columns(skill)
+        out[exp_col] = parts["experience"].map(_EXPERIENCE).astype("Int8")
+        out[standing_col] = parts["standing"].map(_STANDING).astype("Int8")
+        out[arch_col] = parts["archipelago"].map(_STANDING).astype("Int8")
+    return pd.DataFrame(out, index=pirates_df.index).reset_index(drop=True)
+
+
+def read_levels(text_df: pd.DataFrame) -> pd.DataFrame:
+    """encode_skills' frame back from its CSV text (blank -> <NA>)."""
+    ordinals = [c for c in text_df.columns if c != "Pirate URL"]
+    return text_df.assign(**{c: pd.to_numeric(text_df[c]).astype("Int8") for c in ordinals})
+
+
+def leaderboards(pirates_df: pd.DataFrame, levels_df: pd.DataFrame, size: int = LEADERBOARD_SIZE) -> pd.DataFrame:
+    """
+    The top `size` pirates of every skill within each flag, by standing,
+    then experience, then name. Long format: filter on Skill (and Flag ID)
+    and the rows are already in rank order.
+    """
+    group_cols = [c for c in (OCEAN_COLUMN, FLAG_ID_COLUMN) if c in pirates_df.columns]
+    info_cols = ["Pirate URL", "Pirate Name", "Crew Name"] + group_cols
+    info = pirates_df.reindex(columns=info_cols).fillna("").reset_index(drop=True)
+    columns = ["Skill", *group_cols, "Rank", "Pirate Name", "Crew Name", "Pirate URL",
+               "Standing", "Experience", "Standing Ordinal", "Experience Ordinal"]
+
+    frames = []
+    for skill in ALL_SKILLS:
+        exp_col, standing_col, _ = ordinal_columns(skill)
+        board = info.assign(
+            **{
+                "Skill": skill,
+                "Standing Ordinal": levels_df[standing_col].values,
+                "Experience Ordinal": levels_df[exp_col].values,
+            }
+        ).dropna(subset=["Standing Ordinal"])
+        if board.empty:
+            continue
+        board = board.sort_values(
+            group_cols + ["Standing Ordinal", "Experience Ordinal", "Pirate Name"],
+            ascending=[True] * len(group_cols) + [False, False, True],
+            kind="mergesort",
+            na_position="last",
+        )
+        if group_cols:
+            board["Rank"] = board.groupby(group_cols, sort=False).cumcount() + 1
+        else:
+            board["Rank"] = range(1, len(board) + 1)
+        board = board.loc[board["Rank"] <= size]
+        board["Standing"] = board["Standing Ordinal"].map(lambda i: STANDING_LEVELS[int(i) - 1])
+        board["Experience"] = board["Experience Ordinal"].map(
+            lambda i: EXPERIENCE_LEVELS[int(i) - 1] if pd.notna(i) else ""
+        )
+        frames.append(board[columns])
+
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(frames, ignore_index=True)
+
+
+def merge_leaderboards(first: pd.DataFrame, second: pd.DataFrame, size: int = LEADERBOARD_SIZE) -> pd.DataFrame:
+    """
+    One leaderboard from the leaderboards of two sets of pirates (e.g.
+    successive chunks of pirates.csv): each skill's top `size` of both,
+    re-ranked. Ties keep `first`'s pirates ahead.
+    """
+    if first.empty or second.empty:
+        return second if first.empty else first
+    group_cols = [c for c in (OCEAN_COLUMN, FLAG_ID_COLUMN) if c in first.columns]
+    board = pd.concat([first, second], ignore_index=True)
+    board["_skill"] = board["Skill"].map(_SKILL_ORDER)
+    board = board.sort_values(
+        ["_skill"] + group_cols + ["Standing Ordinal", "Experience Ordinal", "Pirate Name"],
+        ascending=[True] * (1 + len(group_cols)) + [False, False, True],
+        kind="mergesort",
+        na_position="last",
+    )
+    board["Rank"] = board.groupby(["_skill"] + group_cols, sort=False).cumcount() + 1
+    return board.loc[board["Rank"] <= size, first.columns].reset_index(drop=True)
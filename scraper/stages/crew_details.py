@@ -1,16 +1,20 @@
 from __future__ import annotations
 
-from typing import Dict, Any, List, Tuple, Optional
-import time
+from typing import Dict, Any, Optional
 
-import pandas as pd
-import requests
 from bs4 import BeautifulSoup
 
+from scraper.fetch import Fetcher, FetchStats
+from scraper.parsing import Region, make_soup
+
 
 USER_AGENT = "Mozilla/5.0 (compatible; GitHubActionsScraper/1.0)"
 REQUEST_TIMEOUT = 30
-SLEEP_SECONDS = 1.0  # be kind
+
+# tables[1] and the captain block both come before the "jobbing pirates" marker
+REGIONS = [Region(anchor=r"\A", until=r'<img[^>]*/yoweb/images/crew-jobbing\.png')]
+
+CREW_DETAILS_COLUMNS = ["Crew Name", "Public Statement", "Captain", "Crew URL"]
 
 
 def _extract_crew_name(center_cell: Any) -> str:
@@ -61,17 +65,7 @@ def _extract_captain(soup: BeautifulSoup) -> str:
     return ""
 
 
-def _scrape_one(crew_url: str, session: requests.Session) -> Dict[str, str]:
-    r = session.get(
-        crew_url,
-        timeout=REQUEST_TIMEOUT,
-        headers={"User-Agent": USER_AGENT},
-    )
-    if r.status_code != 200:
-        raise ValueError(f"HTTP Error: {r.status_code}")
-
-    soup = BeautifulSoup(r.text, "html.parser")
-
+def _parse_crew_details(soup: BeautifulSoup, crew_url: str) -> Dict[str, str]:
     tables = soup.find_all("table")
     if len(tables) < 2:
         raise ValueError("Expected at least 2 tables on the page.")
@@ -93,57 +87,15 @@ def _scrape_one(crew_url: str, session: requests.Session) -> Dict[str, str]:
     }
 
 
-def run(ctx) -> Dict[str, Any]:
-    # Pull Crew URLs from previous stage instead of Google Sheets
-    crews_df: pd.DataFrame = ctx.data["crews"]["crews_df"]
-    if "Crew URL" not in crews_df.columns:
-        raise RuntimeError("crews_df missing required column: 'Crew URL'")
-
-    crew_urls = (
-        crews_df["Crew URL"]
-        .dropna()
-        .astype(str)
-        .map(str.strip)
-    )
-    crew_urls = crew_urls[crew_urls != ""].unique().tolist()
-
-    crew_data: List[Dict[str, str]] = []
-    failures: List[Dict[str, str]] = []
-
-    session = requests.Session()
-
-    for i, crew_url in enumerate(crew_urls, start=1):
-        try:
-            row = _scrape_one(crew_url, session)
-            crew_data.append(row)
-            print(f"✅ ({i}/{len(crew_urls)}) Scraped: {row['Crew Name']}", flush=True)
-        except Exception as e:
-            failures.append({
-                "Crew URL": crew_url,
-                "Error Type": type(e).__name__,
-                "Message": str(e),
-            })
-            print(f"❌ ({i}/{len(crew_urls)}) Failed: {crew_url} - {type(e).__name__}: {e}", flush=True)
-
-        time.sleep(SLEEP_SECONDS)
-
-    crew_details_df = pd.DataFrame(
-        crew_data,
-        columns=["Crew Name", "Public Statement", "Captain", "Crew URL"]
-    )
-
-    failures_df = pd.DataFrame(
-        failures,
-        columns=["Crew URL", "Error Type", "Message"]
+def _scrape_one(crew_url: str, fetcher: Fetcher, stats: Optional[FetchStats] = None) -> Dict[str, str]:
+    r = fetcher.get(
+        crew_url,
+        stats,
+        timeout=REQUEST_TIMEOUT,
+        headers={"User-Agent": USER_AGENT},
     )
+    if r.status_code != 200:
+        raise ValueError(f"HTTP Error: {r.status_code}")
 
-    return {
-        "crew_details_df": crew_details_df,
-        "crew_failures_df": failures_df,
-        "meta": {
-            "input_urls": int(len(crew_urls)),
-            "success": int(len(crew_details_df)),
-            "failures": int(len(failures_df)),
-            "sleep_seconds": SLEEP_SECONDS,
-        }
-    }
\ No newline at end of file
+    soup = make_soup(r.text, regions=REGIONS, stats=stats)
+    return _parse_crew_details(soup, crew_url)
@@ -0,0 +1,224 @@
+from __future__ import annotations
+
+from typing import Dict, Any, List, Optional, Set, Tuple
+from dataclasses import dataclass
+
+import pandas as pd
+
+from scraper import parse_pool
+from scraper.checkpoint import resumable
+from scraper.entities import dedupe_urls
+from scraper.fetch import Fetcher, FetchStats, get_fetcher
+from scraper.incremental import CrawlState, Previous, changed_rosters, merge_carried, plan_crews
+from scraper.parsing import make_soup
+from scraper.sinks import Spool, open_spool
+from scraper.stages.crew_details import CREW_DETAILS_COLUMNS, _parse_crew_details
+from scraper.stages.pirate_urls import PIRATE_URL_COLUMNS, REGIONS, _parse_roster
+
+
+USER_AGENT = "Mozilla/5.0 (compatible; GitHubActionsScraper/1.0)"
+REQUEST_TIMEOUT = 30
+
+FAILURE_COLUMNS = ["Crew URL", "Error Type", "Message"]
+
+# ctx.data keys (see scraper.scheduler)
+INPUTS = ["crews"]
+OPTIONAL_INPUTS = ["incremental", "checkpoint", "spool"]
+OUTPUTS = ["crew_details", "pirate_urls"]
+
+
+def _failure(crew_url: str, e: Exception) -> Dict[str, str]:
+    return {
+        "Crew URL": crew_url,
+        "Error Type": type(e).__name__,
+        "Message": str(e),
+    }
+
+
+def _parse_page(
+    html: str,
+    crew_url: str,
+    stats: Optional[FetchStats] = None,
+) -> Tuple[Dict[str, str] | None, Exception | None, List[Dict[str, str]] | None, Exception | None]:
+    """
+    Parse one crew page and extract both the crew details (name, public
+    statement, captain) and the roster from it. An extraction error on
+    either side is returned so the other half of the page still counts.
+    """
+    soup = make_soup(html, regions=REGIONS, stats=stats)
+
+    details, details_error = None, None
+    try:
+        details = _parse_crew_details(soup, crew_url)
+    except Exception as e:
+        details_error = e
+
+    roster, roster_error = None, None
+    try:
+        _, roster = _parse_roster(soup, crew_url)
+    except Exception as e:
+        roster_error = e
+
+    return details, details_error, roster, roster_error
+
+
+def _scrape_one(
+    crew_url: str,
+    fetcher: Fetcher,
+    stats: Optional[FetchStats] = None,
+) -> Tuple[Dict[str, str] | None, Exception | None, List[Dict[str, str]] | None, Exception | None]:
+    """Fetch one crew page and parse it (see _parse_page); a fetch error raises."""
+    r = fetcher.get(
+        crew_url,
+        stats,
+        timeout=REQUEST_TIMEOUT,
+        headers={"User-Agent": USER_AGENT},
+    )
+    if r.status_code != 200:
+        raise ValueError(f"HTTP Error: {r.status_code}")
+    return parse_pool.parse(_parse_page, r, stats)
+
+
+def succeeded(result: Tuple) -> bool:
+    """Both halves of the crew page parsed (worth a checkpoint entry)."""
+    return result[1] is None and result[3] is None
+
+
+@dataclass
+class CrewPlan:
+    all_crew_urls: List[str]
+    crew_urls: List[str]
+    carried: Set[str]
+    fingerprint_changed: Set[str]
+    state: Optional[CrawlState]
+    previous: Optional[Previous]
+
+
+def plan_crew_pages(ctx) -> CrewPlan:
+    """Crew URLs from the flag page stage, split into fetch / carry forward."""
+    crews_df: pd.DataFrame = ctx.data["crews"]["crews_df"]
+    if "Crew URL" not in crews_df.columns:
+        raise RuntimeError("crews_df missing required column: 'Crew URL'")
+
+    crew_urls = dedupe_urls(crews_df["Crew URL"].dropna())
+    all_crew_urls = crew_urls
+
+    incremental = ctx.data.get("incremental") or {}
+    state = incremental.get("state")
+    previous = incremental.get("previous")
+
+    carried: set = set()
+    fingerprint_changed = set(crew_urls)
+    if previous is not None:
+        crew_urls, carried, fingerprint_changed = plan_crews(crews_df, previous, state)
+        print(f"Incremental: fetching {len(crew_urls)} crews, carrying {len(carried)} forward", flush=True)
+
+    return CrewPlan(all_crew_urls, crew_urls, carried, fingerprint_changed, state, previous)
+
+
+class CrewCollector:
+    """Streams crew page results into the crew_details / pirate_urls sinks."""
+
+    def __init__(self, plan: CrewPlan, spool: Spool):
+        self.plan = plan
+        self.crew_data = spool.sink("crew_details", CREW_DETAILS_COLUMNS)
+        self.crew_failures = spool.sink("crew_failures", FAILURE_COLUMNS)
+        self.roster_rows = spool.sink("pirate_urls", PIRATE_URL_COLUMNS)
+        self.roster_failures = spool.sink("pirate_urls_failures", FAILURE_COLUMNS)
+
+    def add(self, i: int, crew_url: str, result: Any, error: Optional[Exception]) -> List[Dict[str, str]]:
+        """Record one crew page; returns its roster rows (empty on failure)."""
+        total = len(self.plan.crew_urls)
+        if error is not None:
+            self.crew_failures.write(_failure(crew_url, error))
+            self.roster_failures.write(_failure(crew_url, error))
+            print(f"❌ ({i}/{total}) Failed: {crew_url} - {type(error).__name__}: {error}", flush=True)
+            return []
+
+        details, details_error, roster, roster_error = result
+        if self.plan.state is not None:
+            self.plan.state.mark(crew_url)
+
+        if details is not None:
+            self.crew_data.write(details)
+        else:
+            self.crew_failures.write(_failure(crew_url, details_error))
+
+        if roster is not None:
+            self.roster_rows.write_many(roster)
+        else:
+            self.roster_failures.write(_failure(crew_url, roster_error))
+
+        label = details["Crew Name"] if details else crew_url
+        print(f"✅ ({i}/{total}) Crew {label}: +{len(roster or [])} pirates", flush=True)
+        for err in (details_error, roster_error):
+            if err is not None:
+                print(f"⚠️ ({i}/{total}) {crew_url} - {type(err).__name__}: {err}", flush=True)
+        return roster or []
+
+    def finish(self) -> Dict[str, Any]:
+        plan = self.plan
+        crew_failures_df = self.crew_failures.read()
+        # the roster is the pirate stage's work list, so it's read back
+        # whole; crew details stay in the spool
+        pirate_urls_df = self.roster_rows.read()
+        pirate_urls_failures_df = self.roster_failures.read()
+
+        changed_crews = set(plan.all_crew_urls)
+        if plan.previous is not None:
+            changed_crews = plan.fingerprint_changed | changed_rosters(pirate_urls_df, plan.previous, plan.crew_urls)
+            self.crew_data.write_frame(
+                Previous.rows_for(plan.previous.crew_details_df, "Crew URL", plan.carried, CREW_DETAILS_COLUMNS)
+            )
+            pirate_urls_df = merge_carried(
+                pirate_urls_df,
+                Previous.rows_for(plan.previous.pirate_urls_df, "Crew URL", plan.carried, PIRATE_URL_COLUMNS),
+                "Crew URL",
+                plan.all_crew_urls,
+            )
+
+        crew_details_df = self.crew_data.frame()
+        return {
+            "crew_details": {
+                "crew_details_df": crew_details_df,
+                "crew_failures_df": crew_failures_df,
+                "meta": {
+                    "input_urls": int(len(plan.all_crew_urls)),
+                    "success": int(len(crew_details_df)),
+                    "failures": int(len(crew_failures_df)),
+                },
+            },
+            "pirate_urls": {
+                "pirate_urls_df": pirate_urls_df,
+                "pirate_urls_failures_df": pirate_urls_failures_df,
+                "changed_crews": changed_crews,
+                "meta": {
+                    "input_crews": int(len(plan.all_crew_urls)),
+                    "pirates_found": int(len(pirate_urls_df)),
+                    "failures": int(len(pirate_urls_failures_df)),
+                },
+            },
+        }
+
+
+def run(ctx) -> Dict[str, Any]:
+    plan = plan_crew_pages(ctx)
+    fetcher = get_fetcher()
+    stats = FetchStats()
+    collector = CrewCollector(plan, open_spool(ctx))
+    scrape = resumable(ctx.data.get("checkpoint"), "crew", lambda u: _scrape_one(u, fetcher, stats), succeeded)
+
+    results = fetcher.map(scrape, plan.crew_urls, stats)
+    for i, (crew_url, result, error) in enumerate(results, start=1):
+        collector.add(i, crew_url, result, error)
+
+    return {
+        **collector.finish(),
+        "meta": {
+            "input_urls": int(len(plan.all_crew_urls)),
+            "fetched_urls": int(len(plan.crew_urls)),
+            "carried_crews": int(len(plan.carried)),
+            "workers": fetcher.workers,
+            **stats.as_dict(),
+        },
+    }
@@ -1,12 +1,23 @@
 from __future__ import annotations
 
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 import pandas as pd
-import requests
 from bs4 import BeautifulSoup
 
-FLAG_URL = "https://emerald.puzzlepirates.com/yoweb/flag/info.wm?flagid=10007105"
-BASE = "https://emerald.puzzlepirates.com"
+from scraper.entities import canonical_url, entity_key
+from scraper.fetch import Fetcher, FetchStats, get_fetcher
+from scraper.parsing import make_soup
+from scraper.targets import FLAG_ID_COLUMN, OCEAN_COLUMN, FlagTarget, load_targets
+
+USER_AGENT = "Mozilla/5.0 (compatible; GitHubActionsScraper/1.0)"
+REQUEST_TIMEOUT = 30
+
+CREW_COLUMNS = ["Crew Name", "Crew URL", "Rank", "Members", "Fame", OCEAN_COLUMN, FLAG_ID_COLUMN]
+
+# ctx.data keys (see scraper.scheduler); "targets" is seeded by the pipeline
+INPUTS: list = []
+OPTIONAL_INPUTS = ["targets"]
+OUTPUTS = ["crews"]
 
 def _find_crews_table(soup: BeautifulSoup) -> Optional[Any]:
     """
@@ -28,15 +39,8 @@ def _find_crews_table(soup: BeautifulSoup) -> Optional[Any]:
             return table
     return None
 
-def run(ctx) -> Dict[str, Any]:
-    r = requests.get(
-        FLAG_URL,
-        timeout=30,
-        headers={"User-Agent": "Mozilla/5.0 (compatible; GitHubActionsScraper/1.0)"}
-    )
-    r.raise_for_status()
 
-    soup = BeautifulSoup(r.text, "html.parser")
+def _parse_crews(soup: BeautifulSoup, base: str) -> List[Dict[str, str]]:
     table = _find_crews_table(soup)
 
     if table is None:
@@ -60,7 +64,8 @@ def run(ctx) -> Dict[str, Any]:
         crew_name = crew_link.get_text(strip=True)
         crew_url = crew_link["href"]
         if crew_url.startswith("/"):
-            crew_url = BASE + crew_url
+            crew_url = base + crew_url
+        crew_url = canonical_url(crew_url)
 
         rank = tds[1].get_text(strip=True)
         members = tds[2].get_text(strip=True)
@@ -74,12 +79,53 @@ def run(ctx) -> Dict[str, Any]:
             "Fame": fame,
         })
 
-    df = pd.DataFrame(rows, columns=["Crew Name", "Crew URL", "Rank", "Members", "Fame"])
+    return rows
+
+
+def _scrape_flag(target: FlagTarget, fetcher: Fetcher, stats: Optional[FetchStats] = None) -> List[Dict[str, str]]:
+    r = fetcher.get(
+        target.flag_url,
+        stats,
+        timeout=REQUEST_TIMEOUT,
+        headers={"User-Agent": USER_AGENT},
+        ocean=target.ocean,
+    )
+    if r.status_code != 200:
+        raise RuntimeError(f"HTTP Error fetching flag page {target.key}: {r.status_code}")
+
+    soup = make_soup(r.text, stats=stats)
+    rows = _parse_crews(soup, target.base)
+    for row in rows:
+        row[OCEAN_COLUMN] = target.ocean
+        row[FLAG_ID_COLUMN] = target.flag_id
+    return rows
+
+
+def run(ctx=None) -> Dict[str, Any]:
+    targets = (ctx.data.get("targets") if ctx is not None else None) or load_targets()
+    stats = FetchStats()
+
+    rows: List[Dict[str, str]] = []
+    seen = set()
+    fetcher = get_fetcher()
+    for target, target_rows, error in fetcher.map(lambda t: _scrape_flag(t, fetcher, stats), targets, stats):
+        # a missing flag would look like all of its crews disbanded
+        if error is not None:
+            raise error
+        for row in target_rows:
+            key = entity_key(row["Crew URL"], target.ocean) or row["Crew URL"]
+            if key not in seen:
+                seen.add(key)
+                rows.append(row)
+
+    df = pd.DataFrame(rows, columns=CREW_COLUMNS)
 
     return {
         "crews_df": df,
         "meta": {
-            "flag_url": FLAG_URL,
+            "targets": [t.key for t in targets],
+            "flag_urls": [t.flag_url for t in targets],
             "rows": int(len(df)),
+            **stats.as_dict(),
         }
-    }
\ No newline at end of file
+    }
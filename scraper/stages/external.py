@@ -1,24 +1,43 @@
 from __future__ import annotations
 
-from typing import Dict, Any, List
-import time
+from typing import Dict, Any, List, Optional
+import os
 import urllib.parse
 from pathlib import Path
-from datetime import datetime
 
 import pandas as pd
-import requests
 from bs4 import BeautifulSoup
 
+from scraper import parse_pool
+from scraper.checkpoint import resumable
+from scraper.entities import canonical_url, entity_key
+from scraper.fetch import Fetcher, FetchStats, get_fetcher
+from scraper.history import PartitionedHistory, VersionedHistory
+from scraper.outputs import write_csv
+from scraper.parsing import make_soup
+from scraper.targets import DEFAULT_OCEAN, ocean_base
 
-BASE = "https://emerald.puzzlepirates.com"
+
+# The watchlist holds bare pirate names, all on one ocean
+EXTERNAL_OCEAN = os.getenv("EXTERNAL_OCEAN", DEFAULT_OCEAN)
+BASE = ocean_base(EXTERNAL_OCEAN)
 USER_AGENT = "Mozilla/5.0 (compatible; ExternalPirateWatcher/1.0)"
 REQUEST_TIMEOUT = 30
-SLEEP_SECONDS = 1.0
 
-INPUT_CSV = "data/xoutflag.csv"
-OUTPUT_LATEST_CSV = "data/external_pirates_latest.csv"
-OUTPUT_HISTORY_CSV = "data/external_pirates_history.csv"
+DATA_DIR = os.getenv("OUTPUT_DIR", "data")
+INPUT_CSV = f"{DATA_DIR}/xoutflag.csv"
+OUTPUT_LATEST_CSV = f"{DATA_DIR}/external_pirates_latest.csv"
+# change-only history: a pirate gets a new version only when their data changes
+OUTPUT_HISTORY_DIR = f"{DATA_DIR}/external_pirates_versions"
+# full daily snapshots (partitioned, or the single file before that);
+# replayed into the change-only history on first run
+SNAPSHOT_HISTORY_DIR = f"{DATA_DIR}/external_pirates_history"
+LEGACY_HISTORY_CSV = f"{DATA_DIR}/external_pirates_history.csv"
+
+# ctx.data keys (see scraper.scheduler); the watchlist needs nothing from the flag crawl
+INPUTS: list = []
+OPTIONAL_INPUTS = ["checkpoint"]
+OUTPUTS = ["external"]
 
 
 def _make_absolute(href: str) -> str:
@@ -35,11 +54,8 @@ def _normalize_url(url: str) -> str:
     url = (url or "").strip()
     if not url:
         return ""
-    url = _make_absolute(url)
-    parsed = urllib.parse.urlsplit(url)
-    return urllib.parse.urlunsplit(
-        (parsed.scheme, parsed.netloc, parsed.path, parsed.query, "")
-    )
+    # the same spelling the flag crawl uses, so both share one fetch
+    return canonical_url(_make_absolute(url))
 
 
 def _pirate_name_to_url(name: str) -> str:
@@ -99,7 +115,8 @@ def _load_targets(csv_path: str) -> pd.DataFrame:
     if out.empty:
         return out
 
-    return out.drop_duplicates(subset=["Pirate URL"]).reset_index(drop=True)
+    keys = out["Pirate URL"].map(lambda u: entity_key(u, EXTERNAL_OCEAN) or u)
+    return out.loc[~keys.duplicated()].reset_index(drop=True)
 
 
 def _extract_main_name(soup: BeautifulSoup, pirate_url: str) -> str:
@@ -345,16 +362,25 @@ def _extract_skills(soup: BeautifulSoup) -> Dict[str, str]:
     return out
 
 
-def _scrape_one_pirate(pirate_url: str, session: requests.Session) -> Dict[str, Any]:
-    r = session.get(
+def _scrape_one_pirate(
+    pirate_url: str,
+    fetcher: Fetcher,
+    stats: Optional[FetchStats] = None,
+) -> Dict[str, Any]:
+    r = fetcher.get(
         pirate_url,
+        stats,
         timeout=REQUEST_TIMEOUT,
         headers={"User-Agent": USER_AGENT},
+        ocean=EXTERNAL_OCEAN,
     )
     if r.status_code != 200:
         raise ValueError(f"HTTP Error: {r.status_code}")
+    return parse_pool.parse(_parse_pirate_page, r, stats)
+
 
-    soup = BeautifulSoup(r.text, "html.parser")
+def _parse_pirate_page(html: str, pirate_url: str, stats: Optional[FetchStats] = None) -> Dict[str, Any]:
+    soup = make_soup(html, stats=stats)
 
     row: Dict[str, Any] = {
         "Pirate Name": _extract_main_name(soup, pirate_url),
@@ -371,48 +397,50 @@ def _scrape_one_pirate(pirate_url: str, session: requests.Session) -> Dict[str,
     return row
 
 
-def _write_latest(df: pd.DataFrame, latest_csv: str) -> None:
-    out = Path(latest_csv)
-    out.parent.mkdir(parents=True, exist_ok=True)
-    df.to_csv(out, index=False)
+def _write_latest(df: pd.DataFrame, latest_csv: str) -> bool:
+    # watchlist order; skipped when the snapshot matches the last one
+    return write_csv(df, Path(latest_csv))
 
 
-def _append_history(df: pd.DataFrame, history_csv: str) -> None:
-    out = Path(history_csv)
-    out.parent.mkdir(parents=True, exist_ok=True)
+def _migrate_snapshots(history: VersionedHistory) -> int:
+    # once, into an empty history; the snapshots are left for a human to delete
+    if history.manifest_path.exists():
+        return 0
+    snapshots = PartitionedHistory(Path(SNAPSHOT_HISTORY_DIR), dataset="external_pirates")
+    snapshots.migrate_csv(Path(LEGACY_HISTORY_CSV))
+    if not snapshots.partitions():
+        return 0
+    return history.replay(snapshots.iter_frames())
 
-    now = datetime.utcnow()
-    df = df.copy()
-    df["Scrape Date"] = now.strftime("%Y-%m-%d")
-    df["Scraped At UTC"] = now.strftime("%Y-%m-%d %H:%M:%S")
 
-    if out.exists():
-        try:
-            old = pd.read_csv(out).fillna("")
-            combined = pd.concat([old, df], ignore_index=True, sort=False)
-        except pd.errors.EmptyDataError:
-            combined = df
-        except Exception as e:
-            print(f"⚠️ Could not read existing history file {history_csv}: {e}")
-            combined = df
-    else:
-        combined = df
-
-    combined.to_csv(out, index=False)
+def _append_history(df: pd.DataFrame, watched: List[str], history_dir: str) -> Dict[str, int]:
+    history = VersionedHistory(Path(history_dir), key="Pirate URL", dataset="external_pirates")
+    replayed = _migrate_snapshots(history)
+    if replayed:
+        print(
+            f"Replayed {replayed} snapshot rows from {SNAPSHOT_HISTORY_DIR}/ into {history_dir}/; "
+            f"{SNAPSHOT_HISTORY_DIR}/ is no longer written and can be deleted"
+        )
+    # failed pirates stay at their last version; ones off the watchlist are closed
+    return history.append(df, present=watched)
 
 
 def run(ctx=None) -> Dict[str, Any]:
     targets_df = _load_targets(INPUT_CSV)
-    session = requests.Session()
+    fetcher = get_fetcher()
+    stats = FetchStats()
 
     rows: List[Dict[str, Any]] = []
     failures: List[Dict[str, str]] = []
 
-    for i, rec in enumerate(targets_df.to_dict("records"), start=1):
-        pirate_url = rec["Pirate URL"]
-
-        try:
-            row = _scrape_one_pirate(pirate_url, session)
+    target_urls = targets_df["Pirate URL"].tolist()
+    # watched pirates who are also in the flag are fetched once, by whichever stage gets there first
+    fetcher.entities.retain(target_urls, EXTERNAL_OCEAN)
+    journal = ctx.data.get("checkpoint") if ctx is not None else None
+    scrape = resumable(journal, "external", lambda u: _scrape_one_pirate(u, fetcher, stats))
+    results = fetcher.map(scrape, target_urls, stats)
+    for i, (pirate_url, row, error) in enumerate(results, start=1):
+        if error is None:
             rows.append(row)
             print(
                 f"✅ ({i}/{len(targets_df)}) {row.get('Pirate Name', '')} | "
@@ -420,19 +448,17 @@ def run(ctx=None) -> Dict[str, Any]:
                 f"Flag: {row.get('Flag Name', '')}",
                 flush=True,
             )
-        except Exception as e:
+        else:
             failures.append({
                 "Pirate URL": pirate_url,
-                "Error Type": type(e).__name__,
-                "Message": str(e),
+                "Error Type": type(error).__name__,
+                "Message": str(error),
             })
             print(
-                f"❌ ({i}/{len(targets_df)}) Failed: {pirate_url} - {type(e).__name__}: {e}",
+                f"❌ ({i}/{len(targets_df)}) Failed: {pirate_url} - {type(error).__name__}: {error}",
                 flush=True,
             )
 
-        time.sleep(SLEEP_SECONDS)
-
     pirates_df = pd.DataFrame(rows)
     failures_df = pd.DataFrame(failures, columns=["Pirate URL", "Error Type", "Message"])
 
@@ -465,8 +491,9 @@ def run(ctx=None) -> Dict[str, Any]:
             [c for c in first_cols if c in pirates_df.columns] + sorted(other_cols)
         ]
 
-    _write_latest(pirates_df, OUTPUT_LATEST_CSV)
-    _append_history(pirates_df, OUTPUT_HISTORY_CSV)
+    latest_written = _write_latest(pirates_df, OUTPUT_LATEST_CSV)
+    history_changes = _append_history(pirates_df, target_urls, OUTPUT_HISTORY_DIR)
+    print(f"History: {history_changes}")
 
     return {
         "external_pirates_df": pirates_df,
@@ -477,8 +504,11 @@ def run(ctx=None) -> Dict[str, Any]:
             "failures": int(len(failures_df)),
             "input_csv": INPUT_CSV,
             "latest_csv": OUTPUT_LATEST_CSV,
-            "history_csv": OUTPUT_HISTORY_CSV,
-            "sleep_seconds": SLEEP_SECONDS,
+            "latest_written": latest_written,
+            "history_dir": OUTPUT_HISTORY_DIR,
+            "history_changes": history_changes,
+            "workers": fetcher.workers,
+            **stats.as_dict(),
         }
     }
 
@@ -1,15 +1,21 @@
 from __future__ import annotations
 
-from typing import Dict
-from datetime import datetime, timezone
+from typing import Dict, Any, Union
 
 import pandas as pd
 
+from scraper import changes, skills
+from scraper.sinks import SpooledFrame, iter_chunks, open_spool
+from scraper.targets import FLAG_ID_COLUMN, OCEAN_COLUMN
+
 
 VALID_TITLES = {"King", "Queen", "Prince", "Princess", "Lord", "Lady"}
+ROYAL_COLUMNS = ["Pirate Name", "Flag Role", "Flag Name", "Crew Name", "Crew Rank", "Pirate URL"]
 
-def _utc_now_iso() -> str:
-    return datetime.now(timezone.utc).replace(microsecond=0).isoformat()
+# ctx.data keys (see scraper.scheduler)
+INPUTS = ["crews", "pirate_urls", "pirates", "shoppes"]
+OPTIONAL_INPUTS = ["crew_details", "incremental", "spool"]
+OUTPUTS = ["outputs"]
 
 def _title_clean(s: str) -> str:
     s = (s or "").strip()
@@ -22,24 +28,18 @@ def _only_valid_title(s: str) -> str:
     t = _title_clean(s)
     return t if t in VALID_TITLES else ""
 
-def run(ctx) -> Dict[str, pd.DataFrame]:
-    # Pull stage outputs
-    crews_df = ctx.data["crews"]["crews_df"]
+def _tag(df: Union[pd.DataFrame, SpooledFrame], on: str, tags: pd.DataFrame) -> Union[pd.DataFrame, SpooledFrame]:
+    """Add the Ocean / Flag ID of each row, looked up by its `on` column in `tags`."""
+    if isinstance(df, SpooledFrame):
+        return df.map(lambda chunk: _tag(chunk, on, tags)) if on in df.columns else df
+    if not isinstance(df, pd.DataFrame) or on not in df.columns:
+        return df
+    return df.assign(**{c: df[on].map(tags[c]).fillna("") for c in (OCEAN_COLUMN, FLAG_ID_COLUMN)})
 
-    crew_details_df = ctx.data.get("crew_details", {}).get("crew_details_df", pd.DataFrame())
-    crew_failures_df = ctx.data.get("crew_details", {}).get("crew_failures_df", pd.DataFrame())
-
-    pirate_urls_df = ctx.data["pirate_urls"]["pirate_urls_df"]
-    pirate_urls_failures_df = ctx.data["pirate_urls"]["pirate_urls_failures_df"]
-
-    pirates_df = ctx.data["pirates"]["pirates_df"]
-    pirates_failures_df = ctx.data["pirates"]["pirates_failures_df"]
-
-    shoppes_df = ctx.data["shoppes"]["shoppes_df"]
-    shoppes_failures_df = ctx.data["shoppes"]["shoppes_failures_df"]
-
-    # --- Royals derived from pirates_df ---
-    p = pirates_df.copy()
+def _royal_rows(chunk: pd.DataFrame) -> pd.DataFrame:
+    """The rows of a chunk of pirates whose flag title is a royal one, cut to the royals columns."""
+    # (only the columns royals keep, not a copy of every skill column)
+    p = chunk[[c for c in ROYAL_COLUMNS if c in chunk.columns]].copy()
 
     # Clean title + enforce allowed list
     if "Flag Role" not in p.columns:
@@ -54,20 +54,69 @@ def run(ctx) -> Dict[str, pd.DataFrame]:
 
     # Keep royals output small + useful
     keep_cols = []
-    for c in ["Pirate Name", "Flag Role", "Flag Name", "Crew Name", "Crew Rank", "Pirate URL"]:
+    for c in ROYAL_COLUMNS:
         if c in royals_df.columns:
             keep_cols.append(c)
 
-    royals_df = royals_df[keep_cols].copy() if keep_cols else royals_df
+    return royals_df[keep_cols].copy() if keep_cols else royals_df
+
+def run(ctx) -> Dict[str, Any]:
+    # Pull stage outputs (pirates, shoppes and crew details are spooled,
+    # read here a chunk at a time)
+    crews_df = ctx.data["crews"]["crews_df"]
 
-    # Sort royals: title rank then pirate name
+    crew_details_df = ctx.data.get("crew_details", {}).get("crew_details_df", pd.DataFrame())
+    crew_failures_df = ctx.data.get("crew_details", {}).get("crew_failures_df", pd.DataFrame())
+
+    pirate_urls_df = ctx.data["pirate_urls"]["pirate_urls_df"]
+    pirate_urls_failures_df = ctx.data["pirate_urls"]["pirate_urls_failures_df"]
+
+    pirates_df = ctx.data["pirates"]["pirates_df"]
+    pirates_failures_df = ctx.data["pirates"]["pirates_failures_df"]
+
+    shoppes_df = ctx.data["shoppes"]["shoppes_df"]
+    shoppes_failures_df = ctx.data["shoppes"]["shoppes_failures_df"]
+
+    spool = open_spool(ctx)
+
+    # Key every dataset by ocean and flag (carried rows don't have the columns)
+    pirate_tags = None
+    if {OCEAN_COLUMN, FLAG_ID_COLUMN}.issubset(crews_df.columns):
+        crew_tags = crews_df.drop_duplicates("Crew URL").set_index("Crew URL")
+        crew_details_df = _tag(crew_details_df, "Crew URL", crew_tags)
+        pirate_urls_df = _tag(pirate_urls_df, "Crew URL", crew_tags)
+        pirate_tags = pirate_urls_df.drop_duplicates("Pirate URL").set_index("Pirate URL")
+        pirates_df = _tag(pirates_df, "Pirate URL", pirate_tags)
+        shoppes_df = _tag(shoppes_df, "Source URL", pirate_tags)
+
+    # One pass over the pirates for the royals, the skills as small ints
+    # (experience / standing / archipelago standing) and each skill's top
+    # pirates per flag, ready to filter. Only the royal rows and the
+    # leaderboards are held; the skill levels go to the spool.
+    empty = pd.DataFrame(columns=pirates_df.columns)
+    royal_frames = [_royal_rows(empty)]
+    leaderboards_df = skills.leaderboards(empty, skills.encode_skills(empty))
+    levels = spool.sink("skill_levels", skills.LEVEL_COLUMNS)
+    for chunk in iter_chunks(pirates_df):
+        royal_frames.append(_royal_rows(chunk))
+        chunk_levels = skills.encode_skills(chunk)
+        levels.write_frame(chunk_levels)
+        leaderboards_df = skills.merge_leaderboards(leaderboards_df, skills.leaderboards(chunk, chunk_levels))
+    skill_levels_df = levels.frame().map(skills.read_levels)
+
+    # --- Royals derived from pirates_df ---
+    royals_df = pd.concat(royal_frames, ignore_index=True)
+
+    # Sort royals: title rank then pirate name (then URL, so namesakes
+    # keep one order whatever order the pages came in)
     title_order = {"King": 0, "Queen": 1, "Prince": 2, "Princess": 3, "Lord": 4, "Lady": 5}
     if "Flag Role" in royals_df.columns:
         royals_df["_role_sort"] = royals_df["Flag Role"].map(title_order).fillna(999).astype(int)
         sort_cols = ["_role_sort"]
-        if "Pirate Name" in royals_df.columns:
-            sort_cols.append("Pirate Name")
-        royals_df = royals_df.sort_values(sort_cols, ascending=True).drop(columns=["_role_sort"])
+        for c in ("Pirate Name", "Pirate URL"):
+            if c in royals_df.columns:
+                sort_cols.append(c)
+        royals_df = royals_df.sort_values(sort_cols, ascending=True, kind="mergesort").drop(columns=["_role_sort"])
 
     # Optional: drop duplicates (same pirate can appear multiple times if URLs repeated)
     if "Pirate URL" in royals_df.columns:
@@ -75,13 +124,13 @@ def run(ctx) -> Dict[str, pd.DataFrame]:
     elif "Pirate Name" in royals_df.columns:
         royals_df = royals_df.drop_duplicates(subset=["Pirate Name"])
 
-    # Add an update marker column (handy for the site)
-    stamp = _utc_now_iso()
-    for df in [crews_df, crew_details_df, pirate_urls_df, pirates_df, shoppes_df, royals_df]:
-        if isinstance(df, pd.DataFrame) and not df.empty:
-            df["Last Updated (UTC)"] = stamp
+    if pirate_tags is not None:
+        royals_df = _tag(royals_df, "Pirate URL", pirate_tags)
+
+    # When each file's data last changed is kept in outputs_manifest.json
+    # (see scraper.outputs), so unchanged datasets aren't rewritten
 
-    return {
+    outputs = {
         # core datasets
         "crews.csv": crews_df,
         "crew_details.csv": crew_details_df,
@@ -89,10 +138,41 @@ def run(ctx) -> Dict[str, pd.DataFrame]:
         "pirates.csv": pirates_df,
         "shoppes.csv": shoppes_df,
         "royals.csv": royals_df,
+        "skill_levels.csv": skill_levels_df,
+        "skill_leaderboards.csv": leaderboards_df,
 
         # failure logs
         "crew_failures.csv": crew_failures_df,
         "pirate_urls_failures.csv": pirate_urls_failures_df,
         "pirates_failures.csv": pirates_failures_df,
         "shoppes_failures.csv": shoppes_failures_df,
-    }
\ No newline at end of file
+    }
+
+    # What changed since the outputs of the last run, compared a chunk at
+    # a time with the last run's snapshot
+    baseline = ctx.data.get("incremental", {}).get("baseline")
+    if baseline is not None:
+        current = {"crews": crews_df, "pirates": pirates_df, "shoppes": shoppes_df}
+        # a failed page fetch isn't a pirate leaving
+        failed = set(pirates_failures_df.get("Pirate URL", []))
+        change_logs = {
+            filename: changes.diff_previous(
+                baseline,
+                dataset,
+                current[dataset],
+                keys,
+                spool,
+                ignore_removed=failed if dataset == "pirates" else None,
+            )
+            for filename, (dataset, keys) in changes.CHANGE_LOGS.items()
+        }
+        print(changes.summary(change_logs))
+        outputs.update(change_logs)
+
+    # When each crew / pirate page was last fetched (drives incremental runs)
+    state = ctx.data.get("incremental", {}).get("state")
+    if state is not None:
+        known = set(crews_df.get("Crew URL", [])) | set(pirate_urls_df.get("Pirate URL", []))
+        outputs["crawl_state.csv"] = state.to_df(keep=known)
+
+    return outputs
@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+from typing import Dict, Any, List, Optional, Set, Tuple
+from dataclasses import dataclass
+
+import pandas as pd
+
+from scraper import parse_pool
+from scraper.checkpoint import resumable
+from scraper.entities import dedupe_urls
+from scraper.fetch import Fetcher, FetchStats, get_fetcher
+from scraper.incremental import CrawlState, Previous, order_by, plan_pirates
+from scraper.parsing import make_soup
+from scraper.sinks import Spool, open_spool
+from scraper.stages import pirates, shoppes
+from scraper.stages.pirates import PIRATE_COLUMNS, _parse_pirate
+from scraper.stages.shoppes import SHOP_COLUMNS, _parse_shops
+
+
+USER_AGENT = "Mozilla/5.0 (compatible; GitHubActionsScraper/1.0)"
+REQUEST_TIMEOUT = 30
+
+# Union of what both extractors read
+REGIONS = pirates.REGIONS + [r for r in shoppes.REGIONS if r not in pirates.REGIONS]
+
+FAILURE_COLUMNS = ["Pirate URL", "Error Type", "Message"]
+
+# ctx.data keys (see scraper.scheduler)
+INPUTS = ["pirate_urls"]
+OPTIONAL_INPUTS = ["incremental", "checkpoint", "spool"]
+OUTPUTS = ["pirates", "shoppes"]
+
+
+def _failure(url: str, e: Exception) -> Dict[str, str]:
+    return {
+        "Pirate URL": url,
+        "Error Type": type(e).__name__,
+        "Message": str(e),
+    }
+
+
+def _parse_page(
+    html: str,
+    url: str,
+    stats: Optional[FetchStats] = None,
+) -> Tuple[Dict[str, Any], List[Dict[str, str]], Exception | None]:
+    """
+    Parse one pirate page and run both the pirate and the shoppe
+    extractors on the same document. A shoppe extraction error is
+    returned separately so the pirate row is still kept.
+    """
+    soup = make_soup(html, regions=REGIONS, stats=stats)
+    pirate_row = _parse_pirate(soup, url)
+
+    try:
+        shop_rows = _parse_shops(soup, url)
+        shop_error = None
+    except Exception as e:
+        shop_rows = []
+        shop_error = e
+
+    return pirate_row, shop_rows, shop_error
+
+
+def _scrape_one(
+    url: str,
+    fetcher: Fetcher,
+    stats: Optional[FetchStats] = None,
+) -> Tuple[Dict[str, Any], List[Dict[str, str]], Exception | None]:
+    """Fetch one pirate page and parse it (see _parse_page); a fetch error raises."""
+    r = fetcher.get(url, stats, timeout=REQUEST_TIMEOUT, headers={"User-Agent": USER_AGENT})
+    if r.status_code != 200:
+        raise ValueError(f"HTTP Error: {r.status_code}")
+    return parse_pool.parse(_parse_page, r, stats)
+
+
+def succeeded(result: Tuple) -> bool:
+    """Pirate and shoppe extraction both worked (worth a checkpoint entry)."""
+    return result[2] is None
+
+
+@dataclass
+class PiratePlan:
+    all_urls: List[str]
+    urls: List[str]
+    carried: Set[str]
+    state: Optional[CrawlState]
+    previous: Optional[Previous]
+
+
+def plan_pirate_pages(ctx) -> PiratePlan:
+    """Pirate URLs from the roster stage, split into fetch / carry forward."""
+    pirate_urls_df: pd.DataFrame = ctx.data["pirate_urls"]["pirate_urls_df"]
+    if "Pirate URL" not in pirate_urls_df.columns:
+        raise RuntimeError("pirate_urls_df missing required column: 'Pirate URL'")
+
+    # one fetch per pirate, however many rosters list them
+    urls = dedupe_urls(pirate_urls_df["Pirate URL"].dropna())
+    all_urls = urls
+
+    incremental = ctx.data.get("incremental") or {}
+    state = incremental.get("state")
+    previous = incremental.get("previous")
+
+    carried: set = set()
+    if previous is not None:
+        changed_crews = ctx.data["pirate_urls"].get("changed_crews", set())
+        urls, carried = plan_pirates(pirate_urls_df, previous, state, changed_crews)
+        print(f"Incremental: fetching {len(urls)} pirates, carrying {len(carried)} forward", flush=True)
+
+    return PiratePlan(all_urls, urls, carried, state, previous)
+
+
+class PirateCollector:
+    """
+    Streams pirate page results into the pirates / shoppes sinks as they
+    arrive. Results may come in any order (the outputs are written in
+    key order); finish() adds the carried-forward rows to the sinks and
+    hands them on as SpooledFrames.
+    """
+
+    def __init__(self, state: Optional[CrawlState], spool: Spool, total: Optional[int] = None):
+        self.state = state
+        self.total = total
+        self.fetched = 0
+        self.pirate_rows = spool.sink("pirates", PIRATE_COLUMNS)
+        self.pirate_failures = spool.sink("pirates_failures", FAILURE_COLUMNS)
+        self.shop_rows = spool.sink("shoppes", SHOP_COLUMNS)
+        self.shop_failures = spool.sink("shoppes_failures", FAILURE_COLUMNS)
+
+    def add(self, i: int, url: str, result: Any, error: Optional[Exception]) -> None:
+        self.fetched += 1
+        progress = f"{i}/{self.total}" if self.total is not None else f"{i}"
+        if error is not None:
+            self.pirate_failures.write(_failure(url, error))
+            self.shop_failures.write(_failure(url, error))
+            print(f"❌ ({progress}) Failed: {url} - {type(error).__name__}: {error}", flush=True)
+            return
+
+        row, shops, shop_error = result
+        if self.state is not None:
+            self.state.mark(url)
+        self.pirate_rows.write(row)
+        self.shop_rows.write_many(shops)
+        if shop_error is not None:
+            self.shop_failures.write(_failure(url, shop_error))
+        print(
+            f"✅ ({progress}) {row.get('Pirate Name','(unknown)')} (+{len(shops)} shoppes)",
+            flush=True,
+        )
+
+    def finish(self, all_urls: List[str], carried: Set[str], previous: Optional[Previous]) -> Dict[str, Any]:
+        if previous is not None:
+            previous.carry("pirates", "Pirate URL", carried, self.pirate_rows)
+            previous.carry("shoppes", "Source URL", carried, self.shop_rows)
+        # rows stay in the spool (finalize and the store read them a chunk
+        # at a time); only the failures, which are few, become DataFrames
+        pirates_df = self.pirate_rows.frame()
+        shoppes_df = self.shop_rows.frame()
+        pirates_failures_df = order_by(self.pirate_failures.read(), "Pirate URL", all_urls)
+        shoppes_failures_df = order_by(self.shop_failures.read(), "Pirate URL", all_urls)
+
+        return {
+            "pirates": {
+                "pirates_df": pirates_df,
+                "pirates_failures_df": pirates_failures_df,
+                "meta": {
+                    "input_urls": int(len(all_urls)),
+                    "success": int(len(pirates_df)),
+                    "failures": int(len(pirates_failures_df)),
+                },
+            },
+            "shoppes": {
+                "shoppes_df": shoppes_df,
+                "shoppes_failures_df": shoppes_failures_df,
+                "meta": {
+                    "input_urls": int(len(all_urls)),
+                    "rows": int(len(shoppes_df)),
+                    "failures": int(len(shoppes_failures_df)),
+                },
+            },
+        }
+
+
+def run(ctx) -> Dict[str, Any]:
+    plan = plan_pirate_pages(ctx)
+    fetcher = get_fetcher()
+    stats = FetchStats()
+    collector = PirateCollector(plan.state, open_spool(ctx), total=len(plan.urls))
+    scrape = resumable(ctx.data.get("checkpoint"), "pirate", lambda u: _scrape_one(u, fetcher, stats), succeeded)
+
+    results = fetcher.map(scrape, plan.urls, stats)
+    for i, (url, result, error) in enumerate(results, start=1):
+        collector.add(i, url, result, error)
+
+    return {
+        **collector.finish(plan.all_urls, plan.carried, plan.previous),
+        "meta": {
+            "input_urls": int(len(plan.all_urls)),
+            "fetched_urls": int(len(plan.urls)),
+            "carried_pirates": int(len(plan.carried)),
+            "workers": fetcher.workers,
+            **stats.as_dict(),
+        },
+    }
@@ -1,18 +1,22 @@
 from __future__ import annotations
 
-from typing import Dict, Any, List, Tuple
-import time
-import urllib.parse
+from typing import Dict, Any, List, Optional, Tuple
 
-import pandas as pd
-import requests
 from bs4 import BeautifulSoup
 
+from scraper.entities import canonical_url, entity_key
+from scraper.fetch import Fetcher, FetchStats
+from scraper.parsing import Region, make_soup
+from scraper.targets import site_root
+
 
-BASE = "https://emerald.puzzlepirates.com"
 USER_AGENT = "Mozilla/5.0 (compatible; GitHubActionsScraper/1.0)"
 REQUEST_TIMEOUT = 30
-SLEEP_SECONDS = 1.0  # be kind
+
+# Everything before the "jobbing pirates" marker (for partial parsing)
+REGIONS = [Region(anchor=r"\A", until=r'<img[^>]*/yoweb/images/crew-jobbing\.png')]
+
+PIRATE_URL_COLUMNS = ["Pirate URL", "Pirate Name", "Crew Name", "Crew URL"]
 
 
 def _get_crew_name(soup: BeautifulSoup) -> str:
@@ -21,69 +25,61 @@ def _get_crew_name(soup: BeautifulSoup) -> str:
 
 
 def _is_pirate_link(href: str) -> bool:
-    return "/yoweb/pirate.wm" in href and "target=" in href
+    return bool(href) and "/yoweb/pirate.wm" in href and "target=" in href
 
 
-def _make_absolute(href: str) -> str:
+def _make_absolute(href: str, base: str) -> str:
     if href.startswith("http://") or href.startswith("https://"):
         return href
     if href.startswith("/"):
-        return BASE + href
-    return BASE + "/" + href
+        return base + href
+    return base + "/" + href
 
 
-def _scrape_one_crew(crew_url: str, session: requests.Session) -> Tuple[str, List[Dict[str, str]]]:
-    r = session.get(
-        crew_url,
-        timeout=REQUEST_TIMEOUT,
-        headers={"User-Agent": USER_AGENT},
-    )
-    if r.status_code != 200:
-        raise ValueError(f"HTTP Error: {r.status_code}")
+def _roster_links(soup: BeautifulSoup) -> List[Any]:
+    """
+    Pirate links on the crew page, in document order, up to the
+    "jobbing pirates" marker image (used as a cutoff).
 
-    soup = BeautifulSoup(r.text, "html.parser")
-    crew_name = _get_crew_name(soup)
+    Uses find_all / find_all_previous with an href filter instead of
+    walking every node under <body>.
+    """
+    if not soup.body:
+        return []
+
+    jobbing_img = soup.body.find("img", {"src": "/yoweb/images/crew-jobbing.png"})
+    if jobbing_img is None:
+        return soup.body.find_all("a", href=_is_pirate_link)
+
+    links = jobbing_img.find_all_previous("a", href=_is_pirate_link)
+    links.reverse()
+    return links
 
-    # Find "jobbing pirates" marker image (used as a cutoff)
-    jobbing_img = soup.find("img", {"src": "/yoweb/images/crew-jobbing.png"})
+
+def _parse_roster(soup: BeautifulSoup, crew_url: str) -> Tuple[str, List[Dict[str, str]]]:
+    crew_name = _get_crew_name(soup)
+    # roster links are relative to the crew's own ocean
+    base = site_root(crew_url)
 
     pirate_rows: List[Dict[str, str]] = []
-    jobbing_reached = False
-
-    # Strategy:
-    # Walk through the document in order, but only consider pirate links.
-    # Once we hit the jobbing marker, stop collecting.
-    for el in soup.body.descendants if soup.body else []:
-        if jobbing_img and el == jobbing_img:
-            jobbing_reached = True
-
-        if jobbing_reached:
-            continue
-
-        if getattr(el, "name", None) == "a" and el.has_attr("href"):
-            href = el["href"]
-            if _is_pirate_link(href):
-                pirate_name = el.get_text(strip=True)
-                pirate_url = _make_absolute(href)
-
-                # (Optional) normalize URL (keeps it stable)
-                # You can remove this if you want the exact href.
-                parsed = urllib.parse.urlsplit(pirate_url)
-                pirate_url = urllib.parse.urlunsplit((parsed.scheme, parsed.netloc, parsed.path, parsed.query, ""))
-
-                pirate_rows.append({
-                    "Pirate URL": pirate_url,
-                    "Pirate Name": pirate_name,
-                    "Crew Name": crew_name,
-                    "Crew URL": crew_url,
-                })
+    for el in _roster_links(soup):
+        pirate_name = el.get_text(strip=True)
+        # one spelling per pirate, whichever page linked them
+        pirate_url = canonical_url(_make_absolute(el["href"], base))
+
+        pirate_rows.append({
+            "Pirate URL": pirate_url,
+            "Pirate Name": pirate_name,
+            "Crew Name": crew_name,
+            "Crew URL": crew_url,
+        })
 
     # Deduplicate (crew pages can contain repeats)
     if pirate_rows:
         seen = set()
         deduped = []
         for row in pirate_rows:
-            key = (row["Pirate URL"], row["Pirate Name"], row["Crew Name"])
+            key = (entity_key(row["Pirate URL"]) or row["Pirate URL"], row["Pirate Name"], row["Crew Name"])
             if key in seen:
                 continue
             seen.add(key)
@@ -93,54 +89,19 @@ def _scrape_one_crew(crew_url: str, session: requests.Session) -> Tuple[str, Lis
     return crew_name, pirate_rows
 
 
-def run(ctx) -> Dict[str, Any]:
-    # Prefer the crew URLs we already scraped from the flag page
-    crews_df: pd.DataFrame = ctx.data["crews"]["crews_df"]
-    if "Crew URL" not in crews_df.columns:
-        raise RuntimeError("crews_df missing required column: 'Crew URL'")
-
-    crew_urls = (
-        crews_df["Crew URL"].dropna().astype(str).map(str.strip)
-    )
-    crew_urls = crew_urls[crew_urls != ""].unique().tolist()
-
-    session = requests.Session()
-
-    all_rows: List[Dict[str, str]] = []
-    failures: List[Dict[str, str]] = []
-
-    for i, crew_url in enumerate(crew_urls, start=1):
-        try:
-            crew_name, rows = _scrape_one_crew(crew_url, session)
-            all_rows.extend(rows)
-            print(f"✅ ({i}/{len(crew_urls)}) Crew {crew_name}: +{len(rows)} pirates", flush=True)
-        except Exception as e:
-            failures.append({
-                "Crew URL": crew_url,
-                "Error Type": type(e).__name__,
-                "Message": str(e),
-            })
-            print(f"❌ ({i}/{len(crew_urls)}) Failed: {crew_url} - {type(e).__name__}: {e}", flush=True)
-
-        time.sleep(SLEEP_SECONDS)
-
-    pirate_urls_df = pd.DataFrame(
-        all_rows,
-        columns=["Pirate URL", "Pirate Name", "Crew Name", "Crew URL"]
-    )
-
-    failures_df = pd.DataFrame(
-        failures,
-        columns=["Crew URL", "Error Type", "Message"]
+def _scrape_one_crew(
+    crew_url: str,
+    fetcher: Fetcher,
+    stats: Optional[FetchStats] = None,
+) -> Tuple[str, List[Dict[str, str]]]:
+    r = fetcher.get(
+        crew_url,
+        stats,
+        timeout=REQUEST_TIMEOUT,
+        headers={"User-Agent": USER_AGENT},
     )
+    if r.status_code != 200:
+        raise ValueError(f"HTTP Error: {r.status_code}")
 
-    return {
-        "pirate_urls_df": pirate_urls_df,
-        "pirate_urls_failures_df": failures_df,
-        "meta": {
-            "input_crews": int(len(crew_urls)),
-            "pirates_found": int(len(pirate_urls_df)),
-            "failures": int(len(failures_df)),
-            "sleep_seconds": SLEEP_SECONDS,
-        }
-    }
\ No newline at end of file
+    soup = make_soup(r.text, regions=REGIONS, stats=stats)
+    return _parse_roster(soup, crew_url)
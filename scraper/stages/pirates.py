@@ -1,17 +1,17 @@
 from __future__ import annotations
 
-from typing import Dict, Any, List
+from typing import Dict, Any, Optional
 import re
-import time
 
-import pandas as pd
-import requests
 from bs4 import BeautifulSoup
 
+from scraper import parse_pool
+from scraper.fetch import Fetcher, FetchStats
+from scraper.parsing import Region, make_soup
+
 
 USER_AGENT = "Mozilla/5.0 (compatible; GitHubActionsScraper/1.0)"
 REQUEST_TIMEOUT = 30
-SLEEP_SECONDS = 1.0  # be kind
 
 ALL_SKILLS = [
     "Sailing", "Rigging", "Carpentry", "Patching", "Bilging", "Gunning", "Treasure Haul", "Navigating",
@@ -19,6 +19,18 @@ ALL_SKILLS = [
     "Poker", "Distilling", "Alchemistry", "Shipwrightery", "Blacksmithing", "Foraging", "Weaving"
 ]
 
+PIRATE_COLUMNS = ["Pirate URL", "Pirate Name", "Crew Rank", "Crew Name", "Flag Role", "Flag Name"] + ALL_SKILLS
+
+# Page regions _parse_pirate reads (for partial parsing)
+REGIONS = [
+    Region(anchor=r"<title\b", tag="title"),
+    Region(anchor=r'<font[^>]*\bsize="?\+1"?', tag="font"),
+    Region(anchor=r'<td[^>]*\bwidth="?190"?', tag="td"),
+    Region(anchor=r"<b>\s*Piracy Skills\s*</b>", tag="table"),
+    Region(anchor=r"<b>\s*Carousing Skills\s*</b>", tag="table"),
+    Region(anchor=r"<b>\s*Crafting Skills\s*</b>", tag="table"),
+]
+
 CREW_RE = re.compile(r"(\w+)\s+of the crew\s+(.+)", re.IGNORECASE)
 FLAG_RE = re.compile(r"(\w+)\s+of the flag\s+(.+)", re.IGNORECASE)
 
@@ -34,13 +46,7 @@ def _safe_text(node) -> str:
     return node.get_text(strip=True) if node else ""
 
 
-def _scrape_one(url: str, session: requests.Session) -> Dict[str, Any]:
-    r = session.get(url, timeout=REQUEST_TIMEOUT, headers={"User-Agent": USER_AGENT})
-    if r.status_code != 200:
-        raise ValueError(f"HTTP Error: {r.status_code}")
-
-    soup = BeautifulSoup(r.text, "html.parser")
-
+def _parse_pirate(soup: BeautifulSoup, url: str) -> Dict[str, Any]:
     # Pirate name
     pirate_name = ""
     name_tag = soup.find("font", attrs={"size": "+1"})
@@ -99,50 +105,13 @@ def _scrape_one(url: str, session: requests.Session) -> Dict[str, Any]:
     }
 
 
-def run(ctx) -> Dict[str, Any]:
-    pirate_urls_df: pd.DataFrame = ctx.data["pirate_urls"]["pirate_urls_df"]
-    if "Pirate URL" not in pirate_urls_df.columns:
-        raise RuntimeError("pirate_urls_df missing required column: 'Pirate URL'")
-
-    urls = (
-        pirate_urls_df["Pirate URL"]
-        .dropna()
-        .astype(str)
-        .map(str.strip)
-    )
-    urls = urls[urls != ""].unique().tolist()
-
-    session = requests.Session()
-
-    rows: List[Dict[str, Any]] = []
-    failures: List[Dict[str, str]] = []
-
-    for i, url in enumerate(urls, start=1):
-        try:
-            row = _scrape_one(url, session)
-            rows.append(row)
-            print(f"✅ ({i}/{len(urls)}) {row.get('Pirate Name','(unknown)')}", flush=True)
-        except Exception as e:
-            failures.append({
-                "Pirate URL": url,
-                "Error Type": type(e).__name__,
-                "Message": str(e),
-            })
-            print(f"❌ ({i}/{len(urls)}) Failed: {url} - {type(e).__name__}: {e}", flush=True)
-
-        time.sleep(SLEEP_SECONDS)
+def _scrape_one(url: str, fetcher: Fetcher, stats: Optional[FetchStats] = None) -> Dict[str, Any]:
+    r = fetcher.get(url, stats, timeout=REQUEST_TIMEOUT, headers={"User-Agent": USER_AGENT})
+    if r.status_code != 200:
+        raise ValueError(f"HTTP Error: {r.status_code}")
+    return parse_pool.parse(_parse_page, r, stats)
 
-    cols = ["Pirate URL", "Pirate Name", "Crew Rank", "Crew Name", "Flag Role", "Flag Name"] + ALL_SKILLS
-    pirates_df = pd.DataFrame(rows, columns=cols)
-    failures_df = pd.DataFrame(failures, columns=["Pirate URL", "Error Type", "Message"])
 
-    return {
-        "pirates_df": pirates_df,
-        "pirates_failures_df": failures_df,
-        "meta": {
-            "input_urls": int(len(urls)),
-            "success": int(len(pirates_df)),
-            "failures": int(len(failures_df)),
-            "sleep_seconds": SLEEP_SECONDS,
-        }
-    }
\ No newline at end of file
+def _parse_page(html: str, url: str, stats: Optional[FetchStats] = None) -> Dict[str, Any]:
+    soup = make_soup(html, regions=REGIONS, stats=stats)
+    return _parse_pirate(soup, url)
@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+from typing import Dict, Any, Iterator, List, Set
+import os
+import queue
+import threading
+import time
+
+from scraper.checkpoint import resumable
+from scraper.entities import canonical_url, dedupe_urls, entity_key
+from scraper.fetch import FetchStats, get_fetcher
+from scraper.incremental import pirate_needs_fetch, roster_hash
+from scraper.sinks import open_spool
+from scraper.stages import crew_pages, pirate_pages
+from scraper.stages.crew_pages import CrewCollector, plan_crew_pages
+from scraper.stages.pirate_pages import PirateCollector
+
+
+# Pirate URLs parsed from crew rosters but not yet handed to a fetch
+# worker. When full, crew page processing waits (backpressure).
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "256"))
+
+# ctx.data keys (see scraper.scheduler): replaces crew_pages + pirate_pages
+INPUTS = ["crews"]
+OPTIONAL_INPUTS = ["incremental", "checkpoint", "spool"]
+OUTPUTS = ["crew_details", "pirate_urls", "pirates", "shoppes"]
+
+_DONE = object()
+
+
+class _Feed:
+    """Bounded hand-off from the crew side to the pirate fetchers."""
+
+    def __init__(self, maxsize: int):
+        self._queue: queue.Queue = queue.Queue(maxsize=max(1, maxsize))
+        self._closed = threading.Event()
+
+    def put(self, item: Any) -> bool:
+        """Blocks while the queue is full; False once the consumer has gone away."""
+        while not self._closed.is_set():
+            try:
+                self._queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def close(self) -> None:
+        self._closed.set()
+
+    def __iter__(self) -> Iterator[Any]:
+        while True:
+            item = self._queue.get()
+            if item is _DONE:
+                return
+            yield item
+
+
+def run(ctx) -> Dict[str, Any]:
+    """
+    crew_pages and pirate_pages without the barrier between them: each
+    crew's roster is queued for pirate fetching as soon as it's parsed,
+    so pirate pages load while later crew pages are still in flight.
+    Outputs are the same datasets the two stages produce.
+    """
+    plan = plan_crew_pages(ctx)
+    state, previous = plan.state, plan.previous
+    fetcher = get_fetcher()
+    stats = FetchStats()
+    spool = open_spool(ctx)
+    crews = CrewCollector(plan, spool)
+    pirates = PirateCollector(state, spool)
+    feed = _Feed(STREAM_QUEUE_SIZE)
+    journal = ctx.data.get("checkpoint")
+    scrape_crew = resumable(journal, "crew", lambda u: crew_pages._scrape_one(u, fetcher, stats), crew_pages.succeeded)
+    scrape_pirate = resumable(
+        journal, "pirate", lambda u: pirate_pages._scrape_one(u, fetcher, stats), pirate_pages.succeeded
+    )
+
+    prev_pirates: Set[str] = set()
+    prev_hashes: Dict[str, str] = {}
+    if previous is not None:
+        prev_pirates = previous.keys("pirates", "Pirate URL")
+        prev_hashes = previous.roster_hashes()
+
+    seen: Set[Any] = set()
+    sent: Set[str] = set()
+    producer_error: List[BaseException] = []
+
+    def offer(rows: List[Dict[str, str]], crew_url: str, changed: bool) -> bool:
+        changed_crews = {crew_url} if changed else set()
+        for rec in rows:
+            url = canonical_url(str(rec.get("Pirate URL") or ""))
+            key = entity_key(url) or url
+            if not url or key in seen:
+                continue
+            seen.add(key)
+            if previous is not None and not pirate_needs_fetch(url, crew_url, prev_pirates, changed_crews, state):
+                continue
+            sent.add(url)
+            if not feed.put(url):
+                return False
+        return True
+
+    def produce() -> None:
+        cpu = time.thread_time()
+        try:
+            # Rosters of carried crews are known up front
+            if previous is not None:
+                carried_rows = previous.rows_for(
+                    previous.pirate_urls_df, "Crew URL", plan.carried, crew_pages.PIRATE_URL_COLUMNS
+                )
+                for crew_url, group in carried_rows.groupby("Crew URL", sort=False):
+                    if not offer(group.to_dict("records"), crew_url, changed=False):
+                        return
+
+            results = fetcher.map(scrape_crew, plan.crew_urls, stats)
+            for i, (crew_url, result, error) in enumerate(results, start=1):
+                roster = crews.add(i, crew_url, result, error)
+                changed = True
+                if previous is not None and error is None:
+                    changed = (
+                        crew_url in plan.fingerprint_changed
+                        or roster_hash(r["Pirate URL"] for r in roster) != prev_hashes.get(crew_url)
+                    )
+                if not offer(roster, crew_url, changed):
+                    return
+        except BaseException as e:
+            producer_error.append(e)
+        finally:
+            feed.put(_DONE)
+            stats.record_cpu(time.thread_time() - cpu)
+
+    producer = threading.Thread(target=produce, name="roster-stream", daemon=True)
+    producer.start()
+    try:
+        results = fetcher.map(scrape_pirate, feed, stats)
+        for i, (url, result, error) in enumerate(results, start=1):
+            pirates.add(i, url, result, error)
+    finally:
+        feed.close()
+        producer.join()
+    if producer_error:
+        raise producer_error[0]
+
+    crew_out = crews.finish()
+    pirate_urls_df = crew_out["pirate_urls"]["pirate_urls_df"]
+    all_urls = dedupe_urls(pirate_urls_df["Pirate URL"].dropna())
+    carried = set(all_urls) - sent if previous is not None else set()
+
+    return {
+        **crew_out,
+        **pirates.finish(all_urls, carried, previous),
+        "meta": {
+            "input_urls": int(len(plan.all_crew_urls)),
+            "fetched_urls": int(len(plan.crew_urls)),
+            "carried_crews": int(len(plan.carried)),
+            "carried_pirates": int(len(carried)),
+            "fetched_pirates": int(pirates.fetched),
+            "queue_size": STREAM_QUEUE_SIZE,
+            "workers": fetcher.workers,
+            **stats.as_dict(),
+        },
+    }
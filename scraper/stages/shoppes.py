@@ -1,18 +1,31 @@
 from __future__ import annotations
 
 import re
-import time
-from typing import Dict, Any, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
-import pandas as pd
-import requests
 from bs4 import BeautifulSoup
 
+from scraper import parse_pool
+from scraper.fetch import Fetcher, FetchStats
+from scraper.parsing import Region, make_soup
+
 
-BASE = "https://emerald.puzzlepirates.com"
 USER_AGENT = "Mozilla/5.0 (compatible; GitHubActionsScraper/1.0)"
 REQUEST_TIMEOUT = 30
-SLEEP_SECONDS = 1.0  # be kind
+
+SHOP_COLUMNS = [
+    "Pirate Name",
+    "Crew Name",
+    "Shop Type",
+    "Shop size",
+    "Shop Name",
+    "Location",
+    "Display Shop",
+    "Ownership Role",
+    "Parse Status",
+    "Source URL",
+    "Shop Key",
+]
 
 SHOP_TYPE_CANON = {
     "apothecary": "Apothecary",
@@ -29,12 +42,22 @@ SHOP_TYPE_CANON = {
 # icon: /yoweb/images/shop-<slug>.png  OR  /yoweb/images/shop-managed-<slug>.png
 TYPE_AND_ROLE_RE = re.compile(r"/yoweb/images/shop(-managed)?-([a-z\-]+)\.png", re.I)
 
+# Page regions _parse_shops reads (for partial parsing): the name and the left column
+REGIONS = [
+    Region(anchor=r'<font[^>]*\bsize="?\+1"?', tag="font"),
+    Region(anchor=r'<td[^>]*\bwidth="?190"?', tag="td"),
+]
+
 # matches a single "Name on Location" chunk
 NAME_LOC_RE = re.compile(r"^(?P<name>.+?)\s+on\s+(?P<loc>.+)$", re.I)
 
+# start of each " on " between a shop name and its location (overlapping)
+ON_SEP_RE = re.compile(r"\son(?=\s)", re.I)
+
 
 def _clean(s: str) -> str:
-    return re.sub(r"\s+", " ", s or "").strip()
+    # same as re.sub(r"\s+", " ", s).strip(): split() and \s agree on whitespace
+    return " ".join((s or "").split())
 
 
 def _humanize_slug(slug: str) -> str:
@@ -69,6 +92,10 @@ def _split_shop_chunks(text: str) -> List[str]:
     Only splits on commas that appear to start another full
     '[shop name] on [location]' segment, which makes it safer
     for shop names that may contain commas.
+
+    One pass: the " on " separators are found once up front, then each
+    comma is a split if there's a separator between the chunk start and
+    the comma (with text on both sides of it) and one after the comma.
     """
     txt = _clean(text)
     txt = re.sub(r"^(Owns:|Manages:)\s*", "", txt, flags=re.I)
@@ -76,18 +103,30 @@ def _split_shop_chunks(text: str) -> List[str]:
     if not txt:
         return []
 
+    # _clean collapsed whitespace, so a separator is exactly " on " and
+    # neither side of a comma has more than one space to strip
+    seps = [m.start() for m in ON_SEP_RE.finditer(txt)]
+    n = len(txt)
+    # the remainder after a comma is a full chunk iff the last separator
+    # with text after it starts past the remainder's first character
+    last_sep = max((i for i in seps if i + 4 < n), default=-1)
+
     chunks: List[str] = []
     start = 0
+    lo = 0  # seps[lo] is the first separator past the chunk's first character
 
-    # Find commas that are followed by another "... on ..." pattern
-    for m in re.finditer(r",\s*(?=.+?\s+on\s+)", txt, flags=re.I):
-        candidate = txt[start:m.start()].strip()
-        remainder = txt[m.end():].strip()
+    comma = txt.find(",")
+    while comma != -1:
+        first = start + 1 if txt[start:start + 1] == " " else start
+        end = comma - 1 if comma > 0 and txt[comma - 1] == " " else comma
+        rest = comma + 2 if txt[comma + 1:comma + 2] == " " else comma + 1
 
-        # Only split here if both sides look like valid shop chunks
-        if NAME_LOC_RE.search(candidate) and NAME_LOC_RE.search(remainder):
-            chunks.append(candidate)
-            start = m.end()
+        while lo < len(seps) and seps[lo] <= first:
+            lo += 1
+        if lo < len(seps) and seps[lo] + 4 < end and last_sep > rest:
+            chunks.append(txt[start:comma].strip())
+            start = rest
+        comma = txt.find(",", comma + 1)
 
     final_chunk = txt[start:].strip()
     if final_chunk:
@@ -223,13 +262,7 @@ def extract_shop_rows(
     return rows
 
 
-def _scrape_one(url: str, session: requests.Session) -> List[Dict[str, str]]:
-    r = session.get(url, timeout=REQUEST_TIMEOUT, headers={"User-Agent": USER_AGENT})
-    if r.status_code != 200:
-        raise ValueError(f"HTTP Error: {r.status_code}")
-
-    soup = BeautifulSoup(r.text, "html.parser")
-
+def _parse_shops(soup: BeautifulSoup, url: str) -> List[Dict[str, str]]:
     name_el = soup.find("font", attrs={"size": "+1"})
     pirate_name = name_el.get_text(strip=True) if name_el else ""
 
@@ -249,62 +282,13 @@ def _scrape_one(url: str, session: requests.Session) -> List[Dict[str, str]]:
     return extract_shop_rows(soup, pirate_name, crew_name, url)
 
 
-def run(ctx) -> Dict[str, Any]:
-    pirate_urls_df: pd.DataFrame = ctx.data["pirate_urls"]["pirate_urls_df"]
-    if "Pirate URL" not in pirate_urls_df.columns:
-        raise RuntimeError("pirate_urls_df missing required column: 'Pirate URL'")
-
-    urls = (
-        pirate_urls_df["Pirate URL"]
-        .dropna()
-        .astype(str)
-        .map(str.strip)
-    )
-    urls = urls[urls != ""].unique().tolist()
-
-    session = requests.Session()
-
-    all_rows: List[Dict[str, str]] = []
-    failures: List[Dict[str, str]] = []
-
-    for i, url in enumerate(urls, start=1):
-        try:
-            rows = _scrape_one(url, session)
-            all_rows.extend(rows)
-            print(f"✅ ({i}/{len(urls)}) Shoppes scraped for {url} (+{len(rows)})", flush=True)
-        except Exception as e:
-            failures.append({
-                "Pirate URL": url,
-                "Error Type": type(e).__name__,
-                "Message": str(e),
-            })
-            print(f"❌ ({i}/{len(urls)}) Failed: {url} - {type(e).__name__}: {e}", flush=True)
-
-        time.sleep(SLEEP_SECONDS)
-
-    columns = [
-        "Pirate Name",
-        "Crew Name",
-        "Shop Type",
-        "Shop size",
-        "Shop Name",
-        "Location",
-        "Display Shop",
-        "Ownership Role",
-        "Parse Status",
-        "Source URL",
-        "Shop Key",
-    ]
-    shoppes_df = pd.DataFrame(all_rows, columns=columns)
-    failures_df = pd.DataFrame(failures, columns=["Pirate URL", "Error Type", "Message"])
-
-    return {
-        "shoppes_df": shoppes_df,
-        "shoppes_failures_df": failures_df,
-        "meta": {
-            "input_urls": int(len(urls)),
-            "rows": int(len(shoppes_df)),
-            "failures": int(len(failures_df)),
-            "sleep_seconds": SLEEP_SECONDS,
-        }
-    }
\ No newline at end of file
+def _scrape_one(url: str, fetcher: Fetcher, stats: Optional[FetchStats] = None) -> List[Dict[str, str]]:
+    r = fetcher.get(url, stats, timeout=REQUEST_TIMEOUT, headers={"User-Agent": USER_AGENT})
+    if r.status_code != 200:
+        raise ValueError(f"HTTP Error: {r.status_code}")
+    return parse_pool.parse(_parse_page, r, stats)
+
+
+def _parse_page(html: str, url: str, stats: Optional[FetchStats] = None) -> List[Dict[str, str]]:
+    soup = make_soup(html, regions=REGIONS, stats=stats)
+    return _parse_shops(soup, url)
@@ -0,0 +1,285 @@
+from __future__ import annotations
+
+from typing import Dict, Any, IO, Iterable, Iterator, List, Optional, Tuple, Union
+from datetime import datetime, timezone
+from pathlib import Path
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+import pandas as pd
+
+from scraper.outputs import CHUNK_ROWS
+from scraper.sinks import SpooledFrame, iter_chunks
+
+
+STORE_FILENAME = "store.sqlite"
+
+# Indexed wherever a dataset has them (Source URL is a shop row's pirate)
+INDEXED_COLUMNS = ["Pirate URL", "Source URL", "Crew Name", "Shop Key", "Location"]
+
+# Named queries for the CLI; they join on the indexed columns
+QUERIES = {
+    "royal_shops": """
+        SELECT r."Flag Role" AS "Title", s.*
+        FROM shoppes s JOIN royals r ON r."Pirate URL" = s."Source URL"
+        ORDER BY s."Shop Key", s."Pirate Name"
+    """,
+    "crew_shops": """
+        SELECT s."Crew Name", COUNT(*) AS "Shops", COUNT(DISTINCT s."Location") AS "Islands"
+        FROM shoppes s GROUP BY s."Crew Name" ORDER BY "Shops" DESC, s."Crew Name"
+    """,
+}
+
+
+def table_name(filename: str) -> str:
+    """Dataset table for an output file: 'pirates.csv' -> 'pirates'."""
+    return Path(filename).stem
+
+
+def _quote(identifier: str) -> str:
+    return '"' + str(identifier).replace('"', '""') + '"'
+
+
+def _as_text(df: pd.DataFrame) -> pd.DataFrame:
+    """Every value as the text to_csv would write, blanks as None (NULL)."""
+    return df.astype(object).astype(str).mask(df.isna().to_numpy(dtype=bool), None)
+
+
+def _order_by(columns: List[str], sort_keys: Optional[Iterable[str]]) -> str:
+    """ORDER BY for outputs.stable_order's order: the sort keys present, as text, ties in written order."""
+    # read() gives NULL back as None, which stable_order sorts as "None"
+    keys = [f"COALESCE({_quote(k)}, 'None')" for k in (sort_keys or []) if k in columns]
+    return ", ".join(keys + ["rowid"])
+
+
+class Store:
+    """
+    SQLite file holding the latest snapshot of every dataset, one table
+    per output (all TEXT, in the frame's column order, rows in the order
+    they're exported). The pipeline writes a run's datasets here in one
+    transaction and the CSVs in the output dir are exported from it.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS datasets (
+                name TEXT PRIMARY KEY,
+                columns TEXT NOT NULL,
+                rows INTEGER NOT NULL,
+                sha256 TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+            """
+        )
+        self._db.commit()
+
+    def datasets(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            recs = self._db.execute("SELECT name, columns, rows, sha256, updated_at FROM datasets").fetchall()
+        return {
+            name: {"columns": json.loads(columns), "rows": rows, "sha256": sha, "updated_at": updated}
+            for name, columns, rows, sha, updated in recs
+        }
+
+    def __contains__(self, name: str) -> bool:
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM datasets WHERE name = ?", (name,)).fetchone() is not None
+
+    def _stage(self, columns: List[str], data: Union[pd.DataFrame, SpooledFrame]) -> int:
+        """Copy `data` into the temp table staging, a chunk at a time. Returns the rows copied."""
+        self._db.execute("DROP TABLE IF EXISTS temp.staging")
+        self._db.execute(f"CREATE TEMP TABLE staging ({', '.join(_quote(c) + ' TEXT' for c in columns)})")
+        insert = f"INSERT INTO temp.staging VALUES ({', '.join('?' * len(columns))})"
+        rows = 0
+        for chunk in iter_chunks(data):
+            self._db.executemany(insert, _as_text(chunk).itertuples(index=False, name=None))
+            rows += len(chunk)
+        return rows
+
+    def _replace(
+        self,
+        name: str,
+        data: Union[pd.DataFrame, SpooledFrame],
+        now: str,
+        sort_keys: Optional[List[str]],
+    ) -> bool:
+        columns = [str(c) for c in data.columns]
+        h = hashlib.sha256(json.dumps(columns).encode("utf-8"))
+        if columns:
+            # staged first: the digest is taken in export order, and the
+            # table is only replaced if it changed
+            rows = self._stage(columns, data)
+            order = _order_by(columns, sort_keys)
+            for row in self._db.execute(f"SELECT * FROM temp.staging ORDER BY {order}"):
+                h.update(json.dumps(row).encode("utf-8"))
+        else:
+            rows = len(data)
+            h.update(str(rows).encode("utf-8"))
+        sha = h.hexdigest()
+        rec = self._db.execute("SELECT columns, sha256 FROM datasets WHERE name = ?", (name,)).fetchone()
+        if rec is not None and rec[1] == sha:
+            self._db.execute("DROP TABLE IF EXISTS temp.staging")
+            return False
+
+        table = _quote(name)
+        if rec is None or json.loads(rec[0]) != columns:
+            self._db.execute(f"DROP TABLE IF EXISTS {table}")
+            if columns:
+                self._db.execute(f"CREATE TABLE {table} ({', '.join(_quote(c) + ' TEXT' for c in columns)})")
+                for c in INDEXED_COLUMNS:
+                    if c in columns:
+                        index = _quote(f"{name}__{c}")
+                        self._db.execute(f"CREATE INDEX {index} ON {table} ({_quote(c)})")
+        elif columns:
+            self._db.execute(f"DELETE FROM {table}")
+
+        if columns:
+            self._db.execute(f"INSERT INTO {table} SELECT * FROM temp.staging ORDER BY {order}")
+            self._db.execute("DROP TABLE temp.staging")
+        self._db.execute(
+            "INSERT OR REPLACE INTO datasets VALUES (?, ?, ?, ?, ?)",
+            (name, json.dumps(columns), rows, sha, now),
+        )
+        return True
+
+    def write(
+        self,
+        frames: Dict[str, Union[pd.DataFrame, SpooledFrame]],
+        sort_keys: Optional[Dict[str, List[str]]] = None,
+    ) -> List[str]:
+        """
+        Replace each dataset's rows with its frame's (a DataFrame, or a
+        SpooledFrame copied in a chunk at a time), stored in the order
+        `sort_keys` gives it, all in one transaction (a failed write leaves
+        the last run's data). Datasets whose content is unchanged aren't
+        touched. Returns the names rewritten.
+        """
+        now = datetime.now(timezone.utc).replace(microsecond=0).isoformat()
+        sort_keys = sort_keys or {}
+        with self._lock:
+            try:
+                written = [
+                    name for name, df in frames.items() if self._replace(name, df, now, sort_keys.get(name))
+                ]
+                self._db.commit()
+            except BaseException:
+                self._db.rollback()
+                raise
+        return written
+
+    def read(self, name: str, columns: Optional[Iterable[str]] = None) -> pd.DataFrame:
+        """A dataset as stored (NULL -> None), in the order it was written."""
+        info = self.datasets().get(name)
+        if info is None:
+            raise KeyError(name)
+        stored = info["columns"]
+        wanted = [c for c in (columns or stored) if c in stored]
+        if not wanted:
+            return pd.DataFrame(columns=list(columns or stored))
+        select = ", ".join(_quote(c) for c in wanted)
+        return self.query(f"SELECT {select} FROM {_quote(name)} ORDER BY rowid")
+
+    def frame(self, name: str) -> SpooledFrame:
+        """read() as a SpooledFrame, fetched off the cursor a chunk at a time."""
+        info = self.datasets().get(name)
+        if info is None:
+            raise KeyError(name)
+        columns = info["columns"]
+
+        def read() -> Iterator[pd.DataFrame]:
+            if not columns:
+                return
+            with self._lock:
+                cur = self._db.execute(f"SELECT * FROM {_quote(name)} ORDER BY rowid")
+            while True:
+                with self._lock:
+                    rows = cur.fetchmany(CHUNK_ROWS)
+                if not rows:
+                    return
+                yield pd.DataFrame(rows, columns=columns, dtype=object)
+
+        return SpooledFrame(columns, read, info["rows"])
+
+    def lookup(self, name: str, column: str, values: Iterable[str]) -> pd.DataFrame:
+        """Rows of a dataset whose `column` is one of `values` (at most CHUNK_ROWS), in written order."""
+        values = list(values)
+        marks = ", ".join("?" * len(values))
+        return self.query(
+            f"SELECT * FROM {_quote(name)} WHERE {_quote(column)} IN ({marks}) ORDER BY rowid", tuple(values)
+        )
+
+    def export_csv(self, name: str, f: IO[str], sort_keys: Optional[Iterable[str]] = None) -> int:
+        """
+        Write a dataset to `f` as CSV, a row at a time off the cursor,
+        ordered like outputs.stable_order orders the frame read() returns
+        (by the sort keys present, as text, ties in written order).
+        Returns the rows written.
+        """
+        info = self.datasets().get(name)
+        if info is None:
+            raise KeyError(name)
+        columns = info["columns"]
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow(columns)
+        if not columns:
+            return 0
+        order = _order_by(columns, sort_keys)
+        with self._lock:
+            writer.writerows(self._db.execute(f"SELECT * FROM {_quote(name)} ORDER BY {order}"))
+        return info["rows"]
+
+    def query(self, sql: str, params: Tuple[Any, ...] = ()) -> pd.DataFrame:
+        with self._lock:
+            cur = self._db.execute(sql, params)
+            names = [d[0] for d in cur.description or ()]
+            return pd.DataFrame(cur.fetchall(), columns=names, dtype=object)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+def open_store(output_dir: Path) -> Optional[Store]:
+    """Store in the output dir (or STORE_PATH), unless disabled with STORE=0."""
+    if os.getenv("STORE", "1") == "0":
+        return None
+    return Store(Path(os.getenv("STORE_PATH", str(Path(output_dir) / STORE_FILENAME))))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Query the scraper's SQLite data store.")
+    parser.add_argument("path", nargs="?", default=str(Path(os.getenv("OUTPUT_DIR", "data")) / STORE_FILENAME))
+    parser.add_argument("sql", nargs="?", help=f"SQL, or a named query: {', '.join(QUERIES)}")
+    parser.add_argument("--out", help="write the result to this CSV instead of printing it")
+    args = parser.parse_args(argv)
+
+    store = Store(Path(args.path))
+    try:
+        if not args.sql:
+            for name, info in sorted(store.datasets().items()):
+                print(f"{name:<32} {info['rows']:>8} rows   updated {info['updated_at']}")
+            return 0
+        df = store.query(QUERIES.get(args.sql, args.sql))
+    finally:
+        store.close()
+
+    if args.out:
+        df.to_csv(args.out, index=False)
+        print(f"Wrote {len(df)} rows to {args.out}")
+    else:
+        print(df.to_string(index=False))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
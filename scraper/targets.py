@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+from typing import Iterable, List, Optional
+from dataclasses import dataclass
+import os
+import re
+import urllib.parse
+
+
+DEFAULT_OCEAN = "emerald"
+DEFAULT_FLAG_ID = "10007105"
+
+OCEAN_COLUMN = "Ocean"
+FLAG_ID_COLUMN = "Flag ID"
+
+
+def ocean_base(ocean: str) -> str:
+    """
+    Site root for an ocean: YOWEB_BASE_<OCEAN>, else YOWEB_BASE (all
+    oceans, e.g. a local stub), else https://<ocean>.puzzlepirates.com.
+    """
+    ocean = ocean.strip().lower()
+    base = os.getenv(f"YOWEB_BASE_{ocean.upper()}") or os.getenv("YOWEB_BASE")
+    return (base or f"https://{ocean}.puzzlepirates.com").rstrip("/")
+
+
+def site_root(url: str) -> str:
+    """scheme://host of an http(s) URL; the default ocean for anything else (saved pages)."""
+    parsed = urllib.parse.urlsplit(url)
+    if parsed.scheme not in ("http", "https") or not parsed.netloc:
+        return ocean_base(DEFAULT_OCEAN)
+    return f"{parsed.scheme}://{parsed.netloc}"
+
+
+@dataclass(frozen=True)
+class FlagTarget:
+    """One flag to crawl: which ocean it's on and its flagid."""
+
+    ocean: str
+    flag_id: str
+
+    @property
+    def base(self) -> str:
+        return ocean_base(self.ocean)
+
+    @property
+    def flag_url(self) -> str:
+        return f"{self.base}/yoweb/flag/info.wm?flagid={self.flag_id}"
+
+    @property
+    def key(self) -> str:
+        return f"{self.ocean}:{self.flag_id}"
+
+
+def parse_target(spec: str) -> FlagTarget:
+    """'ocean:flagid' (or a bare flagid on the default ocean)."""
+    spec = spec.strip()
+    ocean, _, flag_id = spec.rpartition(":")
+    ocean = (ocean or DEFAULT_OCEAN).strip().lower()
+    flag_id = flag_id.strip()
+    if not re.fullmatch(r"[a-z]+", ocean) or not flag_id.isdigit():
+        raise ValueError(f"Bad flag target {spec!r} (expected ocean:flagid, e.g. emerald:10007105)")
+    return FlagTarget(ocean, flag_id)
+
+
+def load_targets(specs: Optional[Iterable[str]] = None) -> List[FlagTarget]:
+    """
+    Targets from `specs` (CLI), else FLAG_TARGETS ("emerald:10007105,
+    meridian:123"), else the flagid of FLAG_URL, else the default flag.
+    Duplicates are dropped, first occurrence wins.
+    """
+    specs = [s for s in (specs or []) if s.strip()]
+    if not specs:
+        specs = [s for s in re.split(r"[,\s]+", os.getenv("FLAG_TARGETS", "")) if s]
+    if not specs and os.getenv("FLAG_URL"):
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(os.environ["FLAG_URL"]).query)
+        specs = [query.get("flagid", [DEFAULT_FLAG_ID])[0]]
+    if not specs:
+        specs = [f"{DEFAULT_OCEAN}:{DEFAULT_FLAG_ID}"]
+
+    targets: List[FlagTarget] = []
+    for spec in specs:
+        target = parse_target(spec)
+        if target not in targets:
+            targets.append(target)
+    return targets